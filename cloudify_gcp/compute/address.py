@@ -31,6 +31,8 @@ class Address(GoogleCloudPlatform):
     In the API these only differ in that Address requires a
     region, while GlobalAddress does not accept one.
     """
+    RUNTIME_FIELDS = ('id,kind,name,selfLink,status,address,addressType,'
+                      'region,creationTimestamp')
 
     def __init__(self,
                  config,
@@ -65,13 +67,14 @@ class Address(GoogleCloudPlatform):
             if self.region:
                 args['region'] = self.region
             else:
-                args['region'] = self.ZONES[self.config['zone']]['region_name']
+                args['region'] = self.get_region(self.config['zone'])
         return args
 
     @check_response
-    def get(self):
+    def get(self, fields=None):
         return self._get_resource_type().get(
             address=self.name,
+            fields=fields,
             **self._common_kwargs()).execute()
 
     @utils.async_operation(get=True)
@@ -22,6 +22,9 @@ from cloudify_gcp.gcp import check_response
 
 
 class Disk(GoogleCloudPlatform):
+    RUNTIME_FIELDS = ('id,kind,name,selfLink,status,zone,sizeGb,type,'
+                      'sourceImage,users,labels,creationTimestamp')
+
     def __init__(self,
                  config,
                  logger,
@@ -58,11 +61,12 @@ class Disk(GoogleCloudPlatform):
         return body
 
     @check_response
-    def get(self):
+    def get(self, fields=None):
         return self.discovery.disks().get(
             project=self.project,
             zone=self.zone,
-            disk=self.name).execute()
+            disk=self.name,
+            fields=fields).execute()
 
     @check_response
     def list(self):
@@ -105,7 +109,7 @@ def create(image, name, size, boot, additional_settings, **kwargs):
         return
 
     utils.create(disk)
-    ctx.instance.runtime_properties.update(disk.get())
+    ctx.instance.runtime_properties.update(disk.get_runtime_properties())
     ctx.instance.runtime_properties[constants.DISK] = \
         disk.disk_to_insert_instance_dict(name)
     ctx.instance.runtime_properties[constants.RESOURCE_ID] = \
@@ -13,6 +13,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
+
 from cloudify import ctx
 from cloudify.decorators import operation
 
@@ -21,6 +23,61 @@ from .. import constants
 from cloudify_gcp.gcp import GoogleCloudPlatform
 from cloudify_gcp.gcp import check_response
 
+# Changing these needs a new rule, they are never patched
+IMMUTABLE_FIELDS = (constants.NAME, 'network')
+# List fields the live rule keeps when they are left out of a patch, they
+# are cleared explicitly when the body of the rule doesn't have them
+CLEARABLE_FIELDS = ('sourceRanges', 'sourceTags', 'targetTags',
+                    'sourceServiceAccounts', 'targetServiceAccounts',
+                    'destinationRanges')
+UPDATE_STATE = '_update'
+
+
+def _normalize(value):
+    """Make values equal regardless of list order and port types."""
+    if isinstance(value, dict):
+        return dict((key, _normalize(item)) for key, item in value.items())
+    if isinstance(value, list):
+        # The API returns ports as strings, blueprints often have numbers
+        items = [str(item) if type(item) is int else _normalize(item)
+                 for item in value]
+        return sorted(items, key=lambda item: json.dumps(item, sort_keys=True))
+    return value
+
+
+def _diff(desired, live):
+    diff = {}
+    for key, value in desired.items():
+        current = live.get(key)
+        if not value and not current:
+            # The API leaves out empty and default values
+            continue
+        if isinstance(value, dict) and isinstance(current, dict):
+            changed = _diff(value, current)
+            if changed:
+                diff[key] = changed
+        elif _normalize(value) != _normalize(current):
+            diff[key] = value
+    return diff
+
+
+def get_diff(desired, live):
+    """
+    Structural difference of a firewall rule body and the live rule.
+
+    :param desired: body of the rule, see FirewallRule.to_dict
+    :param live: the rule as returned by the API
+    :return: body of a patch request changing only the fields which differ,
+        nested objects only with their differing fields, CLEARABLE_FIELDS
+        missing from the body as empty lists, empty if the rule is up to
+        date
+    """
+    desired = dict(desired)
+    for key in CLEARABLE_FIELDS:
+        desired.setdefault(key, [])
+    return dict((key, value) for key, value in _diff(desired, live).items()
+                if key not in IMMUTABLE_FIELDS)
+
 
 class FirewallRule(GoogleCloudPlatform):
     def __init__(self,
@@ -80,9 +137,16 @@ class FirewallRule(GoogleCloudPlatform):
                 self.name,
                 self.network))
 
+        return self.create_request().execute()
+
+    def create_request(self):
+        """
+        Build the firewall rule insert request without executing it, so it
+        can be sent as a part of a batch.
+        """
         return self.discovery.firewalls().insert(
             project=self.project,
-            body=self.to_dict()).execute()
+            body=self.to_dict())
 
     @check_response
     def delete(self):
@@ -98,9 +162,16 @@ class FirewallRule(GoogleCloudPlatform):
                 self.name,
                 self.network))
 
+        return self.delete_request().execute()
+
+    def delete_request(self):
+        """
+        Build the firewall rule delete request without executing it, so it
+        can be sent as a part of a batch.
+        """
         return self.discovery.firewalls().delete(
             project=self.project,
-            firewall=self.name).execute()
+            firewall=self.name)
 
     @check_response
     def get(self):
@@ -130,20 +201,47 @@ class FirewallRule(GoogleCloudPlatform):
         return self.discovery.firewalls().update(
             project=self.project,
             firewall=self.name,
-            body=self.firewall).execute()
+            body=self.to_dict()).execute()
 
     @check_response
-    def list(self):
+    def patch(self, body):
+        """
+        Change only the fields of the GCP firewall rule present in body.
+        Global operation.
+
+        :param body: changed fields, see get_diff
+        :return: REST response with operation responsible for the firewall rule
+        patch process and its status
+        """
+        self.logger.info('Patch firewall rule {0}: {1}'.format(
+            self.name, ', '.join(sorted(body))))
+
+        return self.patch_request(body).execute()
+
+    def patch_request(self, body):
+        """
+        Build the firewall rule patch request without executing it, so it
+        can be sent as a part of a batch.
+        """
+        return self.discovery.firewalls().patch(
+            project=self.project,
+            firewall=self.name,
+            body=body)
+
+    def list(self, **kwargs):
         """
         List GCP firewall rules in all networks.
 
-        :return: REST response with list of firewall rules in a project
+        :param kwargs: filter, maxResults or fields, see
+            GoogleCloudPlatform.paginate
+        :return: generator of firewall rules in a project
         """
         self.logger.info(
             'List firewall rules in project {0}'.format(self.project))
 
-        return self.discovery.firewalls().list(
-            project=self.project).execute()
+        return self.paginate(self.discovery.firewalls(),
+                             project=self.project,
+                             **kwargs)
 
     def to_dict(self):
         self.body.update({
@@ -199,6 +297,39 @@ def create(name, allowed, sources, target_tags, additional_settings, **kwargs):
     utils.create(firewall)
 
 
+@operation(resumable=True)
+@utils.throw_cloudify_exceptions
+def update(allowed, sources, target_tags, additional_settings, **kwargs):
+    """
+    Patch the fields of the rule which differ from the inputs, the rule
+    keeps filtering traffic meanwhile.
+    """
+    props = ctx.instance.runtime_properties
+    firewall = FirewallRule(utils.get_gcp_config(),
+                            ctx.logger,
+                            network=utils.get_network(ctx),
+                            name=props[constants.RESOURCE_ID],
+                            allowed=allowed,
+                            sources=sources,
+                            tags=target_tags,
+                            additional_settings=additional_settings,
+                            )
+    diff = None
+    if not (props.get(UPDATE_STATE) or {}).get('_operation'):
+        diff = get_diff(firewall.to_dict(), firewall.get())
+        if not diff:
+            props.pop(UPDATE_STATE, None)
+            ctx.logger.info(
+                'Firewall rule {0} is up to date'.format(firewall.name))
+            return
+        props[UPDATE_STATE] = {}
+
+    utils.run_phases(UPDATE_STATE, [
+        ('patch of firewall rule {0}'.format(firewall.name),
+         lambda: firewall.patch_request(diff)),
+    ])
+
+
 @operation(resumable=True)
 @utils.retry_on_failure('Retrying deleting firewall rule')
 @utils.throw_cloudify_exceptions
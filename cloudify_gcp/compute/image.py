@@ -80,17 +80,16 @@ class Image(GoogleCloudPlatform):
         return self.discovery.images().delete(project=self.project,
                                               image=self.name).execute()
 
-    def list(self):
-        image_list = self.discovery.images().list(
-                project=self.project).execute()
-        return image_list['items']
+    def list(self, **kwargs):
+        return self.paginate(self.discovery.images(),
+                             project=self.project,
+                             **kwargs)
 
-    def list_objects(self):
+    def list_objects(self, **kwargs):
         storage = self.create_discovery(discovery=constants.STORAGE_DISCOVERY,
                                         scope=constants.STORAGE_SCOPE_RW,
                                         api_version=constants.API_V1)
-        response = storage.objects().list(bucket=self.project).execute()
-        return response.get('items')
+        return self.paginate(storage.objects(), bucket=self.project, **kwargs)
 
     def to_dict(self):
         self.body.update({
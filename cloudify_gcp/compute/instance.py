@@ -14,21 +14,34 @@
 # limitations under the License.
 
 from os.path import basename
+from functools import partial
 import re
 
 from cloudify import ctx
 from cloudify.decorators import operation
 from cloudify.exceptions import NonRecoverableError
+from cloudify_common_sdk.utils import with_rest_client
+from googleapiclient.errors import HttpError
+
 from .. import _compat
 from .. import utils
 from .. import constants
+from .. import location_catalog
+from .. import operation_stats
 from .keypair import KeyPair
 from ..gcp import (
         GCPError,
+        BatchRequest,
         check_response,
         GoogleCloudPlatform,
+        is_missing_resource_error,
         )
 
+# Runtime property with the progress of a resize
+RESIZE_STATE = '_resize'
+# State of node instances running create, which is mapped to the configure
+# lifecycle operation
+CREATING_STATE = 'configuring'
 PS_OPEN = '<powershell>'
 PS_CLOSE = '</powershell>'
 POWERSHELL_SCRIPTS = ['sysprep-specialize-script-ps1',
@@ -39,6 +52,9 @@ class Instance(GoogleCloudPlatform):
     ACCESS_CONFIG = 'External NAT'
     ACCESS_CONFIG_TYPE = 'ONE_TO_ONE_NAT'
     NETWORK_INTERFACE = 'nic0'
+    RUNTIME_FIELDS = ('id,kind,name,selfLink,status,zone,machineType,'
+                      'networkInterfaces,disks,tags,labels,'
+                      'creationTimestamp')
     STANDARD_MACHINE_TYPE = 'n1-standard-1'
     DEFAULT_SCOPES = ['https://www.googleapis.com/auth/devstorage.read_write',
                       'https://www.googleapis.com/auth/logging.write']
@@ -103,13 +119,21 @@ class Instance(GoogleCloudPlatform):
         set machine type process and its status
         """
         self.logger.info('Set machine type instance {0}'.format(self.name))
+        return self.set_machine_type_request(
+            name, zone, machine_type).execute()
+
+    def set_machine_type_request(self, name, zone, machine_type):
+        """
+        Build the set machine type request without executing it, so the
+        caller decides how to wait for the operation.
+        """
         full_machine_type = "{0}/machineTypes/{1}".format(
             zone, machine_type)
         return self.discovery.instances().setMachineType(
             project=self.project,
             zone=basename(zone),
             instance=name,
-            body={'machineType': full_machine_type}).execute()
+            body={'machineType': full_machine_type})
 
     @utils.sync_operation
     @check_response
@@ -122,10 +146,17 @@ class Instance(GoogleCloudPlatform):
         stop process and its status
         """
         self.logger.info('Stop instance {0}'.format(self.name))
+        return self.stop_request().execute()
+
+    def stop_request(self):
+        """
+        Build the stop request without executing it, so the caller decides
+        how to wait for the operation.
+        """
         return self.discovery.instances().stop(
             project=self.project,
             zone=basename(self.zone),
-            instance=self.name).execute()
+            instance=self.name)
 
     @utils.sync_operation
     @check_response
@@ -138,10 +169,17 @@ class Instance(GoogleCloudPlatform):
         Start process and its status
         """
         self.logger.info('Start instance {0}'.format(self.name))
+        return self.start_request().execute()
+
+    def start_request(self):
+        """
+        Build the start request without executing it, so the caller decides
+        how to wait for the operation.
+        """
         return self.discovery.instances().start(
             project=self.project,
             zone=basename(self.zone),
-            instance=self.name).execute()
+            instance=self.name)
 
     @utils.async_operation(get=True)
     @check_response
@@ -167,6 +205,39 @@ class Instance(GoogleCloudPlatform):
             zone=basename(self.zone),
             body=self.to_dict()).execute()
 
+    @utils.async_operation(get=True)
+    @check_response
+    def bulk_insert(self, names):
+        """
+        Create GCP VM instances named `names` with the parameters of this
+        instance in a single call, tracked by a single operation.
+        Zone operation.
+
+        :param names: names of the instances, including this one
+        :return: REST response with operation responsible for the instances
+        creation process and its status
+        """
+        if not self.image:
+            raise NonRecoverableError("A disk image ID must be provided")
+
+        properties = self.to_dict()
+        properties.pop(constants.NAME)
+        properties['machineType'] = self.machine_type
+        # The name tag of each instance can't be set per instance
+        properties['tags']['items'] = [
+            tag for tag in properties['tags']['items'] if tag != self.name]
+
+        return self.discovery.instances().bulkInsert(
+            project=self.project,
+            zone=basename(self.zone),
+            body={
+                'count': len(names),
+                'minCount': len(names),
+                'perInstanceProperties': dict(
+                    (name, {}) for name in names),
+                'instanceProperties': properties,
+            }).execute()
+
     @utils.async_operation()
     @check_response
     def delete(self):
@@ -232,19 +303,30 @@ class Instance(GoogleCloudPlatform):
             body={'items': self.tags, 'fingerprint': fingerprint}).execute()
 
     @check_response
-    def get(self):
+    def get(self, fields=None):
         """
         Get GCP instance details.
 
+        :param fields: partial response mask, whole instance if None
         :return: REST response with operation responsible for the instance
         details retrieval
         """
         self.logger.info('Get instance {0} details'.format(self.name))
 
+        return self.get_request(fields).execute()
+
+    def get_request(self, fields=None):
+        """
+        Build the instance get request without executing it, so it can be
+        sent as a part of a batch.
+
+        :param fields: partial response mask, whole instance if None
+        """
         return self.discovery.instances().get(
             instance=self.name,
             project=self.project,
-            zone=basename(self.zone)).execute()
+            zone=basename(self.zone),
+            fields=fields)
 
     @utils.sync_operation
     @check_response
@@ -324,19 +406,21 @@ class Instance(GoogleCloudPlatform):
             instance=self.name,
             deviceName=disk_name).execute()
 
-    @check_response
-    def list(self):
+    def list(self, **kwargs):
         """
         List GCP instances.
         Zone operation.
 
-        :return: REST response with a list of instances and its details
+        :param kwargs: filter, maxResults or fields, see
+            GoogleCloudPlatform.paginate
+        :return: generator of instances and their details
         """
         self.logger.info('List instances in project {0}'.format(self.project))
 
-        return self.discovery.instances().list(
-            project=self.project,
-            zone=basename(self.zone)).execute()
+        return self.paginate(self.discovery.instances(),
+                             project=self.project,
+                             zone=basename(self.zone),
+                             **kwargs)
 
     def to_dict(self):
         def add_key_value_to_metadata(key, value, body):
@@ -412,15 +496,27 @@ def create(instance_type,
            zone=None,
            can_ip_forward=False,
            additional_settings=None,
+           bulk_create=False,
            **kwargs):
     if utils.resource_created(ctx, constants.RESOURCE_ID):
         return
+    if bulk_create and name:
+        raise NonRecoverableError(
+            'bulk_create needs the instance names to be generated, '
+            'name must be empty')
 
     props = ctx.instance.runtime_properties
     gcp_config = utils.get_gcp_config()
 
     script = _get_script(startup_script)
     ctx.logger.info('The script is {0}'.format(str(startup_script)))
+    if bulk_create and ctx.agent.init_script():
+        # The agent install script belongs to one node instance, while the
+        # instances created in bulk share their metadata
+        ctx.logger.warn(
+            'The agent is installed by the startup script, the instance '
+            'is created on its own instead of in bulk')
+        bulk_create = False
 
     ssh_keys = get_ssh_keys()
 
@@ -450,6 +546,9 @@ def create(instance_type,
                 'Only one disk per Instance may be a boot disk. '
                 'Disks: {}'.format(boot_disks)
                 )
+    if bulk_create and disks:
+        raise NonRecoverableError(
+                'Instances with connected disks can\'t be created in bulk')
 
     instance_name = utils.get_final_resource_name(name)
     instance = Instance(
@@ -471,13 +570,99 @@ def create(instance_type,
             additional_settings=additional_settings,
             )
 
-    ctx.instance.runtime_properties[constants.RESOURCE_ID] = instance.name
     ctx.instance.runtime_properties[constants.NAME] = instance.name
     ctx.instance.runtime_properties[constants.MACHINE_TYPE] = \
         instance.machine_type
+    if bulk_create:
+        # resource_id is set once the VM exists, see get_pending_instances
+        return create_in_bulk(instance)
+    ctx.instance.runtime_properties[constants.RESOURCE_ID] = instance.name
     utils.create(instance)
 
 
+def is_waiting_for_vm(node_instance):
+    """
+    Check if the node instance runs create and its VM wasn't created yet.
+    """
+    if node_instance.state != CREATING_STATE:
+        return False
+    props = node_instance.runtime_properties or {}
+    return not props.get(constants.RESOURCE_ID)
+
+
+@with_rest_client
+def get_pending_instances(rest_client):
+    """
+    Get the instances of the current node which are running create and
+    don't have a VM yet, in the same order for each of them.
+
+    :return: list of (GCP name, runtime properties) of the node instances
+    """
+    node_instances = rest_client.node_instances.list(
+        deployment_id=ctx.deployment.id,
+        node_id=ctx.node.id,
+        _include=['id', 'state', 'runtime_properties'])
+    pending = dict((node_instance.id, node_instance.runtime_properties)
+                   for node_instance in node_instances
+                   if is_waiting_for_vm(node_instance))
+    pending[ctx.instance.id] = ctx.instance.runtime_properties
+    return [(utils.get_gcp_resource_name(i), pending[i])
+            for i in sorted(pending)]
+
+
+def create_in_bulk(instance):
+    """
+    Create the instance together with the other instances of the node being
+    created. The first of them sends a bulkInsert for all, the others wait
+    for their VM to appear.
+    """
+    props = ctx.instance.runtime_properties
+    if props.get('_operation'):
+        # bulkInsert already sent by this node instance
+        if utils.handle_operation(instance, get=True):
+            props[constants.RESOURCE_ID] = instance.name
+        return
+
+    try:
+        props.update(instance.get_runtime_properties())
+        props[constants.RESOURCE_ID] = instance.name
+        ctx.logger.info('Instance {0} was created in bulk'.format(
+            instance.name))
+        return
+    except HttpError as e:
+        if not is_missing_resource_error(e):
+            raise
+
+    pending = get_pending_instances()
+    leader, leader_props = pending[0]
+    if leader != instance.name:
+        return ctx.operation.retry(
+            'Waiting for instance {0} to be created in bulk by {1}'.format(
+                instance.name, leader),
+            operation_stats.get_retry_delay(
+                (leader_props or {}).get('_operation')))
+    names = [name for name, _ in pending]
+    # A VM may already exist when its node instance is being reinstalled
+    # or heals, or when an earlier bulkInsert was only partially tracked
+    existing = get_instances(
+        [get_bulk_instance(instance, name) for name in names[1:]],
+        fields='name')
+    names = [name for name in names if name not in existing]
+    ctx.logger.info('Creating instances {0} in bulk'.format(names))
+    instance.bulk_insert(names)
+
+
+def get_bulk_instance(instance, name):
+    """
+    Create the Instance object of another instance created in bulk with
+    `instance`, sharing its discovery so their requests can be batched.
+    """
+    other = Instance(instance.config, ctx.logger, name=name,
+                     zone=instance.zone)
+    other.discovery = instance.discovery
+    return other
+
+
 @operation(resumable=True)
 @utils.throw_cloudify_exceptions
 def start(name, **kwargs):
@@ -560,11 +745,35 @@ def resize(name, zone, machine_type, **kwargs):
                             name=name,
                             zone=zone,
                             )
-        instance.stop()
-        instance.set_machine_type(name, zone, machine_type)
-        instance.start()
-        ctx.instance.runtime_properties[constants.MACHINE_TYPE] = machine_type
-        instance.machine_type = machine_type
+        state = props.get(RESIZE_STATE)
+        if state and state.get('machine_type') != machine_type:
+            # Resizing to another type than the interrupted resize, which
+            # is safe to run again from the beginning
+            props.pop(RESIZE_STATE)
+            state = None
+        if not state:
+            # Don't stop the instance for a type the zone doesn't offer.
+            # Custom types (custom-4-8192, n2-custom-...) are never listed.
+            machine_types = None
+            if 'custom-' not in basename(machine_type):
+                machine_types = location_catalog.get_catalog(
+                    instance.project).machine_types(
+                        instance.discovery, basename(zone))
+            if machine_types and basename(machine_type) not in machine_types:
+                raise NonRecoverableError(
+                    'Machine type {0} is not available in zone {1}'.format(
+                        machine_type, zone))
+            props[RESIZE_STATE] = {'machine_type': machine_type}
+
+        finished = utils.run_phases(RESIZE_STATE, [
+            ('stop', instance.stop_request),
+            ('set machine type', partial(instance.set_machine_type_request,
+                                         name, zone, machine_type)),
+            ('start', instance.start_request),
+        ])
+        if finished:
+            props[constants.MACHINE_TYPE] = machine_type
+            instance.machine_type = machine_type
 
 
 @operation(resumable=True)
@@ -696,16 +905,42 @@ def contained_in(**kwargs):
     ctx.logger.info('Copied ssh keys to the node')
 
 
+def get_instances(instances, fields=Instance.RUNTIME_FIELDS):
+    """
+    Get details of several instances in one batched round trip.
+
+    :param instances: list of Instance objects
+    :param fields: partial response mask, whole instances if None
+    :return: dictionary of instance name: instance details, without the
+    instances which don't exist
+    """
+    if not instances:
+        return {}
+    batch = BatchRequest(instances[0].discovery, instances[0].logger)
+    for instance in instances:
+        batch.add(instance.name, instance.get_request(fields))
+    responses = batch.execute()
+    for instance in instances:
+        error = batch.errors.get(instance.name)
+        if error is not None and not is_missing_resource_error(error):
+            raise error
+    return responses
+
+
 def set_ip(instance, relationship=False):
+    """
+    Store the IP addresses and details of the instance in runtime
+    properties.
+
+    :param instance: Instance object
+    :param relationship: store them in the source node instance
+    """
     if relationship:
         props = ctx.source.instance.runtime_properties
     else:
         props = ctx.instance.runtime_properties
 
-    instances = instance.list()
-    item = utils.get_item_from_gcp_response(constants.NAME,
-                                            instance.name,
-                                            instances)
+    item = instance.get(fields=instance.RUNTIME_FIELDS)
 
     try:
         props['ip'] = item['networkInterfaces'][0]['networkIP']
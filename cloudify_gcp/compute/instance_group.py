@@ -22,6 +22,9 @@ from cloudify_gcp.gcp import check_response
 
 
 class InstanceGroup(GoogleCloudPlatform):
+    RUNTIME_FIELDS = ('id,kind,name,selfLink,zone,network,subnetwork,'
+                      'namedPorts,size,creationTimestamp')
+
     def __init__(self,
                  config,
                  logger,
@@ -51,24 +54,26 @@ class InstanceGroup(GoogleCloudPlatform):
         return self.self_url
 
     @check_response
-    def get(self):
+    def get(self, fields=None):
         return self.discovery.instanceGroups().get(
             project=self.project,
             zone=self.zone,
-            instanceGroup=self.name).execute()
-
-    @check_response
-    def list(self):
-        return self.discovery.instanceGroups().list(
-            project=self.project,
-            zone=self.zone).execute()
-
-    @check_response
-    def list_instances(self):
-        return self.discovery.instanceGroups().listInstances(
-            project=self.project,
-            zone=self.zone,
-            instanceGroup=self.name).execute()
+            instanceGroup=self.name,
+            fields=fields).execute()
+
+    def list(self, **kwargs):
+        return self.paginate(self.discovery.instanceGroups(),
+                             project=self.project,
+                             zone=self.zone,
+                             **kwargs)
+
+    def list_instances(self, **kwargs):
+        return self.paginate(self.discovery.instanceGroups(),
+                             method='listInstances',
+                             project=self.project,
+                             zone=self.zone,
+                             instanceGroup=self.name,
+                             **kwargs)
 
     @utils.async_operation(get=True)
     @check_response
@@ -154,7 +159,7 @@ def add_to_instance_group(instance_group_name, instance_url, **kwargs):
                                    ctx.logger,
                                    name=instance_group_name)
 
-    for instance in instance_group.list_instances().get('items', []):
+    for instance in instance_group.list_instances():
         if instance.get('instance') == instance_url:
             ctx.logger.info('Instance has already added.')
             return
@@ -174,6 +179,6 @@ def remove_from_instance_group(instance_group_name, instance_url, **kwargs):
                                    ctx.logger,
                                    name=instance_group_name)
 
-    for instance in instance_group.list_instances().get('items', []):
+    for instance in instance_group.list_instances():
         if instance.get('instance') == instance_url:
             instance_group.remove_instance(instance_url)
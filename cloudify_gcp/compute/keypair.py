@@ -14,20 +14,34 @@
 # limitations under the License.
 
 import os
-
-from Crypto.PublicKey import RSA
+import json
+import time
+import binascii
 
 from cloudify import ctx
 from cloudify.decorators import operation
 from cloudify.exceptions import NonRecoverableError
+from googleapiclient.errors import HttpError
 
 from .. import constants
 from .. import utils
+from .. import key_pool
 from ..gcp import (
         GCPError,
-        check_response,
         GoogleCloudPlatform,
         )
+from ..local_cache import (
+    file_lock,
+    read_json,
+    write_file_atomic,
+    is_process_running,
+)
+
+# Status of setCommonInstanceMetadata calls with an outdated fingerprint
+FINGERPRINT_CONFLICT = 412
+CHANGE_SUFFIX = '.change'
+RESULT_SUFFIX = '.result'
+LOCK_FILE = 'lock'
 
 
 class KeyPair(GoogleCloudPlatform):
@@ -39,7 +53,8 @@ class KeyPair(GoogleCloudPlatform):
                  logger,
                  user,
                  private_key_path,
-                 public_key_path):
+                 public_key_path,
+                 key_type=key_pool.RSA_KEY):
         """
         Create KeyPair object
 
@@ -47,6 +62,7 @@ class KeyPair(GoogleCloudPlatform):
         :param logger: logger object
         :param user: name of the user to authenticate
         :param private_key_path: path where private key is stored
+        :param key_type: type of created keys, rsa or ecdsa
         """
         super(KeyPair, self).__init__(config, logger, None)
         self.user = user
@@ -54,15 +70,17 @@ class KeyPair(GoogleCloudPlatform):
         self.public_key_path = public_key_path
         self.public_key = ''
         self.private_key = ''
+        self.key_type = key_type
 
     def create(self):
         """
-        Create keypair: private and public key.
+        Create keypair: private and public key. The key is taken from the
+        host's key pool, see key_pool.
 
         """
-        key = RSA.generate(2048)
-        self.private_key = key.exportKey('PEM')
-        self.public_key = key.exportKey('OpenSSH')
+        key = key_pool.take_key(self.key_type, self.logger)
+        self.private_key, self.public_key = key_pool.export_keys(
+            self.key_type, key)
 
     def save_private_key(self):
         """
@@ -75,36 +93,90 @@ class KeyPair(GoogleCloudPlatform):
             os.chmod(self.private_key_path, 0o600)
             content_file.write(self.private_key)
 
-    @check_response
+    def get_project_ssh_key(self):
+        """The key string of the project's sshKeys metadata."""
+        return utils.get_key_user_string(self.user, self.public_key)
+
     def add_project_ssh_key(self):
         """
         Update project SSH private key. Add new key to project's
-        common instance metadata.
+        common instance metadata, together with the keys added and removed
+        by the other operations running on this host, see ProjectSshKeys.
 
         :return: REST response with operation responsible for the sshKeys
-        addition to project metadata process and its status
-        """
-        common_instance_metadata = self.get_common_instance_metadata()
-        if common_instance_metadata.get('items') is None:
-            item = [{self.KEY_NAME: self.KEY_VALUE,
-                    'value': utils.get_key_user_string(self.user,
-                                                       self.public_key)}]
-            common_instance_metadata['items'] = item
-        else:
-            item = utils.get_item_from_gcp_response(
-                self.KEY_NAME,
-                self.KEY_VALUE,
-                common_instance_metadata)
-            key = utils.get_key_user_string(self.user, self.public_key)
-            if key not in item['value']:
-                item['value'] = '{0}\n{1}'.format(item['value'], key)
+        addition to project metadata process and its status, None if the
+        key was already there
+        """
         self.logger.info(
             'Add sshKey {0} to project {1} metadata'.format(
                 self.public_key,
                 self.project))
-        return self.discovery.projects().setCommonInstanceMetadata(
-            project=self.project,
-            body=common_instance_metadata).execute()
+        return project_ssh_keys.submit(
+            self, add=[self.get_project_ssh_key()])
+
+    def remove_project_ssh_key(self, key):
+        """
+        Remove the key from project's common instance metadata, see
+        add_project_ssh_key.
+
+        :param key: key string added by add_project_ssh_key
+        :return: REST response with operation responsible for the sshKeys
+        removal, None if the key wasn't there
+        """
+        self.logger.info(
+            'Remove sshKey {0} from project {1} metadata'.format(
+                key, self.project))
+        return project_ssh_keys.submit(self, remove=[key])
+
+    def set_project_ssh_keys(self, add, remove=()):
+        """
+        Apply key additions and removals to the project's sshKeys metadata
+        in one setCommonInstanceMetadata call. The metadata is read again
+        and the changes reapplied when another client changed it meanwhile.
+
+        :param add: key strings to be added, in order
+        :param remove: key strings to be removed
+        :return: REST response of the update, None if nothing changed
+        """
+        remove = set(remove)
+        for _ in range(constants.METADATA_UPDATE_ATTEMPTS):
+            metadata = self.get_common_instance_metadata()
+            items = metadata.setdefault('items', [])
+            item = utils.get_item_from_gcp_response(
+                self.KEY_NAME, self.KEY_VALUE, metadata)
+            if item is None:
+                item = {self.KEY_NAME: self.KEY_VALUE, 'value': ''}
+                items.append(item)
+
+            keys = [key for key in item['value'].splitlines() if key]
+            existing = set(keys)
+            new_keys = [key for key in keys if key not in remove]
+            for key in add:
+                if key not in existing and key not in remove:
+                    new_keys.append(key)
+                    existing.add(key)
+            if new_keys == keys:
+                return None
+            item['value'] = '\n'.join(new_keys)
+
+            try:
+                response = self.discovery.projects(
+                    ).setCommonInstanceMetadata(
+                        project=self.project,
+                        body=metadata).execute()
+            except HttpError as e:
+                if e.resp.status != FINGERPRINT_CONFLICT:
+                    raise
+                self.logger.debug(
+                    'Project {0} metadata changed meanwhile, retrying'.format(
+                        self.project))
+                continue
+            if 'error' in response:
+                raise GCPError(response['error'])
+            return response
+        raise GCPError(
+            'Project {0} metadata kept changing, sshKeys not updated'.format(
+                self.project))
 
     def remove_private_key(self):
         """
@@ -118,18 +190,187 @@ class KeyPair(GoogleCloudPlatform):
             raise GCPError(str(e))
 
 
+class ProjectSshKeys(object):
+    """
+    Merge the sshKeys metadata changes of the same project made by the
+    operations running on this host, each in its own process, into one
+    setCommonInstanceMetadata call.
+
+    A change is spooled as a file in the directory of its project. Whichever
+    operation gets the lock of the project first applies all the spooled
+    changes at once and stores the result of every change next to it. The
+    others find their result once they get the lock.
+
+    Changes spooled by a process which isn't running anymore, or spooled
+    too long ago, are failed instead of being applied.
+    """
+
+    def __init__(self, path=None):
+        self._path = path
+
+    @property
+    def path(self):
+        return self._path or constants.SSH_KEYS_SPOOL_PATH
+
+    def project_path(self, project):
+        return os.path.join(self.path, project)
+
+    def submit(self, keypair, add=(), remove=()):
+        """
+        :param keypair: KeyPair object of the project
+        :param add: key strings to be added
+        :param remove: key strings to be removed
+        :return: REST response of the update containing the change, None if
+        it didn't change the metadata
+        """
+        return self.wait(keypair, self.spool(keypair.project, add, remove))
+
+    def spool(self, project, add=(), remove=()):
+        """
+        :return: name of the spooled change
+        """
+        name = '{0:.6f}-{1}-{2}'.format(
+            time.time(), os.getpid(),
+            binascii.hexlify(os.urandom(4)).decode('ascii'))
+        write_file_atomic(
+            os.path.join(self.project_path(project), name + CHANGE_SUFFIX),
+            json.dumps({'owner': os.getpid(),
+                        'time': time.time(),
+                        'add': list(add),
+                        'remove': list(remove)}))
+        return name
+
+    def wait(self, keypair, name):
+        """
+        Wait for the result of the spooled change, applying the spooled
+        changes while it is pending.
+
+        :return: REST response of the update containing the change
+        """
+        directory = self.project_path(keypair.project)
+        change_path = os.path.join(directory, name + CHANGE_SUFFIX)
+        result_path = os.path.join(directory, name + RESULT_SUFFIX)
+        with file_lock(os.path.join(directory, LOCK_FILE)):
+            result = read_json(result_path)
+            if result is None:
+                if not os.path.exists(change_path):
+                    raise GCPError(
+                        'sshKeys change {0} of project {1} was lost'.format(
+                            name, keypair.project))
+                self.write(keypair, directory)
+                result = read_json(result_path)
+            os.unlink(result_path)
+        if 'error' in result:
+            raise GCPError(result['error'])
+        return result['response']
+
+    def write(self, keypair, directory):
+        """Apply all the spooled changes in one metadata update."""
+        names = sorted(
+            filename[:-len(CHANGE_SUFFIX)]
+            for filename in os.listdir(directory)
+            if filename.endswith(CHANGE_SUFFIX))
+        changes = []
+        for name in names:
+            change = read_json(os.path.join(directory, name + CHANGE_SUFFIX))
+            if change is None:
+                continue
+            error = self.get_stale_error(change)
+            if error:
+                keypair.logger.warn(
+                    'Not applying sshKeys change {0}: {1}'.format(
+                        name, error))
+                self.write_result(directory, name, {'error': error})
+                continue
+            changes.append((name, change))
+
+        if changes:
+            result = self.apply(keypair, [change for _, change in changes])
+            for name, _ in changes:
+                self.write_result(directory, name, result)
+        self.remove_expired(directory)
+
+    @staticmethod
+    def apply(keypair, changes):
+        """
+        :return: result of the merged changes, with the response or error
+        """
+        # Later changes of the same key win
+        add, remove = [], set()
+        for change in changes:
+            for key in change['remove']:
+                remove.add(key)
+                if key in add:
+                    add.remove(key)
+            for key in change['add']:
+                remove.discard(key)
+                if key not in add:
+                    add.append(key)
+        if len(changes) > 1:
+            keypair.logger.info(
+                'Applying {0} sshKeys changes in one metadata update'.format(
+                    len(changes)))
+        try:
+            return {'response': keypair.set_project_ssh_keys(add, remove)}
+        except Exception as e:
+            return {'error': str(e)}
+
+    @staticmethod
+    def write_result(directory, name, result):
+        """Store the result of the change in place of the change."""
+        write_file_atomic(
+            os.path.join(directory, name + RESULT_SUFFIX),
+            json.dumps(result))
+        os.unlink(os.path.join(directory, name + CHANGE_SUFFIX))
+
+    @staticmethod
+    def get_stale_error(change):
+        """
+        :return: why the spooled change mustn't be applied anymore, None if
+        it can be applied
+        """
+        owner = change.get('owner')
+        if not owner or not is_process_running(owner):
+            return 'the operation which requested it is gone'
+        if time.time() - change.get('time', 0) > \
+                constants.SSH_KEYS_SPOOL_EXPIRY:
+            return 'requested more than {0} seconds ago'.format(
+                constants.SSH_KEYS_SPOOL_EXPIRY)
+        return None
+
+    @staticmethod
+    def remove_expired(directory):
+        """Remove results of operations which didn't wait for them."""
+        now = time.time()
+        for filename in os.listdir(directory):
+            path = os.path.join(directory, filename)
+            if filename.endswith(RESULT_SUFFIX) and \
+                    now - os.path.getmtime(path) > \
+                    constants.SSH_KEYS_RESULT_EXPIRY:
+                os.unlink(path)
+
+
+project_ssh_keys = ProjectSshKeys()
+
+
 @operation(resumable=True)
 @utils.throw_cloudify_exceptions
 def create(user,
            private_key_path,
            public_key_path,
+           key_type=key_pool.RSA_KEY,
+           project_ssh_key=False,
            **kwargs):
+    if key_type not in key_pool.KEY_TYPES:
+        raise NonRecoverableError(
+            'key_type must be one of {0}'.format(key_pool.KEY_TYPES))
     gcp_config = utils.get_gcp_config()
     keypair = KeyPair(gcp_config,
                       ctx.logger,
                       user,
                       private_key_path,
-                      public_key_path)
+                      public_key_path,
+                      key_type)
     create_keypair(keypair)
     ctx.instance.runtime_properties[constants.USER] = user
     ctx.instance.runtime_properties[constants.PRIVATE_KEY] = \
@@ -140,6 +381,10 @@ def create(user,
             raise NonRecoverableError(
                     'empty user string not allowed for newly created key')
         keypair.save_private_key()
+    if project_ssh_key:
+        keypair.add_project_ssh_key()
+        ctx.instance.runtime_properties[constants.PROJECT_SSH_KEY] = \
+            keypair.get_project_ssh_key()
 
 
 def create_keypair(keypair):
@@ -164,6 +409,11 @@ def delete(user, private_key_path, **kwargs):
                       private_key_path,
                       None)
     keypair.public_key = ctx.instance.runtime_properties[constants.PUBLIC_KEY]
+    project_key = ctx.instance.runtime_properties.get(
+        constants.PROJECT_SSH_KEY)
+    if project_key:
+        keypair.remove_project_ssh_key(project_key)
+        ctx.instance.runtime_properties.pop(constants.PROJECT_SSH_KEY)
     ctx.instance.runtime_properties.pop(constants.PRIVATE_KEY, None)
     ctx.instance.runtime_properties.pop(constants.PUBLIC_KEY, None)
     ctx.instance.runtime_properties.pop(constants.RESOURCE_ID, None)
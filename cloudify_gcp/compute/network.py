@@ -25,6 +25,9 @@ from ..gcp import GoogleCloudPlatform
 
 
 class Network(GoogleCloudPlatform):
+    RUNTIME_FIELDS = ('id,kind,name,selfLink,autoCreateSubnetworks,'
+                      'subnetworks,routingConfig,creationTimestamp')
+
     def __init__(self,
                  config,
                  logger,
@@ -80,28 +83,32 @@ class Network(GoogleCloudPlatform):
             network=self.name).execute()
 
     @check_response
-    def get(self):
+    def get(self, fields=None):
         """
         Get GCP network details.
 
+        :param fields: partial response mask, whole network if None
         :return: REST response with operation responsible for the network
         details retrieval
         """
         self.logger.info('Get network {0} details'.format(self.name))
         return self.discovery.networks().get(
             project=self.project,
-            network=self.name).execute()
+            network=self.name,
+            fields=fields).execute()
 
-    @check_response
-    def list(self):
+    def list(self, **kwargs):
         """
         List networks.
 
-        :return: REST response with list of networks in a project
+        :param kwargs: filter, maxResults or fields, see
+            GoogleCloudPlatform.paginate
+        :return: generator of networks in a project
         """
         self.logger.info('List networks in project {0}'.format(self.project))
-        return self.discovery.networks().list(
-            project=self.project).execute()
+        return self.paginate(self.discovery.networks(),
+                             project=self.project,
+                             **kwargs)
 
     def to_dict(self):
         self.body.update({
@@ -14,6 +14,7 @@
 # limitations under the License.
 
 import re
+from functools import partial
 
 from cloudify import ctx
 from cloudify.decorators import operation
@@ -21,7 +22,9 @@ from cloudify.exceptions import NonRecoverableError
 
 from .. import utils
 from .. import constants
-from .firewall import FirewallRule
+from .. import operation_stats
+from ..gcp import BatchRequest
+from .firewall import FirewallRule, get_diff
 
 
 @operation(resumable=True)
@@ -99,25 +102,76 @@ def create_rule_name(name, rule):
 @utils.throw_cloudify_exceptions
 def configure(**kwargs):
     props = ctx.instance.runtime_properties
-    props['rules'] = []
     network = utils.get_network(ctx)
-    for name, op in props['_operations'].items():
-        firewall = FirewallRule(
-                utils.get_gcp_config(),
-                ctx.logger,
-                network=network,
-                name=name,
-                )
-        props['rules'].append(firewall.get())
+    names = list(props['_operations'])
+    props['rules'] = get_rules(utils.get_gcp_config(), network, names)
     del props['_operations']
 
 
+def list_rules(gcp_config, network, names):
+    """
+    Get the existing rules of names with a single filtered list call.
+
+    :return: dictionary of name: rule
+    """
+    firewall = FirewallRule(gcp_config, ctx.logger, network=network,
+                            name=None)
+    # Rule names are lowercase letters, digits and dashes, nothing to escape
+    # in the RE2 expression the whole name must match
+    return dict(
+        (rule[constants.NAME], rule) for rule in firewall.list(
+            filter='name eq "({0})"'.format('|'.join(names))))
+
+
+def get_rules(gcp_config, network, names):
+    """
+    Get the firewall rules with a single filtered list call. Rules missing
+    from the list are requested one by one.
+
+    :param gcp_config: gcp config
+    :param network: network of the rules
+    :param names: names of the rules
+    :return: list of the rules in the order of names
+    """
+    found = list_rules(gcp_config, network, names)
+    rules = []
+    for name in names:
+        if name not in found:
+            found[name] = FirewallRule(
+                gcp_config, ctx.logger, network=network, name=name).get()
+        rules.append(found[name])
+    return rules
+
+
 def handle_multiple_calls(objects, call, logger):
     """
     Manage running several API calls which all must succeed for the node to be
     successfully created.
 
     objects must be passed in a consistent order or bad things will happen.
+
+    Each object must provide a `<call>_request` method, see handle_calls.
+    """
+    handle_calls(
+        [(obj, getattr(obj, '{0}_request'.format(call))) for obj in objects],
+        '{0}d'.format(call),
+        logger)
+
+
+def handle_calls(calls, description, logger):
+    """
+    Run API calls of several rules, retrying the operation until all of them
+    are done. Progress is kept in the _operations runtime property, keyed by
+    the rule names.
+
+    The calls which haven't been started yet are sent in one batch request.
+    Operations of the calls sent by previous tries are polled in one batch
+    request too.
+
+    :param calls: list of (FirewallRule, function building its request)
+    :param description: past participle for the log, e.g. "created"
+    :param logger: logger object
+    :return: True once all the operations are done
     """
     props = ctx.instance.runtime_properties
     # Can be removed when
@@ -125,27 +179,109 @@ def handle_multiple_calls(objects, call, logger):
     # is finished:
     props.dirty = True
     operations = props.setdefault('_operations', {})
+    batch = None
+
+    pending = dict((name, op) for name, op in operations.items()
+                   if op['status'] != 'DONE')
+    if pending:
+        # All unfinished operations are polled in one round trip
+        responses, errors = utils.get_operations(
+            pending, utils.get_gcp_config(), logger)
+        operations.update(responses)
+        for name in pending:
+            if name in errors:
+                raise errors[name]
+            if responses.get(name, {}).get('status') == 'DONE':
+                operation_stats.record(responses[name])
+
+    for obj, build_request in calls:
+        if obj.name not in operations:
+            if batch is None:
+                batch = BatchRequest(obj.discovery, logger)
+            batch.add(obj.name, build_request())
 
-    for obj in objects:
-        if obj.name in operations:
-            if operations[obj.name]['status'] == 'DONE':
-                # This one is finished
-                continue
-            else:
-                op = utils.response_to_operation(
-                        operations[obj.name],
-                        utils.get_gcp_config(),
-                        logger,
-                        )
-                operations[obj.name] = op.get()
-        else:
-            operations[obj.name] = getattr(obj, call)()
+    if batch:
+        logger.info('Sending {0} calls in a batch'.format(len(batch)))
+        # Keep the started operations even if some of the calls failed, so
+        # they are not sent again on the next try.
+        operations.update(batch.execute())
+        batch.raise_first_error()
 
     not_done = [k for k, v in operations.items() if v['status'] != 'DONE']
     if not_done:
-        return ctx.operation.retry(
-                'Rules {} not yet {}d'.format(str(not_done), call),
-                constants.RETRY_DEFAULT_DELAY)
+        # The operations run in parallel, wait for the slowest one
+        ctx.operation.retry(
+                'Rules {} not yet {}'.format(str(not_done), description),
+                max(operation_stats.get_retry_delay(operations[k])
+                    for k in not_done))
+        return False
+    return True
+
+
+@operation(resumable=True)
+@utils.retry_on_failure('Retrying updating security group')
+@utils.throw_cloudify_exceptions
+def update(rules, **kwargs):
+    """
+    Bring the rules of the security group in line with `rules`, patching
+    only the fields which differ. Rules changed in the blueprint get new
+    names, instead of being recreated they take over the rules they replace.
+    Unchanged rules aren't touched, new rules are inserted and rules left
+    over are deleted. All the calls are sent in one batch request.
+    """
+    props = ctx.instance.runtime_properties
+    gcp_config = utils.get_gcp_config()
+    network = utils.get_network(ctx)
+    name = props[constants.NAME]
+
+    def rule_object(rule_name, rule):
+        return FirewallRule(
+                gcp_config,
+                ctx.logger,
+                name=rule_name,
+                network=network,
+                allowed=rule['allowed'],
+                sources=rule['sources'],
+                tags=[name],
+                security_group=True,
+                )
+
+    # Plan from the rules stored at the last change, which stay the same
+    # on every try until the update is finished
+    current = [rule[constants.NAME] for rule in props.get('rules', [])]
+    desired = [(create_rule_name(name, rule), rule) for rule in rules]
+    desired_names = set(rule_name for rule_name, _ in desired)
+    stale = [rule_name for rule_name in current
+             if rule_name not in desired_names]
+    targets = []
+    for rule_name, rule in desired:
+        if rule_name not in current and stale:
+            rule_name = stale.pop(0)
+        targets.append(rule_object(rule_name, rule))
+
+    live = list_rules(
+        gcp_config, network,
+        [firewall.name for firewall in targets] + stale)
+    calls = []
+    for firewall in targets:
+        if firewall.name not in live:
+            calls.append((firewall, firewall.create_request))
+            continue
+        diff = get_diff(firewall.to_dict(), live[firewall.name])
+        if diff:
+            calls.append((firewall, partial(firewall.patch_request, diff)))
+    for rule_name in stale:
+        if rule_name in live:
+            firewall = FirewallRule(
+                gcp_config, ctx.logger, name=rule_name, network=network)
+            calls.append((firewall, firewall.delete_request))
+
+    ctx.logger.info('{0} of {1} rules need changes'.format(
+        len(calls), len(targets) + len(stale)))
+    if handle_calls(calls, 'updated', ctx.logger):
+        props['rules'] = get_rules(
+            gcp_config, network, [firewall.name for firewall in targets])
+        props.pop('_operations', None)
 
 
 @operation(resumable=True)
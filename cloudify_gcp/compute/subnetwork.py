@@ -26,6 +26,9 @@ from ..gcp import GoogleCloudPlatform
 
 
 class SubNetwork(GoogleCloudPlatform):
+    RUNTIME_FIELDS = ('id,kind,name,selfLink,network,region,ipCidrRange,'
+                      'gatewayAddress,secondaryIpRanges,creationTimestamp')
+
     def __init__(self,
                  config,
                  logger,
@@ -86,10 +89,11 @@ class SubNetwork(GoogleCloudPlatform):
             ).execute()
 
     @check_response
-    def get(self):
+    def get(self, fields=None):
         """
         Get GCP subnetwork details.
 
+        :param fields: partial response mask, whole subnetwork if None
         :return: REST response with operation responsible for the subnetwork
         details retrieval
         """
@@ -97,19 +101,23 @@ class SubNetwork(GoogleCloudPlatform):
         return self.discovery.subnetworks().get(
             project=self.project,
             region=self.region,
-            subnetwork=self.name).execute()
+            subnetwork=self.name,
+            fields=fields).execute()
 
-    @check_response
-    def list(self):
+    def list(self, **kwargs):
         """
-        List subnetworks.
+        List subnetworks of the region.
 
-        :return: REST response with list of subnetworks in a project
+        :param kwargs: filter, maxResults or fields, see
+            GoogleCloudPlatform.paginate
+        :return: generator of subnetworks in the region
         """
         self.logger.info(
                 'List subnetworks in project {0}'.format(self.project))
-        return self.discovery.subnetworks().list(
-            project=self.project).execute()
+        return self.paginate(self.discovery.subnetworks(),
+                             project=self.project,
+                             region=basename(self.region),
+                             **kwargs)
 
     def to_dict(self):
         body = {
@@ -145,6 +153,8 @@ def create(name, region, subnet, **kwargs):
             subnet,
             network.runtime_properties['selfLink'],
             )
+    if not subnetwork.region:
+        subnetwork.region = subnetwork.get_region(gcp_config['zone'])
 
     ctx.instance.runtime_properties[constants.RESOURCE_ID] = subnetwork.name
     ctx.instance.runtime_properties[constants.NAME] = subnetwork.name
@@ -171,8 +181,10 @@ def delete(**kwargs):
 
 
 def creation_validation(**kwargs):
-    if not ctx.node.properties['region']:
-        raise NonRecoverableError("region must be supplied")
+    if not ctx.node.properties['region'] \
+            and not utils.get_gcp_config().get('zone'):
+        raise NonRecoverableError(
+            "region must be supplied when gcp_config has no zone")
 
     rel_type = 'cloudify.gcp.relationships.contained_in_network'
     node_type = 'cloudify.nodes.gcp.Network'
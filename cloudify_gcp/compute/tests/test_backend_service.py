@@ -57,7 +57,7 @@ class TestGCPBackendService(TestGCP):
                 )
 
     def test_add_backend(self, mock_build, *args):
-        mock_build().globalOperations().get().execute.side_effect = [
+        mock_build().globalOperations().wait().execute.side_effect = [
                 {'status': 'PENDING', 'name': 'Dave'},
                 {'status': 'DONE', 'name': 'Dave'},
                 {'status': 'DONE', 'name': 'Harry'},
@@ -86,7 +86,7 @@ class TestGCPBackendService(TestGCP):
                 )
 
     def test_remove_backend(self, mock_build, *args):
-        mock_build().globalOperations().get().execute.side_effect = [
+        mock_build().globalOperations().wait().execute.side_effect = [
                 {'status': 'PENDING', 'name': 'Boris'},
                 {'status': 'DONE', 'name': 'Boris'},
                 ]
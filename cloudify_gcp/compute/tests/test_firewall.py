@@ -82,3 +82,106 @@ class TestGCPFirewall(TestGCP):
                 firewall='delete-name',
                 project='not really a project',
                 )
+
+    def test_get_diff(self, *args):
+        live = {
+            'name': 'rule',
+            'network': 'https://www.googleapis.com/compute/v1/projects/'
+                       'proj/global/networks/net',
+            'allowed': [{'IPProtocol': 'udp'},
+                        {'IPProtocol': 'tcp', 'ports': ['443', '80']}],
+            'sourceRanges': ['10.0.0.0/8'],
+            'logConfig': {'enable': False, 'metadata': 'INCLUDE_ALL'},
+            'creationTimestamp': 'yesterday',
+        }
+
+        self.assertEqual({}, firewall.get_diff({
+            'name': 'rule',
+            'network': 'projects/proj/global/networks/net',
+            'allowed': [{'IPProtocol': 'tcp', 'ports': [80, 443]},
+                        {'IPProtocol': 'udp'}],
+            'sourceRanges': ['10.0.0.0/8'],
+            'sourceTags': [],
+        }, live))
+
+        self.assertEqual({
+            'sourceRanges': ['10.0.0.0/16'],
+            'targetTags': ['web'],
+            'logConfig': {'enable': True},
+        }, firewall.get_diff({
+            'name': 'rule',
+            'allowed': [{'IPProtocol': 'udp'},
+                        {'IPProtocol': 'tcp', 'ports': ['80', '443']}],
+            'sourceRanges': ['10.0.0.0/16'],
+            'targetTags': ['web'],
+            'logConfig': {'enable': True, 'metadata': 'INCLUDE_ALL'},
+        }, live))
+
+    def test_get_diff_cleared(self, *args):
+        live = {
+            'name': 'rule',
+            'allowed': [{'IPProtocol': 'udp'}],
+            'sourceRanges': ['10.0.0.0/8'],
+            'sourceTags': ['db'],
+            'targetTags': ['web'],
+        }
+
+        # to_dict leaves out targetTags when the rule has none
+        self.assertEqual({
+            'sourceTags': [],
+            'targetTags': [],
+        }, firewall.get_diff({
+            'name': 'rule',
+            'allowed': [{'IPProtocol': 'udp'}],
+            'sourceRanges': ['10.0.0.0/8'],
+            'sourceTags': [],
+        }, live))
+
+    def test_update(self, mock_build, *args):
+        props = self.ctxmock.instance.runtime_properties
+        props[constants.RESOURCE_ID] = 'name'
+        firewalls = mock_build().firewalls()
+        firewalls.get().execute.return_value = {
+            'name': 'name',
+            'description': 'Cloudify generated FirewallRule',
+            'allowed': [{'IPProtocol': 'tcp', 'ports': ['80']}],
+            'sourceRanges': ['10.0.0.0/8'],
+        }
+        firewalls.patch().execute.return_value = {
+            'name': 'op', 'status': 'RUNNING'}
+
+        firewall.update(
+                allowed={'tcp': [80]},
+                sources=['10.0.0.0/8', 'web'],
+                target_tags=None,
+                additional_settings={},
+                )
+
+        firewalls.patch.assert_called_with(
+                project='not really a project',
+                firewall='name',
+                body={'sourceTags': ['web']},
+                )
+        self.assertEqual({'phase': 0, '_operation': {
+            'name': 'op', 'status': 'RUNNING'}}, props[firewall.UPDATE_STATE])
+
+    def test_update_unchanged(self, mock_build, *args):
+        self.ctxmock.instance.runtime_properties[constants.RESOURCE_ID] = \
+            'name'
+        firewalls = mock_build().firewalls()
+        firewalls.get().execute.return_value = {
+            'name': 'name',
+            'description': 'Cloudify generated FirewallRule',
+            'allowed': [{'IPProtocol': 'tcp'}],
+            'sourceRanges': ['10.0.0.0/8'],
+        }
+
+        firewall.update(
+                allowed={'tcp': []},
+                sources=['10.0.0.0/8'],
+                target_tags=None,
+                additional_settings={},
+                )
+
+        firewalls.patch.assert_not_called()
+        self.ctxmock.operation.retry.assert_not_called()
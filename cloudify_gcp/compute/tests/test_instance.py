@@ -18,11 +18,14 @@ import json
 from functools import partial
 
 from mock import patch, Mock
+from googleapiclient.errors import HttpError
 
 from cloudify.exceptions import NonRecoverableError
 
+from ... import constants
 from .. import instance
-from ...tests import TestGCP
+from ...tests import TestGCP, FakeBatchHttpRequest
+from ...tests.test_utils import NS
 
 
 utils_get_ssh_keys_patch = partial(
@@ -32,6 +35,7 @@ utils_get_ssh_keys_patch = partial(
 
 
 @patch('cloudify_gcp.gcp.ServiceAccountCredentials.from_json_keyfile_dict')
+@patch('cloudify_gcp.utils.Operation.wait', return_value=True)
 @patch('cloudify_gcp.utils.Operation.has_finished', return_value=True)
 @patch('cloudify_gcp.gcp.build')
 class TestGCPInstance(TestGCP):
@@ -178,6 +182,143 @@ class TestGCPInstance(TestGCP):
                 self.ctxmock.instance.runtime_properties
                 )
 
+    def create_in_bulk(self, instance_id, get_rest_client):
+        self.ctxmock.instance.id = instance_id
+        self.ctxmock.deployment.id = 'dep'
+        get_rest_client.return_value.node_instances.list.return_value = [
+            NS(id='vm_b', state='configuring', runtime_properties={}),
+            NS(id='vm_a', state='configuring',
+               runtime_properties={'_operation': {
+                   'operationType': 'bulkInsert',
+                   'insertTime': '2000-01-01T00:00:00Z',
+                   'progress': 50}}),
+            # Its VM exists already
+            NS(id='vm_0', state='configuring',
+               runtime_properties={'resource_id': 'vm-0'}),
+            # create isn't running for these
+            NS(id='vm_1', state='creating', runtime_properties={}),
+            NS(id='vm_c', state='started', runtime_properties={}),
+        ]
+        instance.create(
+                'instance_type',
+                'image_id',
+                '',
+                zone='zone',
+                external_ip=False,
+                startup_script=None,
+                scopes='scopes',
+                tags=['tags'],
+                bulk_create=True,
+                )
+
+    @patch('cloudify_common_sdk.utils.get_rest_client')
+    def test_create_in_bulk(self, get_rest_client, mock_build, *args):
+        mock_build.return_value.new_batch_http_request.side_effect = \
+            FakeBatchHttpRequest
+        instances = mock_build.return_value.instances.return_value
+        instances.get.return_value.execute.side_effect = HttpError(
+            NS(status=404), b'')
+
+        self.create_in_bulk('vm_a', get_rest_client)
+
+        get_rest_client().node_instances.list.assert_called_once_with(
+            deployment_id='dep', node_id='id',
+            _include=['id', 'state', 'runtime_properties'])
+        body = instances.bulkInsert.call_args[1]['body']
+        self.assertEqual(2, body['count'])
+        self.assertEqual({'vm-a': {}, 'vm-b': {}},
+                         body['perInstanceProperties'])
+        self.assertEqual('instance_type',
+                         body['instanceProperties']['machineType'])
+        self.assertEqual(['tags'],
+                         body['instanceProperties']['tags']['items'])
+        self.assertNotIn('name', body['instanceProperties'])
+        self.assertEqual(
+            instances.bulkInsert.return_value.execute.return_value,
+            self.ctxmock.instance.runtime_properties['_operation'])
+        self.assertNotIn(
+            'resource_id', self.ctxmock.instance.runtime_properties)
+
+    @patch('cloudify_common_sdk.utils.get_rest_client')
+    def test_create_in_bulk_existing(self, get_rest_client, mock_build,
+                                     *args):
+        mock_build.return_value.new_batch_http_request.side_effect = \
+            FakeBatchHttpRequest
+        instances = mock_build.return_value.instances.return_value
+        instances.get.return_value.execute.side_effect = [
+            HttpError(NS(status=404), b''), {'name': 'vm-b'}]
+
+        self.create_in_bulk('vm_a', get_rest_client)
+
+        body = instances.bulkInsert.call_args[1]['body']
+        self.assertEqual(1, body['count'])
+        self.assertEqual({'vm-a': {}}, body['perInstanceProperties'])
+
+    @patch('cloudify_common_sdk.utils.get_rest_client')
+    def test_create_in_bulk_init_script(self, get_rest_client, mock_build,
+                                        *args):
+        self.ctxmock.agent.init_script = lambda: 'install the agent'
+
+        self.create_in_bulk('vm_a', get_rest_client)
+
+        instances = mock_build.return_value.instances.return_value
+        instances.bulkInsert.assert_not_called()
+        instances.insert.assert_called_once()
+        get_rest_client().node_instances.list.assert_not_called()
+
+    @patch('cloudify_common_sdk.utils.get_rest_client')
+    def test_create_in_bulk_waits(self, get_rest_client, mock_build, *args):
+        instances = mock_build.return_value.instances.return_value
+        instances.get.return_value.execute.side_effect = HttpError(
+            NS(status=404), b'')
+
+        self.create_in_bulk('vm_b', get_rest_client)
+
+        instances.bulkInsert.assert_not_called()
+        # Delay estimated from the operation of the instance sending it
+        self.ctxmock.operation.retry.assert_called_once_with(
+            'Waiting for instance vm-b to be created in bulk by vm-a',
+            constants.RETRY_MAX_DELAY)
+
+    @patch('cloudify_gcp.utils.response_to_operation')
+    @patch('cloudify_common_sdk.utils.get_rest_client')
+    def test_create_in_bulk_polls(self, get_rest_client,
+                                  response_to_operation, mock_build, *args):
+        instances = mock_build.return_value.instances.return_value
+        instances.get.return_value.execute.return_value = {
+            'name': 'vm-a', 'status': 'RUNNING'}
+        response_to_operation.return_value.has_finished.return_value = True
+        response_to_operation.return_value.last_response = {
+            'status': 'DONE'}
+        self.ctxmock.instance.runtime_properties['_operation'] = {
+            'status': 'RUNNING'}
+
+        self.create_in_bulk('vm_a', get_rest_client)
+
+        get_rest_client().node_instances.list.assert_not_called()
+        instances.bulkInsert.assert_not_called()
+        self.assertNotIn(
+            '_operation', self.ctxmock.instance.runtime_properties)
+        self.assertEqual(
+            'RUNNING', self.ctxmock.instance.runtime_properties['status'])
+        self.assertEqual(
+            'vm-a', self.ctxmock.instance.runtime_properties['resource_id'])
+
+    @patch('cloudify_common_sdk.utils.get_rest_client')
+    def test_create_in_bulk_created(self, get_rest_client, mock_build, *args):
+        instances = mock_build.return_value.instances.return_value
+        instances.get.return_value.execute.return_value = {
+            'name': 'vm-b', 'status': 'RUNNING'}
+
+        self.create_in_bulk('vm_b', get_rest_client)
+
+        get_rest_client().node_instances.list.assert_not_called()
+        instances.bulkInsert.assert_not_called()
+        self.assertEqual(
+            'RUNNING', self.ctxmock.instance.runtime_properties['status'])
+        self.assertEqual(
+            'vm-b', self.ctxmock.instance.runtime_properties['resource_id'])
+
     def test_create_with_disk(self, mock_build, *args):
         self.ctxmock.instance.runtime_properties.update({
                 'gcp_disk': '💾',
@@ -524,40 +665,126 @@ class TestGCPInstance(TestGCP):
                 project='not really a project', zone='zone'
                 )
 
-    @patch('cloudify_gcp.utils.get_item_from_gcp_response',
-           return_value={'networkInterfaces': [{'networkIP': 'a'}]})
-    def test_start(self, mock_getitem, mock_build, *args):
+    def set_instance(self, mock_build, item):
+        instances = mock_build.return_value.instances.return_value
+        instances.get.return_value.execute.return_value = item
+
+    def test_start(self, mock_build, *args):
+        self.set_instance(
+            mock_build, {'networkInterfaces': [{'networkIP': 'a'}]})
         self.ctxmock.node.properties['external_ip'] = False
         self.ctxmock.instance.runtime_properties['name'] = 'name'
         instance.start('name')
         self.assertEqual(
                 self.ctxmock.instance.runtime_properties['ip'],
                 'a')
+        # Looked up directly, the zone isn't listed
+        mock_build().instances().get.assert_called_with(
+                instance='name',
+                project='not really a project',
+                zone='a very fake zone',
+                fields=instance.Instance.RUNTIME_FIELDS)
+        mock_build().instances().list.assert_not_called()
+
+    def set_machine_types(self, mock_build, names):
+        machine_types = mock_build.return_value.machineTypes.return_value
+        machine_types.list.return_value.execute.return_value = {
+            'items': [{'name': name} for name in names]}
+        machine_types.list_next.return_value = None
 
     def test_resize(self, mock_build, *args):
+        self.set_machine_types(mock_build, ['baz', 'qux'])
+        props = self.ctxmock.instance.runtime_properties
+        instances = mock_build.return_value.instances.return_value
+        for call in (instances.stop,
+                     instances.setMachineType,
+                     instances.start):
+            call.return_value.execute.return_value = {
+                'name': call._mock_name, 'status': 'RUNNING'}
+        mock_build().globalOperations().get().execute.return_value = {
+                'status': 'DONE',
+                }
+
+        # Every try starts one phase and returns without waiting for it
         instance.resize('foo', 'bar', 'baz')
-        mock_build().instances().stop.assert_called_with(
+        instances.stop.assert_called_with(
             project='not really a project',
             instance='foo',
             zone='bar')
-        mock_build().instances().setMachineType.assert_called_with(
+        instances.setMachineType.assert_not_called()
+        self.assertEqual({'machine_type': 'baz',
+                          'phase': 0,
+                          '_operation': {'name': 'stop',
+                                         'status': 'RUNNING'}},
+                         props['_resize'])
+
+        instance.resize('foo', 'bar', 'baz')
+        instances.setMachineType.assert_called_with(
             project='not really a project',
             instance='foo',
             zone='bar',
             body={'machineType': 'bar/machineTypes/baz'})
-        mock_build().instances().start.assert_called_with(
+        instances.start.assert_not_called()
+        self.assertEqual(1, props['_resize']['phase'])
+
+        instance.resize('foo', 'bar', 'baz')
+        instances.start.assert_called_with(
             project='not really a project',
             instance='foo',
             zone='bar')
+        self.assertNotIn('machine_type', props)
 
-    @patch('cloudify_gcp.utils.get_item_from_gcp_response', return_value={
-        'networkInterfaces': [
-            {
-                'networkIP': 'a',
-                'accessConfigs': [{'natIP': '🕷'}],
-            },
-        ]})
-    def test_start_with_external_ip(self, mock_getitem, mock_build, *args):
+        instance.resize('foo', 'bar', 'baz')
+        self.assertEqual('baz', props['machine_type'])
+        self.assertNotIn('_resize', props)
+        self.assertEqual(1, instances.stop.call_count)
+        self.assertEqual(3, self.ctxmock.operation.retry.call_count)
+
+    def test_resize_unavailable_machine_type(self, mock_build, *args):
+        self.set_machine_types(mock_build, ['qux'])
+        with self.assertRaises(NonRecoverableError):
+            instance.resize('foo', 'bar', 'baz')
+        mock_build.return_value.machineTypes().list.assert_called_once_with(
+            project='not really a project', zone='bar')
+        mock_build.return_value.instances().stop.assert_not_called()
+
+    def test_resize_custom_machine_type(self, mock_build, *args):
+        self.set_machine_types(mock_build, ['qux'])
+        instances = mock_build.return_value.instances.return_value
+        instances.stop.return_value.execute.return_value = {
+            'name': 'stop', 'status': 'RUNNING'}
+
+        instance.resize('foo', 'bar', 'n2-custom-4-8192')
+
+        mock_build.return_value.machineTypes().list.assert_not_called()
+        instances.stop.assert_called_once_with(
+            project='not really a project', instance='foo', zone='bar')
+
+    def test_get_instances(self, mock_build, *args):
+        mock_build.return_value.new_batch_http_request.side_effect = \
+            FakeBatchHttpRequest
+        instances = mock_build.return_value.instances.return_value
+        instances.get.return_value.execute.side_effect = [
+            {'name': 'one'}, HttpError(NS(status=404), b''),
+            {'name': 'three'}]
+        gcp_config = {'auth': {}, 'project': 'p', 'zone': 'z'}
+
+        self.assertEqual(
+            {'one': {'name': 'one'}, 'three': {'name': 'three'}},
+            instance.get_instances([
+                instance.Instance(gcp_config, Mock(), name, zone='z')
+                for name in ('one', 'two', 'three')]))
+        mock_build().new_batch_http_request.assert_called_once()
+        self.assertEqual({}, instance.get_instances([]))
+
+    def test_start_with_external_ip(self, mock_build, *args):
+        self.set_instance(mock_build, {
+            'networkInterfaces': [
+                {
+                    'networkIP': 'a',
+                    'accessConfigs': [{'natIP': '🕷'}],
+                },
+            ]})
         self.ctxmock.node.properties['external_ip'] = True
         self.ctxmock.instance.runtime_properties['name'] = 'name'
         instance.start('name')
@@ -603,9 +830,9 @@ class TestGCPInstance(TestGCP):
 
         self.assertFalse(self.ctxmock.instance.runtime_properties)
 
-    @patch('cloudify_gcp.utils.get_item_from_gcp_response', return_value={
+    def test_add_external_ip(self, mock_build, *args):
+        self.set_instance(mock_build, {
                 'networkInterfaces': [{'accessConfigs': [{'natIP': '🕷'}]}]})
-    def test_add_external_ip(self, mock_getitem, mock_build, *args):
         self.ctxmock.target.node.type = 'cloudify.gcp.nodes.Address'
         self.ctxmock.target.node.properties = {
                 'use_external_resource': False,
@@ -628,9 +855,9 @@ class TestGCPInstance(TestGCP):
                 zone='a very fake zone',
                 )
 
-    @patch('cloudify_gcp.utils.get_item_from_gcp_response', return_value={
+    def test_add_external_external_ip(self, mock_build, *args):
+        self.set_instance(mock_build, {
                 'networkInterfaces': [{'accessConfigs': [{'natIP': '🕷'}]}]})
-    def test_add_external_external_ip(self, mock_getitem, mock_build, *args):
         self.ctxmock.target.node.properties = {
                 'use_external_resource': True,
                 }
@@ -12,7 +12,7 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from mock import patch, Mock
+from mock import patch
 
 from cloudify.manager import DirtyTrackingDict
 
@@ -28,6 +28,12 @@ class TestInstanceGroup(TestGCP):
         super(TestInstanceGroup, self).setUp()
         self.ctxmock.source.instance.runtime_properties = DirtyTrackingDict()
 
+    def set_instances(self, mock_build, instances):
+        groups = mock_build.return_value.instanceGroups.return_value
+        groups.listInstances.return_value.execute.return_value = {
+            'items': instances}
+        groups.listInstances_next.return_value = None
+
     def test_create(self, mock_build, *args):
         instance_group.create(
                 'name',
@@ -57,7 +63,8 @@ class TestInstanceGroup(TestGCP):
                 )
 
     def test_add_to_instance_group(self, mock_build, *args):
-        mock_build().globalOperations().get().execute.side_effect = [
+        self.set_instances(mock_build, [])
+        mock_build().globalOperations().wait().execute.side_effect = [
                 {'status': 'PENDING', 'name': 'Dave'},
                 {'status': 'DONE', 'name': 'Dave'},
                 ]
@@ -74,10 +81,9 @@ class TestInstanceGroup(TestGCP):
                 )
 
     def test_remove_from_instance_group(self, mock_build, *args):
-        mock_build().instanceGroups().listInstances().execute().get = Mock(
-            return_value=[{'instance': 'instance url'}])
+        self.set_instances(mock_build, [{'instance': 'instance url'}])
 
-        mock_build().globalOperations().get().execute.side_effect = [
+        mock_build().globalOperations().wait().execute.side_effect = [
                 {'status': 'PENDING', 'name': 'Dave'},
                 {'status': 'DONE', 'name': 'Dave'},
                 ]
@@ -14,12 +14,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from mock import patch
+from mock import ANY, Mock, patch
+from Crypto.PublicKey import RSA
+from googleapiclient.errors import HttpError
 
 from cloudify.exceptions import NonRecoverableError
 
 from .. import keypair
+from ...gcp import GCPError
 from ...tests import TestGCP
+from ...tests.test_utils import NS
+
+KEY = RSA.generate(1024)
 
 
 @patch('cloudify_gcp.utils.assure_resource_id_correct', return_value=True)
@@ -27,24 +33,30 @@ from ...tests import TestGCP
 @patch('cloudify_gcp.utils.get_gcp_resource_name', return_value='valid_name')
 @patch('os.chmod')
 @patch('cloudify_gcp.compute.keypair.open')
-@patch('cloudify_gcp.compute.keypair.RSA.generate')
+@patch('cloudify_gcp.key_pool.generate_key', return_value=KEY)
 class TestGCPKeypair(TestGCP):
 
-    def test_create(self, mock_rsa, *args):
+    def test_create(self, mock_generate, *args):
         keypair.create(
                 'user',
                 'private',
                 'public',
                 )
 
-        mock_rsa.assert_called_once_with(2048)
+        # The pool is empty, so the key is generated
+        mock_generate.assert_called_once_with('rsa')
 
         self.assertEqual(
-                {'gcp_private_key': mock_rsa().exportKey(),
-                 'gcp_public_key': mock_rsa().exportKey(),
+                {'gcp_private_key': KEY.export_key('PEM').decode('utf-8'),
+                 'gcp_public_key': KEY.publickey().export_key(
+                     'OpenSSH').decode('utf-8'),
                  'user': 'user'},
                 self.ctxmock.instance.runtime_properties)
 
+    def test_create_invalid_key_type(self, *args):
+        with self.assertRaises(NonRecoverableError):
+            keypair.create('user', 'private', 'public', key_type='dsa')
+
     def test_create_external(self, *args):
         self.ctxmock.node.properties['use_external_resource'] = True
 
@@ -89,3 +101,109 @@ class TestGCPKeypair(TestGCP):
         self.assertEqual(
                 {},
                 self.ctxmock.instance.runtime_properties)
+
+    @patch('cloudify_gcp.compute.keypair.project_ssh_keys')
+    def test_create_project_ssh_key(self, project_ssh_keys, *args):
+        with patch('cloudify_gcp.utils.get_key_user_string',
+                   return_value='user:ssh-rsa key user'):
+            keypair.create('user', 'private', 'public', project_ssh_key=True)
+
+        project_ssh_keys.submit.assert_called_once_with(
+            ANY, add=['user:ssh-rsa key user'])
+        self.assertEqual(
+            'user:ssh-rsa key user',
+            self.ctxmock.instance.runtime_properties['gcp_project_ssh_key'])
+
+    @patch('cloudify_gcp.compute.keypair.project_ssh_keys')
+    def test_delete_project_ssh_key(self, project_ssh_keys, *args):
+        self.ctxmock.instance.runtime_properties.update({
+            'gcp_public_key': 'delete_pubkey',
+            'gcp_project_ssh_key': 'user:ssh-rsa key user'})
+
+        keypair.delete('user', 'private')
+
+        project_ssh_keys.submit.assert_called_once_with(
+            ANY, remove=['user:ssh-rsa key user'])
+        self.assertEqual({}, self.ctxmock.instance.runtime_properties)
+
+
+@patch('cloudify_gcp.gcp.build')
+class TestProjectSshKeys(TestGCP):
+
+    def get_keypair(self):
+        return keypair.KeyPair(
+            self.ctxmock.node.properties['gcp_config'],
+            Mock(), 'user', 'private', 'public')
+
+    def test_set_project_ssh_keys(self, mock_build):
+        projects = mock_build.return_value.projects.return_value
+        projects.get.return_value.execute.side_effect = lambda: {
+            'commonInstanceMetadata': {
+                'fingerprint': 'f',
+                'items': [{'key': 'sshKeys', 'value': 'a\nb'}]}}
+        set_metadata = projects.setCommonInstanceMetadata
+        set_metadata.return_value.execute.side_effect = [
+            HttpError(NS(status=412), b''),
+            {'name': 'operation'},
+        ]
+
+        self.assertEqual(
+            {'name': 'operation'},
+            self.get_keypair().set_project_ssh_keys(['c', 'a'], ['b']))
+
+        # Read again after the fingerprint conflict
+        self.assertEqual(2, projects.get.return_value.execute.call_count)
+        set_metadata.assert_called_with(
+            project='not really a project',
+            body={'fingerprint': 'f',
+                  'items': [{'key': 'sshKeys', 'value': 'a\nc'}]})
+
+    def test_set_project_ssh_keys_unchanged(self, mock_build):
+        projects = mock_build.return_value.projects.return_value
+        projects.get.return_value.execute.return_value = {
+            'commonInstanceMetadata': {'fingerprint': 'f'}}
+
+        self.assertIsNone(
+            self.get_keypair().set_project_ssh_keys([], ['a']))
+        projects.setCommonInstanceMetadata.assert_not_called()
+
+    def test_coalesced(self, mock_build):
+        projects = mock_build.return_value.projects.return_value
+        projects.get.return_value.execute.return_value = {
+            'commonInstanceMetadata': {
+                'fingerprint': 'f',
+                'items': [{'key': 'sshKeys', 'value': 'a\nb'}]}}
+        set_metadata = projects.setCommonInstanceMetadata
+        set_metadata.return_value.execute.return_value = {'name': 'op'}
+        project_ssh_keys = keypair.ProjectSshKeys()
+        # Spooled by operations running in other processes
+        other = project_ssh_keys.spool(
+            'not really a project', add=['c'], remove=['a'])
+        project_ssh_keys.spool('not really a project', remove=['c'])
+
+        self.assertEqual(
+            {'name': 'op'},
+            project_ssh_keys.submit(self.get_keypair(), add=['d']))
+
+        set_metadata.assert_called_once_with(
+            project='not really a project',
+            body={'fingerprint': 'f',
+                  'items': [{'key': 'sshKeys', 'value': 'b\nd'}]})
+        # The others find their result without another update
+        self.assertEqual(
+            {'name': 'op'},
+            project_ssh_keys.wait(self.get_keypair(), other))
+        set_metadata.assert_called_once()
+
+    def test_coalesced_error(self, mock_build):
+        projects = mock_build.return_value.projects.return_value
+        projects.get.return_value.execute.side_effect = HttpError(
+            NS(status=403), b'')
+        project_ssh_keys = keypair.ProjectSshKeys()
+        other = project_ssh_keys.spool('not really a project', add=['c'])
+
+        with self.assertRaises(GCPError):
+            project_ssh_keys.submit(self.get_keypair(), add=['d'])
+        with self.assertRaises(GCPError):
+            project_ssh_keys.wait(self.get_keypair(), other)
+        projects.get.return_value.execute.assert_called_once()
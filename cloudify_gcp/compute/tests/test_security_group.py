@@ -14,10 +14,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from mock import patch
+from mock import patch, Mock
 
+from cloudify_gcp import constants
 from cloudify_gcp.compute import security_group
-from ...tests import TestGCP
+from ...tests import TestGCP, FakeBatchHttpRequest
 
 
 @patch('cloudify_gcp.utils.assure_resource_id_correct', return_value=True)
@@ -29,7 +30,12 @@ class TestGCPSecurityGroup(TestGCP):
         super(TestGCPSecurityGroup, self).setUp()
         self.ctxmock.instance.relationships = []
 
+    def use_fake_batch(self, mock_build):
+        mock_build.return_value.new_batch_http_request.side_effect = \
+            FakeBatchHttpRequest
+
     def test_create(self, mock_build, *args):
+        self.use_fake_batch(mock_build)
         self.ctxmock.node.properties['rules'] = rules = [
                     {
                         'allowed': {'NOTHING!': ''},
@@ -78,6 +84,7 @@ class TestGCPSecurityGroup(TestGCP):
                     )
 
     def test_delete(self, mock_build, *args):
+        self.use_fake_batch(mock_build)
         props = self.ctxmock.instance.runtime_properties
         props['gcp_name'] = 'delete_name'
         props['rules'] = [
@@ -92,3 +99,162 @@ class TestGCPSecurityGroup(TestGCP):
                 firewall='youdonottalkaboutfightclub',
                 project='not really a project',
                 )
+
+        self.assertEqual(['youdonottalkaboutfightclub'],
+                         list(props['_operations']))
+        mock_build().new_batch_http_request.assert_called_once()
+
+    def test_create_partial_failure(self, mock_build, *args):
+        self.use_fake_batch(mock_build)
+        mock_build().firewalls().insert().execute.side_effect = [
+                {'name': 'op1', 'status': 'DONE'},
+                {'error': 'quota exceeded'},
+                ]
+        rules = [
+                {'allowed': {'tcp': ['80']}, 'sources': ['bob']},
+                {'allowed': {'tcp': ['81']}, 'sources': ['bob']},
+                ]
+
+        with self.assertRaises(security_group.NonRecoverableError):
+            security_group.create('name', rules)
+
+        self.assertEqual(
+                {'ctx-sg-name-from-bob-to-tcp80': {
+                    'name': 'op1', 'status': 'DONE'}},
+                self.ctxmock.instance.runtime_properties['_operations'])
+
+    def test_create_polls_in_batch(self, mock_build, *args):
+        self.use_fake_batch(mock_build)
+        props = self.ctxmock.instance.runtime_properties
+        operations = props['_operations'] = {
+            'ctx-sg-name-from-bob-to-tcp80': {
+                'name': 'op1', 'status': 'RUNNING'},
+            'ctx-sg-name-from-bob-to-tcp81': {
+                'name': 'op2', 'status': 'DONE'},
+            'ctx-sg-name-from-bob-to-tcp82': {
+                'name': 'op3', 'status': 'RUNNING'},
+            }
+        global_operations = mock_build().globalOperations()
+        global_operations.get().execute.return_value = {
+            'name': 'op1', 'status': 'DONE'}
+        global_operations.get.reset_mock()
+        rules = [
+                {'allowed': {'tcp': ['80']}, 'sources': ['bob']},
+                {'allowed': {'tcp': ['81']}, 'sources': ['bob']},
+                {'allowed': {'tcp': ['82']}, 'sources': ['bob']},
+                ]
+
+        security_group.create('name', rules)
+
+        self.assertEqual(
+            ['op1', 'op3'],
+            sorted(c[1]['operation']
+                   for c in global_operations.get.call_args_list))
+        mock_build().firewalls().insert.assert_not_called()
+        mock_build().new_batch_http_request.assert_called_once()
+        self.assertEqual('DONE', operations[
+            'ctx-sg-name-from-bob-to-tcp80']['status'])
+
+    @patch('cloudify_gcp.operation_stats.record')
+    def test_create_retry_delay(self, mock_record, mock_build, *args):
+        self.use_fake_batch(mock_build)
+        props = self.ctxmock.instance.runtime_properties
+        props['_operations'] = {
+            'ctx-sg-name-from-bob-to-tcp80': {
+                'name': 'op1', 'status': 'RUNNING'},
+            'ctx-sg-name-from-bob-to-tcp81': {
+                'name': 'op2', 'status': 'RUNNING'},
+            }
+        responses = {
+            'op1': {'name': 'op1', 'status': 'DONE'},
+            'op2': {'name': 'op2', 'status': 'RUNNING', 'progress': 50,
+                    'insertTime': '2000-01-01T00:00:00Z'},
+            }
+        mock_build().globalOperations().get.side_effect = \
+            lambda operation, **_: Mock(**{
+                'execute.return_value': responses[operation]})
+        rules = [
+                {'allowed': {'tcp': ['80']}, 'sources': ['bob']},
+                {'allowed': {'tcp': ['81']}, 'sources': ['bob']},
+                ]
+
+        security_group.create('name', rules)
+
+        mock_record.assert_called_once_with(responses['op1'])
+        self.ctxmock.operation.retry.assert_called_once_with(
+            "Rules ['ctx-sg-name-from-bob-to-tcp81'] not yet created",
+            constants.RETRY_MAX_DELAY)
+
+    def test_configure(self, mock_build, *args):
+        self.ctxmock.instance.id = 'sg_instance'
+        props = self.ctxmock.instance.runtime_properties
+        props['_operations'] = {'rule-a': {}, 'rule-b': {}, 'rule-c': {}}
+        firewalls = mock_build().firewalls()
+        firewalls.list().execute.return_value = {
+            'items': [{'name': 'rule-b'}, {'name': 'rule-a'}]}
+        firewalls.list_next.return_value = None
+        firewalls.get().execute.return_value = {'name': 'rule-c'}
+
+        security_group.configure()
+
+        firewalls.list.assert_called_with(
+            project='not really a project',
+            filter='name eq "(rule-a|rule-b|rule-c)"')
+        firewalls.get.assert_called_with(
+            project='not really a project', firewall='rule-c')
+        self.assertEqual(
+            [{'name': 'rule-a'}, {'name': 'rule-b'}, {'name': 'rule-c'}],
+            props['rules'])
+        self.assertNotIn('_operations', props)
+
+    def test_update(self, mock_build, *args):
+        self.use_fake_batch(mock_build)
+        self.ctxmock.instance.id = 'sg_instance'
+        props = self.ctxmock.instance.runtime_properties
+        props['name'] = 'ctx-sg-name'
+        props['rules'] = [
+            {'name': 'ctx-sg-name-from-bob-to-tcp80'},
+            {'name': 'ctx-sg-name-from-bob-to-tcp81'},
+            {'name': 'ctx-sg-name-from-bob-to-tcp82'},
+            ]
+
+        def rule(name, port):
+            return {
+                'name': name,
+                'network': 'projects/not really a project/'
+                           'global/networks/not a real network',
+                'description': 'Cloudify generated SG part',
+                'sourceTags': ['bob'],
+                'targetTags': ['ctx-sg-name'],
+                'allowed': [{'IPProtocol': 'tcp', 'ports': [port]}],
+            }
+
+        firewalls = mock_build().firewalls()
+        firewalls.list().execute.return_value = {'items': [
+            rule('ctx-sg-name-from-bob-to-tcp80', '80'),
+            rule('ctx-sg-name-from-bob-to-tcp81', '81'),
+            rule('ctx-sg-name-from-bob-to-tcp82', '82'),
+            ]}
+        firewalls.list_next.return_value = None
+        firewalls.patch().execute.return_value = {
+            'name': 'op', 'status': 'RUNNING'}
+        firewalls.patch.reset_mock()
+
+        # 80 is kept, 81 becomes 8080 and 82 is removed
+        security_group.update([
+            {'allowed': {'tcp': ['80']}, 'sources': ['bob']},
+            {'allowed': {'tcp': ['8080']}, 'sources': ['bob']},
+            ])
+
+        firewalls.patch.assert_called_once_with(
+            project='not really a project',
+            firewall='ctx-sg-name-from-bob-to-tcp81',
+            body={'allowed': [{'IPProtocol': 'tcp', 'ports': ['8080']}]})
+        firewalls.delete.assert_called_with(
+            project='not really a project',
+            firewall='ctx-sg-name-from-bob-to-tcp82')
+        firewalls.insert.assert_not_called()
+        self.assertEqual(
+            ['ctx-sg-name-from-bob-to-tcp81', 'ctx-sg-name-from-bob-to-tcp82'],
+            sorted(props['_operations']))
+        self.ctxmock.operation.retry.assert_called_once()
@@ -64,6 +64,42 @@ class TestGCPSubNetwork(TestGCP):
                 region='Bukit Bintang',
                 )
 
+    def test_create_region_from_zone(self, mock_build, *args):
+        rel = Mock()
+        rel.type = 'cloudify.gcp.relationships.contained_in_network'
+        rel.target.node.type = 'cloudify.gcp.nodes.Network'
+        rel.target.instance.runtime_properties = {
+                'kind': 'compute#network',
+                'selfLink': 'Look at me!',
+                }
+        self.ctxmock.instance.relationships.append(rel)
+        self.ctxmock.node.properties['use_external_resource'] = False
+        zones = mock_build.return_value.zones.return_value
+        zones.list.return_value.execute.return_value = {
+                'items': [{
+                    'name': 'a very fake zone',
+                    'region': 'regions/Bukit Jalil',
+                    }],
+                }
+        zones.list_next.return_value = None
+
+        subnetwork.create(
+                name='subnet name',
+                region='',
+                subnet='Token Ring',
+                )
+
+        mock_build().subnetworks().insert.assert_called_once_with(
+                body={
+                    'ipCidrRange': 'Token Ring',
+                    'network': 'Look at me!',
+                    'name': 'subnetname',
+                    'description': 'Cloudify generated subnetwork',
+                    },
+                project='not really a project',
+                region='Bukit Jalil',
+                )
+
     def test_create_validation(self, mock_build, *args):
         self.ctxmock.node.properties['name'] = 'network-name'
 
@@ -18,6 +18,8 @@ from mock import patch
 
 from cloudify.state import current_ctx
 
+from cloudify_gcp import gcp
+from cloudify_gcp import location_catalog
 from cloudify_gcp.tests import ctx_mock
 
 
@@ -31,9 +33,33 @@ def ctx():
     current_ctx.clear()
 
 
+@pytest.fixture(autouse=True)
+def patch_cache(tmpdir):
+    with patch('cloudify_gcp.constants.OPERATION_POLLER_PATH',
+               str(tmpdir.join('operations.json'))), \
+            patch('cloudify_gcp.constants.OPERATION_STATS_PATH',
+                  str(tmpdir.join('operation_stats.json'))), \
+            patch('cloudify_gcp.constants.LOCATION_CATALOG_PATH',
+                  str(tmpdir.join('locations'))), \
+            patch('cloudify_gcp.constants.DISCOVERY_RESULTS_PATH',
+                  str(tmpdir.join('discovery_results'))), \
+            patch('cloudify_gcp.constants.KEY_POOL_PATH',
+                  str(tmpdir.join('key_pool'))), \
+            patch('cloudify_gcp.constants.DNS_CHANGE_SPOOL_PATH',
+                  str(tmpdir.join('dns_changes'))), \
+            patch('cloudify_gcp.constants.ACCESS_TOKEN_PATH',
+                  str(tmpdir.join('tokens'))), \
+            patch('cloudify_gcp.constants.SSH_KEYS_SPOOL_PATH',
+                  str(tmpdir.join('ssh_key_changes'))), \
+            patch('cloudify_gcp.key_pool.KeyPool.refill_in_background'):
+        yield
+    location_catalog.clear()
+
+
 @pytest.fixture(autouse=True)
 def patch_client():
     with patch(
             'cloudify_gcp.gcp.ServiceAccountCredentials.from_json_keyfile_dict'
             ):
         yield
+    gcp.clear_sessions()
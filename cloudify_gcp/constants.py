@@ -37,6 +37,8 @@ CLOUDRESOURCES_DISCOVERY = 'cloudresourcemanager'
 IAM_DISCOVERY = 'iam'
 
 CHUNKSIZE = 2 * 1024 * 1024
+# Maximum number of calls googleapiclient accepts in one batch request
+MAX_BATCH_SIZE = 1000
 
 API_V1 = 'v1'
 API_V2 = 'v2'
@@ -65,6 +67,7 @@ PUBLIC_KEY = 'gcp_public_key'
 PRIVATE_KEY = 'gcp_private_key'
 USER = 'user'
 SSH_KEYS = 'ssh_keys'
+PROJECT_SSH_KEY = 'gcp_project_ssh_key'
 MANAGEMENT_SECURITY_GROUP = 'management_security_group'
 MANAGER_AGENT_SECURITY_GROUP = 'manager_agent_security_group'
 AGENTS_SECURITY_GROUP = 'agents_security_group'
@@ -84,11 +87,69 @@ NAME = 'name'
 MACHINE_TYPE = 'machine_type'
 
 GCP_OP_DONE = 'DONE'
+# Seconds a synchronous operation may take before it is considered failed
+OPERATION_WAIT_DEADLINE = 30 * 60
+# Polling delays used when the operations.wait method can't be used
+OPERATION_POLL_MIN_DELAY = 1
+OPERATION_POLL_MAX_DELAY = 16
 
 MANAGER_PLUGIN_FILES = os.path.join('/etc', 'cloudify', 'gcp_plugin')
 GCP_DEFAULT_CONFIG_PATH = os.path.join(MANAGER_PLUGIN_FILES, 'gcp_config')
+# Discovery documents fetched by googleapiclient are cached on the host,
+# snapshots placed by the operator are used when the API can't be reached.
+CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'cloudify_gcp')
+DISCOVERY_CACHE_PATH = os.path.join(CACHE_PATH, 'discovery')
+DISCOVERY_SNAPSHOTS_PATH = os.path.join(MANAGER_PLUGIN_FILES, 'discovery')
+DISCOVERY_CACHE_TTL = 24 * 60 * 60
+# Zones, regions and machine types of the projects
+LOCATION_CATALOG_PATH = os.path.join(CACHE_PATH, 'locations')
+LOCATION_CATALOG_TTL = 24 * 60 * 60
+# Concurrency and rate limits of discovery listing
+DISCOVERY_MAX_WORKERS = 8
+DISCOVERY_REQUESTS_PER_SECOND = 20
+# Child deployments of discovered resources
+DEPLOYMENTS_BATCH_SIZE = 100
+DEPLOYMENTS_MAX_WORKERS = 4
+# Full bodies of discovered resources, runtime properties only get an index
+DISCOVERY_RESULTS_PATH = os.path.join(CACHE_PATH, 'discovery_results')
+# SSH keys generated ahead of time for keypair nodes
+RSA_KEY_SIZE = 2048
+KEY_POOL_PATH = os.path.join(CACHE_PATH, 'key_pool')
+KEY_POOL_SIZE = 5
+# Seconds after which the lock of a process filling the pool is ignored
+KEY_POOL_FILL_TIMEOUT = 10 * 60
+# Reads and writes of project metadata changed concurrently by others
+METADATA_UPDATE_ATTEMPTS = 5
+# Project sshKeys changes waiting to be merged into one metadata update,
+# and their results
+SSH_KEYS_SPOOL_PATH = os.path.join(CACHE_PATH, 'ssh_key_changes')
+# Seconds after which results nobody picked up are removed
+SSH_KEYS_RESULT_EXPIRY = 60 * 60
+# Seconds after which spooled changes are failed instead of being applied
+SSH_KEYS_SPOOL_EXPIRY = 10 * 60
+# Record sets per Cloud DNS change, the default quota of both additions and
+# deletions
+DNS_CHANGE_MAX_RRSETS = 100
+# Record changes waiting to be merged into change sets, and their results
+DNS_CHANGE_SPOOL_PATH = os.path.join(CACHE_PATH, 'dns_changes')
+# Seconds after which results nobody picked up are removed
+DNS_CHANGE_RESULT_EXPIRY = 60 * 60
+# Seconds after which spooled changes are failed instead of being sent
+DNS_CHANGE_SPOOL_EXPIRY = 10 * 60
+# Access tokens shared by the operations running on the host
+ACCESS_TOKEN_PATH = os.path.join(CACHE_PATH, 'tokens')
 
 RETRY_DEFAULT_DELAY = 30
+# Bounds of the retry delay estimated from operation progress and history
+RETRY_MIN_DELAY = 3
+RETRY_MAX_DELAY = 120
+OPERATION_STATS_PATH = os.path.join(CACHE_PATH, 'operation_stats.json')
+# Status of pending operations shared by all operations running on the host
+OPERATION_POLLER_PATH = os.path.join(CACHE_PATH, 'operations.json')
+# Seconds a polled operation status is reused without asking the API
+OPERATION_POLLER_MAX_AGE = 5
+# Seconds after which entries not polled anymore are forgotten
+OPERATION_POLLER_EXPIRY = 10 * 60
 
 # Cloudify create node action
 CREATE_NODE_ACTION = "cloudify.interfaces.lifecycle.create"
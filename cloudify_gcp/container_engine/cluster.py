@@ -28,6 +28,10 @@ from cloudify_gcp.container_engine import ContainerEngineBase
 
 
 class Cluster(ContainerEngineBase):
+    RUNTIME_FIELDS = ('name,selfLink,status,zone,location,endpoint,'
+                      'masterAuth,currentMasterVersion,currentNodeVersion,'
+                      'network,subnetwork,createTime')
+
     def __init__(self,
                  config,
                  logger,
@@ -73,19 +77,34 @@ class Cluster(ContainerEngineBase):
             clusterId=self.name,
             projectId=self.project, zone=self.zone).execute()
 
-    @check_response
-    def list(self):
-        response = self.discovery_container.clusters().list(
-            projectId=self.project, zone=self.zone).execute()
-        if 'clusters' in response:
-            return response['clusters']
-        return []
+    def list(self, **kwargs):
+        return self.paginate(self.discovery_container.clusters(),
+                             items_key='clusters',
+                             projectId=self.project,
+                             zone=self.zone,
+                             **kwargs)
+
+    def aggregated_list(self):
+        """
+        List clusters of every location of the project in one call.
+
+        :return: list of (location, cluster) tuples
+        """
+        self.throttle()
+        response = self.discovery.projects().locations().clusters().list(
+            parent='projects/{0}/locations/-'.format(self.project)).execute()
+        if response.get('missingZones'):
+            self.logger.warn(
+                'Clusters of zones {0} could not be listed.'.format(
+                    response['missingZones']))
+        return [(cluster['location'], cluster)
+                for cluster in response.get('clusters', [])]
 
     @check_response
-    def get(self):
+    def get(self, fields=None):
         return self.discovery_container.clusters().get(
             clusterId=self.name, projectId=self.project,
-            zone=self.zone).execute()
+            zone=self.zone, fields=fields).execute()
 
 
 @operation(resumable=True)
@@ -102,9 +121,9 @@ def create(name, additional_settings, **kwargs):
                       additional_settings=additional_settings)
 
     utils.create(cluster)
-    ctx.instance.runtime_properties.update(cluster.get())
-    ctx.instance.runtime_properties[constants.KUBERNETES_CLUSTER] = \
-        cluster.get()
+    resource = cluster.get_runtime_properties()
+    ctx.instance.runtime_properties.update(resource)
+    ctx.instance.runtime_properties[constants.KUBERNETES_CLUSTER] = resource
 
 
 @operation(resumable=True)
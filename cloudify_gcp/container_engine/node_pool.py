@@ -77,12 +77,13 @@ class NodePool(ContainerEngineBase):
             nodePoolId=self.name, zone=self.zone,
             projectId=self.project, clusterId=self.cluster_id).execute()
 
-    @check_response
-    def list(self):
-        response = self.discovery_container.nodePools().list(
-            projectId=self.project, zone=self.zone,
-            clusterId=self.cluster_id).execute()
-        return response['nodePools']
+    def list(self, **kwargs):
+        return self.paginate(self.discovery_container.nodePools(),
+                             items_key='nodePools',
+                             projectId=self.project,
+                             zone=self.zone,
+                             clusterId=self.cluster_id,
+                             **kwargs)
 
     @check_response
     def get(self):
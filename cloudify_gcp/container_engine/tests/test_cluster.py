@@ -44,6 +44,13 @@ class TestGCPCluster(TestGCP):
                                   'initialNodeCount': 1}, },
                 projectId='not really a project',
                 zone='a very fake zone')
+        # Only the declared fields are fetched, once
+        mock_build().projects().zones().clusters(
+            ).get.assert_called_once_with(
+                clusterId='valid_name',
+                projectId='not really a project',
+                zone='a very fake zone',
+                fields=cluster.Cluster.RUNTIME_FIELDS)
 
     def test_start(self, mock_build, *args):
         self.ctxmock.instance.runtime_properties['name'] = 'valid_name'
@@ -111,3 +118,23 @@ class TestGCPCluster(TestGCP):
             clusterId='valid_name',
             projectId='not really a project',
             zone='a very fake zone')
+
+    def test_aggregated_list(self, mock_build, *args):
+        clusters = mock_build.return_value.projects().locations().clusters()
+        clusters.list.return_value.execute.return_value = {
+            'clusters': [
+                {'name': 'one', 'location': 'us-east1-b'},
+                {'name': 'two', 'location': 'europe-west1'},
+            ],
+            'missingZones': ['asia-east1-a'],
+        }
+        instance = cluster.Cluster(self.ctxmock.node.properties[
+            'gcp_config'], self.ctxmock.logger, 'valid_name')
+
+        self.assertEqual(
+            [('us-east1-b', {'name': 'one', 'location': 'us-east1-b'}),
+             ('europe-west1', {'name': 'two', 'location': 'europe-west1'})],
+            instance.aggregated_list())
+        clusters.list.assert_called_once_with(
+            parent='projects/not really a project/locations/-')
+        instance.logger.warn.assert_called_once()
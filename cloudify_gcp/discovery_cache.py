@@ -0,0 +1,96 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+from threading import Lock
+
+from googleapiclient.discovery_cache.base import Cache
+
+from . import constants
+from .local_cache import read_file, write_file_atomic
+
+# (service, version) -> (timestamp, content), shared by the whole process
+_documents = {}
+_documents_lock = Lock()
+
+
+def _document_file_name(service, version):
+    return '{0}.{1}.json'.format(service, version)
+
+
+class DiscoveryDocumentCache(Cache):
+    """
+    googleapiclient discovery cache keyed by (service, version).
+
+    Documents are kept in process memory and in a host-wide directory, both
+    valid for `ttl` seconds. With `offline` set, stale documents and operator
+    provided snapshots are returned too, which lets `build` work when the
+    discovery service can't be reached.
+    """
+
+    def __init__(self, service, version,
+                 path=constants.DISCOVERY_CACHE_PATH,
+                 snapshots_path=constants.DISCOVERY_SNAPSHOTS_PATH,
+                 ttl=constants.DISCOVERY_CACHE_TTL,
+                 offline=False):
+        self.key = (service, version)
+        self.file_name = _document_file_name(service, version)
+        self.path = path
+        self.snapshots_path = snapshots_path
+        self.ttl = ttl
+        self.offline = offline
+
+    def _is_fresh(self, timestamp):
+        return self.offline or time.time() - timestamp < self.ttl
+
+    def get(self, url):
+        with _documents_lock:
+            timestamp, content = _documents.get(self.key, (0, None))
+        if content and self._is_fresh(timestamp):
+            return content
+
+        cache_file = os.path.join(self.path, self.file_name)
+        try:
+            timestamp = os.path.getmtime(cache_file)
+        except OSError:
+            timestamp = None
+        if timestamp is not None and self._is_fresh(timestamp):
+            content = read_file(cache_file)
+            if content:
+                with _documents_lock:
+                    _documents[self.key] = (timestamp, content)
+                return content
+
+        if self.offline:
+            return read_file(
+                os.path.join(self.snapshots_path, self.file_name))
+        return None
+
+    def set(self, url, content):
+        with _documents_lock:
+            _documents[self.key] = (time.time(), content)
+        try:
+            write_file_atomic(
+                os.path.join(self.path, self.file_name), content)
+        except (IOError, OSError):
+            # The host cache is an optimisation only, memory still has it.
+            pass
+
+
+def clear():
+    """Drop every document held in process memory."""
+    with _documents_lock:
+        _documents.clear()
@@ -13,16 +13,33 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import json
+import time
+import binascii
 from time import sleep
 
 from cloudify import ctx
 from cloudify.decorators import operation
 from cloudify.exceptions import NonRecoverableError
+from httplib2 import Response
+from googleapiclient.errors import HttpError
 
 from .. import utils
 from .. import constants
+from ..gcp import GCPError
+from ..local_cache import (
+    file_lock,
+    read_json,
+    write_file_atomic,
+    is_process_running,
+)
 from .dns import DNSZone
 
+CHANGE_SUFFIX = '.change'
+RESULT_SUFFIX = '.result'
+LOCK_FILE = 'lock'
+
 
 def get_current_records(zone, name=None, type=None):
     """Expects a DNSZone object and the DNS name and record type to filter
@@ -41,8 +58,14 @@ def generate_changes(dns_zone, action, data):
 
 
 def wait_for_change_completion(dns_zone, response):
+    """
+    Poll the change until it isn't pending, with exponentially growing
+    delay, as most changes are done within a few seconds.
+    """
+    delay = constants.OPERATION_POLL_MIN_DELAY
     while response['status'] == 'pending':
-        sleep(3)
+        sleep(delay)
+        delay = min(delay * 2, constants.OPERATION_POLL_MAX_DELAY)
         response = dns_zone.discovery.changes().get(
                 project=utils.get_gcp_config()['project'],
                 managedZone=dns_zone.name,
@@ -51,6 +74,207 @@ def wait_for_change_completion(dns_zone, response):
     return response
 
 
+class ChangeSets(object):
+    """
+    Merge record changes of the same managed zone made by the operations
+    running on this host, each in its own process.
+
+    A change is spooled as a file in the directory of its zone. Whichever
+    operation gets the lock of the zone first sends the oldest spooled
+    changes (up to `max_size` record sets) as one change set and stores the
+    result of every change next to it. The others find their result once
+    they get the lock, or send the next change set.
+
+    Change sets are applied atomically, if a merged one fails its changes
+    are applied one by one, so every record gets its own result.
+
+    Changes spooled by a process which isn't running anymore, or spooled
+    too long ago, are failed instead of being sent.
+    """
+
+    def __init__(self, path=None, max_size=None):
+        self._path = path
+        self.max_size = max_size or constants.DNS_CHANGE_MAX_RRSETS
+
+    @property
+    def path(self):
+        return self._path or constants.DNS_CHANGE_SPOOL_PATH
+
+    def zone_path(self, dns_zone):
+        return os.path.join(self.path, dns_zone.project, dns_zone.name)
+
+    def submit(self, dns_zone, additions=(), deletions=()):
+        """
+        :param dns_zone: DNSZone object of the records
+        :param additions: record sets to be added
+        :param deletions: record sets to be deleted
+        :return: final response of the change set containing the change
+        """
+        return self.wait(dns_zone, self.spool(dns_zone, additions, deletions))
+
+    def spool(self, dns_zone, additions=(), deletions=()):
+        """
+        :return: name of the spooled change
+        """
+        name = '{0:.6f}-{1}-{2}'.format(
+            time.time(), os.getpid(),
+            binascii.hexlify(os.urandom(4)).decode('ascii'))
+        write_file_atomic(
+            os.path.join(self.zone_path(dns_zone), name + CHANGE_SUFFIX),
+            json.dumps({'owner': os.getpid(),
+                        'time': time.time(),
+                        'additions': list(additions),
+                        'deletions': list(deletions)}))
+        return name
+
+    def wait(self, dns_zone, name):
+        """
+        Wait for the result of the spooled change, sending change sets
+        while it is pending.
+
+        :return: final response of the change set containing the change
+        """
+        directory = self.zone_path(dns_zone)
+        change_path = os.path.join(directory, name + CHANGE_SUFFIX)
+        result_path = os.path.join(directory, name + RESULT_SUFFIX)
+        with file_lock(os.path.join(directory, LOCK_FILE)):
+            result = read_json(result_path)
+            while result is None:
+                if not os.path.exists(change_path):
+                    raise GCPError(
+                        'DNS change {0} of zone {1} was lost'.format(
+                            name, dns_zone.name))
+                self.write(dns_zone, directory)
+                result = read_json(result_path)
+            os.unlink(result_path)
+        return self.get_response(result)
+
+    def write(self, dns_zone, directory):
+        """Send the oldest spooled changes as one change set."""
+        names = sorted(
+            filename[:-len(CHANGE_SUFFIX)]
+            for filename in os.listdir(directory)
+            if filename.endswith(CHANGE_SUFFIX))
+        changes = []
+        size = 0
+        for name in names:
+            change = read_json(os.path.join(directory, name + CHANGE_SUFFIX))
+            if change is None:
+                continue
+            error = self.get_stale_error(change)
+            if error:
+                dns_zone.logger.warn(
+                    'Not sending DNS change {0}: {1}'.format(name, error))
+                self.write_result(directory, name, {'error': error})
+                continue
+            change_size = len(change['additions']) + len(change['deletions'])
+            if changes and size + change_size > self.max_size:
+                break
+            changes.append((name, change))
+            size += change_size
+
+        if changes:
+            results = self.apply_changes(dns_zone, [c for _, c in changes])
+            for (name, _), result in zip(changes, results):
+                self.write_result(directory, name, result)
+        self.remove_expired(directory)
+
+    @staticmethod
+    def write_result(directory, name, result):
+        """Store the result of the change in place of the change."""
+        write_file_atomic(
+            os.path.join(directory, name + RESULT_SUFFIX),
+            json.dumps(result))
+        os.unlink(os.path.join(directory, name + CHANGE_SUFFIX))
+
+    @staticmethod
+    def get_stale_error(change):
+        """
+        :return: why the spooled change mustn't be sent anymore, None if it
+        can be sent
+        """
+        owner = change.get('owner')
+        if not owner or not is_process_running(owner):
+            return 'the operation which requested it is gone'
+        if time.time() - change.get('time', 0) > \
+                constants.DNS_CHANGE_SPOOL_EXPIRY:
+            return 'requested more than {0} seconds ago'.format(
+                constants.DNS_CHANGE_SPOOL_EXPIRY)
+        return None
+
+    def remove_expired(self, directory):
+        """Remove results of operations which didn't wait for them."""
+        now = time.time()
+        for filename in os.listdir(directory):
+            path = os.path.join(directory, filename)
+            if filename.endswith(RESULT_SUFFIX) and \
+                    now - os.path.getmtime(path) > \
+                    constants.DNS_CHANGE_RESULT_EXPIRY:
+                os.unlink(path)
+
+    def apply_changes(self, dns_zone, changes):
+        """
+        :return: list of the results of the changes, see get_result
+        """
+        if len(changes) > 1:
+            dns_zone.logger.info(
+                'Sending changes of {0} records in one change set'.format(
+                    len(changes)))
+            try:
+                response = self.apply(dns_zone, changes)
+            except (HttpError, GCPError, NonRecoverableError) as e:
+                dns_zone.logger.warn(
+                    'Change set failed, sending the changes one by one: '
+                    '{0}'.format(e))
+            else:
+                return [{'response': response} for _ in changes]
+
+        results = []
+        for change in changes:
+            try:
+                results.append(
+                    {'response': self.apply(dns_zone, [change])})
+            except HttpError as e:
+                results.append({
+                    'error': str(e),
+                    'status': e.resp.status,
+                    'content': e.content.decode('utf-8', 'replace'),
+                })
+            except Exception as e:
+                results.append({'error': str(e)})
+        return results
+
+    def apply(self, dns_zone, changes):
+        body = {}
+        for change in changes:
+            for action in 'additions', 'deletions':
+                body.setdefault(action, []).extend(change[action])
+        response = dns_zone.discovery.changes().create(
+                project=dns_zone.project,
+                managedZone=dns_zone.name,
+                body=dict(
+                    (action, data) for action, data in body.items() if data),
+                ).execute()
+        response = wait_for_change_completion(dns_zone, response)
+        if response['status'] != 'done':
+            raise NonRecoverableError('unexpected response status: {}'.format(
+                response))
+        return response
+
+    @staticmethod
+    def get_response(result):
+        """Return the response of a stored result, or raise its error."""
+        if 'response' in result:
+            return result['response']
+        if result.get('status'):
+            raise HttpError(Response({'status': result['status']}),
+                            result['content'].encode('utf-8'))
+        raise GCPError(result['error'])
+
+
+change_sets = ChangeSets()
+
+
 def creation_validation(*args, **kwargs):
     rels = ctx.instance.relationships
 
@@ -140,18 +364,12 @@ def create(type, name, resources, ttl, **kwargs):
             item_path)
         resources.append(item)
 
-    response = generate_changes(dns_zone, 'additions', [{
+    change_sets.submit(dns_zone, additions=[{
             "name": '{}.{}'
                     .format(name, zone.runtime_properties['dnsName']),
             "ttl": ttl,
             "type": type,
-            "rrdatas": resources}]).execute()
-
-    response = wait_for_change_completion(dns_zone, response)
-
-    if response['status'] != 'done':
-        raise NonRecoverableError('unexpected response status: {}'.format(
-            response))
+            "rrdatas": resources}])
 
     ctx.instance.runtime_properties['created'] = True
 
@@ -181,9 +399,8 @@ def delete(**_):
                 type=ctx.node.properties['type'],
                 )
 
-        wait_for_change_completion(
-                dns_zone,
-                generate_changes(dns_zone, 'deletions', rrsets).execute())
+        if rrsets:
+            change_sets.submit(dns_zone, deletions=rrsets)
 
         ctx.instance.runtime_properties.pop('created', None)
 
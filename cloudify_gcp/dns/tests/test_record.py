@@ -14,12 +14,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import sys
+import json
+import time
+import subprocess
+
 from mock import Mock, patch
+from googleapiclient.errors import HttpError
 
 from .. import record
+from ...gcp import GCPError
 from ...tests import TestGCP
+from ...tests.test_utils import NS
 
 
+@patch('cloudify_gcp.dns.record.sleep')
 @patch('cloudify_gcp.gcp.ServiceAccountCredentials.from_json_keyfile_dict')
 @patch('cloudify_gcp.utils.get_gcp_resource_name', return_value='valid_name')
 @patch('cloudify_gcp.gcp.build')
@@ -142,3 +152,104 @@ class TestGCPRecord(TestGCP):
         record.delete()
 
         mock_build.assert_not_called()
+
+    def test_wait_backoff(self, mock_build, *args):
+        mock_sleep = args[-1]
+        dns_zone = Mock()
+        dns_zone.discovery.changes().get().execute.side_effect = [
+                {'status': 'pending', 'id': 'c'},
+                {'status': 'pending', 'id': 'c'},
+                {'status': 'done', 'id': 'c'},
+                ]
+
+        self.assertEqual(
+                {'status': 'done', 'id': 'c'},
+                record.wait_for_change_completion(
+                    dns_zone, {'status': 'pending', 'id': 'c'}))
+        self.assertEqual(
+                [1, 2, 4], [c[0][0] for c in mock_sleep.call_args_list])
+
+
+class TestChangeSets(TestGCP):
+
+    def setUp(self):
+        super(TestChangeSets, self).setUp()
+        self.dns_zone = Mock(project='proj')
+        self.dns_zone.name = 'zone'
+        self.create = self.dns_zone.discovery.changes.return_value.create
+        self.create.return_value.execute.return_value = {'status': 'done'}
+
+    def test_merged(self):
+        change_sets = record.ChangeSets()
+        # Spooled by operations running in other processes
+        other = change_sets.spool(self.dns_zone, additions=['a'])
+        change_sets.spool(self.dns_zone, deletions=['c'])
+
+        self.assertEqual(
+            {'status': 'done'},
+            change_sets.submit(self.dns_zone, additions=['b']))
+
+        self.create.assert_called_once_with(
+            project='proj', managedZone='zone',
+            body={'additions': ['a', 'b'], 'deletions': ['c']})
+        # The others find their result without sending anything
+        self.assertEqual(
+            {'status': 'done'}, change_sets.wait(self.dns_zone, other))
+        self.create.assert_called_once()
+
+    def test_max_size(self):
+        change_sets = record.ChangeSets(max_size=2)
+        for name in 'abc':
+            change_sets.spool(self.dns_zone, additions=[name])
+
+        change_sets.submit(self.dns_zone, additions=['d'])
+
+        self.assertEqual(
+            [['a', 'b'], ['c', 'd']],
+            [c[1]['body']['additions'] for c in self.create.call_args_list])
+
+    def test_failed_change_set(self):
+        def create(body, **kwargs):
+            request = Mock()
+            if len(body['additions']) > 1 or body['additions'] == ['bad']:
+                request.execute.side_effect = HttpError(
+                    NS(status=409), b'exists')
+            else:
+                request.execute.return_value = {'status': 'done'}
+            return request
+        self.create.side_effect = create
+        change_sets = record.ChangeSets()
+        bad = change_sets.spool(self.dns_zone, additions=['bad'])
+
+        self.assertEqual(
+            {'status': 'done'},
+            change_sets.submit(self.dns_zone, additions=['good']))
+
+        # The merged change set, then each change on its own
+        self.assertEqual(3, self.create.call_count)
+        with self.assertRaises(HttpError) as e:
+            change_sets.wait(self.dns_zone, bad)
+        self.assertEqual(409, e.exception.resp.status)
+
+    def test_stale_changes(self):
+        change_sets = record.ChangeSets()
+        # Left by a process which died before getting its result
+        process = subprocess.Popen([sys.executable, '-c', ''])
+        process.wait()
+        gone = change_sets.spool(self.dns_zone, additions=['gone'])
+        old = change_sets.spool(self.dns_zone, additions=['old'])
+        directory = change_sets.zone_path(self.dns_zone)
+        for name, change in (
+                (gone, {'owner': process.pid, 'time': time.time()}),
+                (old, {'owner': os.getpid(), 'time': 0})):
+            change.update(additions=[name], deletions=[])
+            with open(os.path.join(
+                    directory, name + record.CHANGE_SUFFIX), 'w') as f:
+                json.dump(change, f)
+
+        change_sets.submit(self.dns_zone, additions=['b'])
+
+        self.create.assert_called_once_with(
+            project='proj', managedZone='zone', body={'additions': ['b']})
+        with self.assertRaises(GCPError):
+            change_sets.wait(self.dns_zone, old)
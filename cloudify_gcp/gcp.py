@@ -13,7 +13,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import copy
+import json
+import errno
+import socket
+import hashlib
+from datetime import datetime
 from functools import wraps
+from threading import Lock, local
 from os.path import basename
 
 import httplib2
@@ -21,11 +29,116 @@ from Crypto.Random import atfork
 from httplib2 import ServerNotFoundError
 from googleapiclient.errors import HttpError
 from googleapiclient.discovery import build
+from oauth2client.client import Storage
 from oauth2client.service_account import ServiceAccountCredentials
 
 from cloudify.exceptions import OperationRetry
 
 from . import constants
+from . import local_cache
+from . import location_catalog
+from .pagination import iter_items
+from .discovery_cache import DiscoveryDocumentCache
+
+
+# (credentials fingerprint, scopes) -> authorized credentials. Credentials
+# cache their access token until it expires, so sharing them avoids an OAuth
+# exchange per resource object. Every operation runs in its own process, the
+# token is passed between them by TokenStorage. httplib2.Http is not thread
+# safe, so the keep-alive connections are shared per thread only.
+_sessions = {}
+_sessions_lock = Lock()
+_session_connections = local()
+
+
+def get_session_key(auth, scope):
+    """
+    Build the key under which an authorized session is shared.
+
+    :param auth: service account dict or path to its JSON file
+    :param scope: scope string or list of scopes
+    :return: tuple of (credentials fingerprint, scopes)
+    """
+    if hasattr(auth, 'get'):
+        auth = json.dumps(auth, sort_keys=True)
+    fingerprint = hashlib.sha256(auth.encode('utf-8')).hexdigest()
+    if isinstance(scope, (list, tuple)):
+        scopes = tuple(sorted(scope))
+    else:
+        scopes = (scope,)
+    return fingerprint, scopes
+
+
+class TokenStorage(Storage):
+    """
+    Access token of the credentials kept in a file of the host, so the
+    operations, each running in its own process, reuse it until it expires
+    instead of each doing an OAuth exchange. Only the token and its expiry
+    are stored, in a file readable by the agent user only.
+    """
+    EXPIRY_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+    def __init__(self, credentials, key):
+        """
+        :param credentials: credentials the token is read into
+        :param key: session key, see get_session_key
+        """
+        super(TokenStorage, self).__init__()
+        self.credentials = credentials
+        self.path = os.path.join(
+            constants.ACCESS_TOKEN_PATH,
+            hashlib.sha256(repr(key).encode('utf-8')).hexdigest())
+        self._lock = None
+
+    def acquire_lock(self):
+        try:
+            os.makedirs(constants.ACCESS_TOKEN_PATH, 0o700)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        self._lock = local_cache.file_lock(self.path + '.lock')
+        self._lock.__enter__()
+
+    def release_lock(self):
+        lock, self._lock = self._lock, None
+        lock.__exit__(None, None, None)
+
+    def locked_get(self):
+        data = local_cache.read_json(self.path)
+        if not data:
+            return None
+        credentials = copy.copy(self.credentials)
+        credentials.access_token = data['access_token']
+        credentials.token_expiry = None
+        if data['token_expiry']:
+            credentials.token_expiry = datetime.strptime(
+                data['token_expiry'], self.EXPIRY_FORMAT)
+        credentials.invalid = False
+        return credentials
+
+    def locked_put(self, credentials):
+        if credentials.invalid or not credentials.access_token:
+            return self.locked_delete()
+        expiry = None
+        if credentials.token_expiry:
+            expiry = credentials.token_expiry.strftime(self.EXPIRY_FORMAT)
+        local_cache.write_json(self.path, {
+            'access_token': credentials.access_token,
+            'token_expiry': expiry,
+        })
+
+    def locked_delete(self):
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+def clear_sessions():
+    """Forget all shared credentials and connections."""
+    with _sessions_lock:
+        _sessions.clear()
+    _session_connections.__dict__.clear()
 
 
 def check_response(func):
@@ -72,6 +185,8 @@ class GoogleCloudApi(object):
         self.scope = scope
         self.__discovery = discovery
         self.api_version = api_version
+        # Called before each page of a list call, see throttle
+        self.before_request = None
 
     @property
     def discovery(self):
@@ -84,11 +199,52 @@ class GoogleCloudApi(object):
                                                 self.api_version)
         return self._discovery
 
+    @discovery.setter
+    def discovery(self, discovery):
+        """
+        Use a discovery object built for the same API, project and
+        credentials, e.g. to send requests of several objects in one batch.
+        """
+        self._discovery = discovery
+
+    def throttle(self):
+        """
+        Call the before_request hook, e.g. the rate limiter of a resource
+        scan, before a list request is sent.
+        """
+        if self.before_request is not None:
+            self.before_request()
+
     def get_credentials(self, scope):
         raise GCPError(
             "Please implement {}: {}".format(__name__, repr(scope))
         )
 
+    def get_http(self, scope):
+        """
+        Get an authorized HTTP connection from the shared session registry,
+        creating the credentials only for the first user of the session.
+        The access token is shared with the other processes of the host
+        through TokenStorage.
+
+        :param scope: scope the connection will have
+        :return: authorized httplib2.Http object
+        """
+        key = get_session_key(self.auth, scope)
+        http = _session_connections.__dict__.get(key)
+        if http is not None:
+            return http
+
+        with _sessions_lock:
+            credentials = _sessions.get(key)
+            if credentials is None:
+                credentials = _sessions[key] = self.get_credentials(scope)
+                credentials.set_store(TokenStorage(credentials, key))
+        http = httplib2.Http()
+        credentials.authorize(http)
+        _session_connections.__dict__[key] = http
+        return http
+
     def create_discovery(self, discovery, scope, api_version):
         """
         Create Google Cloud API discovery object and perform authentication.
@@ -105,10 +261,20 @@ class GoogleCloudApi(object):
         atfork()
 
         try:
-            credentials = self.get_credentials(scope)
-            http = httplib2.Http()
-            credentials.authorize(http)
-            return build(discovery, api_version, http=http)
+            http = self.get_http(scope)
+            cache = DiscoveryDocumentCache(discovery, api_version)
+            try:
+                return build(discovery, api_version, http=http, cache=cache)
+            except (ServerNotFoundError, socket.error, HttpError) as e:
+                # Discovery service unreachable, use whatever document we
+                # already have for this API, however old it is.
+                cache.offline = True
+                if not cache.get(None):
+                    raise
+                self.logger.warning(
+                    'Unable to fetch {0} {1} discovery document, using '
+                    'cached copy: {2}'.format(discovery, api_version, e))
+                return build(discovery, api_version, http=http, cache=cache)
         except IOError as e:
             self.logger.error(str(e))
             raise GCPError(str(e))
@@ -120,6 +286,10 @@ class GoogleCloudPlatform(GoogleCloudApi):
     Platform.
     """
 
+    # Partial response mask of the fields kept in runtime properties, e.g.
+    # "name,selfLink". None keeps the whole resource.
+    RUNTIME_FIELDS = None
+
     def __init__(self, config, logger, name,
                  additional_settings=None,
                  scope=constants.COMPUTE_SCOPE,
@@ -170,24 +340,151 @@ class GoogleCloudPlatform(GoogleCloudApi):
             project=self.project).execute()
         return metadata['commonInstanceMetadata']
 
+    def get_runtime_properties(self):
+        """
+        Get the resource to be stored in runtime properties, only the
+        RUNTIME_FIELDS of it if the class declares them. Classes declaring
+        RUNTIME_FIELDS accept a fields argument in their get method.
+
+        :return: REST response with the resource details
+        """
+        if self.RUNTIME_FIELDS:
+            return self.get(fields=self.RUNTIME_FIELDS)
+        return self.get()
+
     @property
     def ZONES(self):
-        if not hasattr(self, '_ZONES'):
-            zones = {}
-            request = self.discovery.zones().list(project=self.project)
-            while request is not None:
-                response = request.execute()
-
-                for zone in response['items']:
-                    zones[zone['name']] = zone
-                    zone['region_name'] = basename(zone['region'])
-
-                request = self.discovery.zones().list_next(
-                    previous_request=request,
-                    previous_response=response)
-
-        self._ZONES = zones
-        return self._ZONES
+        """
+        Zones of the project by name, each with region_name added. Shared
+        by all objects of the process, see location_catalog.
+        """
+        return location_catalog.get_catalog(self.project).zones(
+            self.discovery)
+
+    def get_region(self, zone):
+        """
+        Get name of the region the zone is in.
+
+        :param zone: zone name or URL
+        :return: region name
+        """
+        found = self.ZONES.get(basename(zone or ''))
+        if not found:
+            raise GCPError('Zone {0} not found in project {1}'.format(
+                zone, self.project))
+        return found['region_name']
+
+    def paginate(self, collection, method='list', items_key='items',
+                 fields=None, **kwargs):
+        """
+        Iterate over the items of every page of a list call. Pages are
+        requested lazily, so only one of them is held in memory.
+
+        :param collection: discovery collection, e.g. discovery.instances()
+        :param method: name of the list method
+        :param items_key: key of the items in the response
+        :param fields: partial response mask of a single item
+        :param kwargs: list method arguments, e.g. filter or maxResults
+        :return: generator of items
+        """
+        def check(response):
+            if 'error' in response:
+                self.logger.error('Response with error {0}'
+                                  .format(response['error']))
+                raise GCPError(response['error'])
+
+        try:
+            for item in iter_items(collection, method, items_key, fields,
+                                   check, self.throttle, **kwargs):
+                yield item
+        except ServerNotFoundError as e:
+            raise OperationRetry(
+                'Warning: {0}. '
+                'If problem persists, error may be fatal.'.format(e))
+
+
+class BatchRequest(object):
+    """
+    Collect API requests and send them in as few HTTP round trips as possible
+    using googleapiclient batch requests.
+
+    Requests are added under a key (usually the resource name). After
+    `execute` each key maps to its response in `responses` or to the
+    exception raised for it in `errors`, so one failing call doesn't affect
+    the others.
+    """
+
+    def __init__(self, discovery, logger,
+                 max_size=constants.MAX_BATCH_SIZE,
+                 check_responses=True):
+        """
+        :param discovery: discovery object the requests were built with
+        :param logger: logger object
+        :param max_size: maximum number of calls sent in one round trip
+        :param check_responses: treat responses containing 'error' as
+        errors, like the check_response decorator does
+        """
+        self.discovery = discovery
+        self.logger = logger
+        self.max_size = max_size
+        self.check_responses = check_responses
+        self.requests = []
+        self.responses = {}
+        self.errors = {}
+
+    def __len__(self):
+        return len(self.requests)
+
+    def add(self, key, request):
+        """
+        Add request built (but not executed) by a resource object.
+
+        :param key: key the result will be stored under
+        :param request: googleapiclient HttpRequest object
+        """
+        self.requests.append((key, request))
+
+    def _callback(self, request_id, response, exception):
+        key = self.requests[int(request_id)][0]
+        if exception is not None:
+            self.errors[key] = exception
+        elif self.check_responses and 'error' in response:
+            self.logger.error('Response with error {0}'
+                              .format(response['error']))
+            self.errors[key] = GCPError(response['error'])
+        else:
+            self.responses[key] = response
+
+    def execute(self):
+        """
+        Send all added requests, at most `max_size` per round trip.
+
+        :return: dictionary of key: response for successful calls
+        """
+        for start in range(0, len(self.requests), self.max_size):
+            batch = self.discovery.new_batch_http_request(
+                callback=self._callback)
+            for index in range(start,
+                               min(start + self.max_size, len(self.requests))):
+                batch.add(self.requests[index][1], request_id=str(index))
+            try:
+                batch.execute()
+            except ServerNotFoundError as e:
+                raise OperationRetry(
+                    'Warning: {0}. '
+                    'If problem persists, error may be fatal.'.format(e))
+
+        for key, _ in self.requests:
+            if key not in self.responses and key not in self.errors:
+                self.errors[key] = GCPError(
+                    'No response received for {0}'.format(key))
+        return self.responses
+
+    def raise_first_error(self):
+        """Raise the error of the first failed request, if any."""
+        for key, _ in self.requests:
+            if key in self.errors:
+                raise self.errors[key]
 
 
 class GCPError(Exception):
@@ -79,11 +79,11 @@ class Role(IAMBase):
         return self.discovery.projects().roles().delete(
             name=self.name_for_retrieval).execute()
 
-    @check_response
-    def list(self):
-        response = self.discovery.projects().roles().list(
-            parent=self.parent).execute()
-        return response['roles']
+    def list(self, **kwargs):
+        return self.paginate(self.discovery.projects().roles(),
+                             items_key='roles',
+                             parent=self.parent,
+                             **kwargs)
 
     @check_response
     def get(self):
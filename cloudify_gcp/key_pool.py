@@ -0,0 +1,214 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Pool of SSH keys generated ahead of time, so creating a keypair doesn't wait
+for the key generation.
+
+Each key is a file on the host readable only by the agent user, in a
+directory only the agent user can access. A key is taken by renaming its
+file, so concurrent operations never get the same key. Taking a key starts
+a background process refilling the pool.
+"""
+
+import os
+import sys
+import time
+import errno
+import binascii
+import subprocess
+
+from Crypto.PublicKey import ECC, RSA
+
+from . import constants
+
+RSA_KEY = 'rsa'
+ECDSA_KEY = 'ecdsa'
+KEY_TYPES = (RSA_KEY, ECDSA_KEY)
+FILL_LOCK = 'fill.lock'
+KEY_SUFFIX = '.pem'
+
+
+def generate_key(key_type):
+    """
+    :param key_type: RSA_KEY or ECDSA_KEY
+    :return: new private key object
+    """
+    if key_type == RSA_KEY:
+        return RSA.generate(constants.RSA_KEY_SIZE)
+    if key_type == ECDSA_KEY:
+        return ECC.generate(curve='P-256')
+    raise ValueError('Unsupported key type {0}'.format(key_type))
+
+
+def export_keys(key_type, key):
+    """
+    :param key_type: RSA_KEY or ECDSA_KEY
+    :param key: private key object
+    :return: (private key PEM, OpenSSH public key) strings
+    """
+    if key_type == RSA_KEY:
+        private_key = key.export_key('PEM')
+        public_key = key.publickey().export_key('OpenSSH')
+    else:
+        # SEC1 "EC PRIVATE KEY", which SSH clients read
+        private_key = key.export_key(format='PEM', use_pkcs8=False)
+        public_key = key.public_key().export_key(format='OpenSSH')
+    return tuple(value.decode('utf-8') if isinstance(value, bytes) else value
+                 for value in (private_key, public_key))
+
+
+def _import_key(key_type, data):
+    key_class = RSA if key_type == RSA_KEY else ECC
+    return key_class.import_key(data)
+
+
+def _write_new(path, content, mode=0o600):
+    """Create the file, fail if it exists."""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, mode)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(content if isinstance(content, bytes)
+                else content.encode('utf-8'))
+
+
+class KeyPool(object):
+    """
+    Keys of one type in a directory of the host.
+
+    :param key_type: RSA_KEY or ECDSA_KEY
+    :param path: directory of the pools, constants.KEY_POOL_PATH by default
+    :param size: number of keys kept ready
+    """
+
+    def __init__(self, key_type, path=None, size=None):
+        if key_type not in KEY_TYPES:
+            raise ValueError('Unsupported key type {0}'.format(key_type))
+        self.key_type = key_type
+        self.root = path or constants.KEY_POOL_PATH
+        self.path = os.path.join(self.root, key_type)
+        self.size = constants.KEY_POOL_SIZE if size is None else size
+
+    def _ensure_dirs(self):
+        # makedirs applies the mode to the last directory only
+        for path in self.root, self.path:
+            if not os.path.isdir(path):
+                try:
+                    os.makedirs(path, 0o700)
+                except OSError as e:
+                    if e.errno != errno.EEXIST:
+                        raise
+
+    def keys(self):
+        """Names of the key files ready to be taken."""
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return []
+        return sorted(name for name in names if name.endswith(KEY_SUFFIX))
+
+    def add(self, key):
+        """Add the key to the pool."""
+        self._ensure_dirs()
+        name = '{0:.6f}-{1}-{2}{3}'.format(
+            time.time(), os.getpid(),
+            binascii.hexlify(os.urandom(4)).decode('ascii'), KEY_SUFFIX)
+        tmp_path = os.path.join(self.path, name + '.tmp')
+        _write_new(tmp_path, export_keys(self.key_type, key)[0])
+        os.rename(tmp_path, os.path.join(self.path, name))
+
+    def take(self):
+        """
+        Take a key from the pool, generate one if the pool is empty.
+
+        :return: private key object
+        """
+        for name in self.keys():
+            path = os.path.join(self.path, name)
+            claimed = '{0}.{1}.taken'.format(path, os.getpid())
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                # Taken by another operation meanwhile
+                continue
+            try:
+                with open(claimed, 'rb') as f:
+                    return _import_key(self.key_type, f.read())
+            except (IOError, ValueError, IndexError, TypeError):
+                # Unreadable, e.g. encrypted by an older version
+                continue
+            finally:
+                os.unlink(claimed)
+        return generate_key(self.key_type)
+
+    def fill(self):
+        """
+        Generate keys until the pool holds `size` of them. Only one process
+        fills a pool at a time.
+        """
+        self._ensure_dirs()
+        lock = os.path.join(self.path, FILL_LOCK)
+        try:
+            _write_new(lock, str(os.getpid()))
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+            try:
+                age = time.time() - os.path.getmtime(lock)
+            except OSError:
+                return
+            if age < constants.KEY_POOL_FILL_TIMEOUT:
+                return
+            # Left behind by a process which died
+            os.unlink(lock)
+            return self.fill()
+        try:
+            while len(self.keys()) < self.size:
+                self.add(generate_key(self.key_type))
+        finally:
+            os.unlink(lock)
+
+    def refill_in_background(self):
+        """Start a process filling the pool, without waiting for it."""
+        if len(self.keys()) >= self.size:
+            return
+        with open(os.devnull, 'wb') as devnull:
+            subprocess.Popen(
+                [sys.executable, '-m', __name__, self.key_type, self.root],
+                stdin=devnull, stdout=devnull, stderr=devnull,
+                close_fds=True)
+
+
+def take_key(key_type, logger=None):
+    """
+    Take a key of the type from the host's pool and refill the pool in the
+    background. Failures of the pool fall back to generating the key.
+
+    :param key_type: RSA_KEY or ECDSA_KEY
+    :param logger: logger for pool failures
+    :return: private key object
+    """
+    pool = KeyPool(key_type)
+    try:
+        key = pool.take()
+        pool.refill_in_background()
+    except (IOError, OSError) as e:
+        if logger:
+            logger.warn('SSH key pool not used: {0}'.format(e))
+        key = generate_key(key_type)
+    return key
+
+
+if __name__ == '__main__':
+    KeyPool(sys.argv[1], sys.argv[2]).fill()
@@ -0,0 +1,162 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Helpers for files the plugin keeps on the local host between operations"""
+
+import os
+import json
+import errno
+import tempfile
+from threading import Lock
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Not on Windows, processes aren't synchronized there
+    fcntl = None
+
+_process_lock = Lock()
+
+
+def read_file(path):
+    """
+    Read the whole file.
+
+    :param path: path of the file
+    :return: file content, None if the file can't be read
+    """
+    try:
+        with open(path, 'r') as f:
+            return f.read()
+    except (IOError, OSError):
+        return None
+
+
+def write_file_atomic(path, content):
+    """
+    Replace the file at path in a single rename, so concurrent readers on the
+    host never see a partially written file.
+
+    :param path: path of the file
+    :param content: string to be written
+    """
+    write_lines_atomic(path, [content])
+
+
+def write_lines_atomic(path, lines):
+    """
+    Like write_file_atomic, writing the strings one by one as the iterable
+    produces them.
+
+    :param path: path of the file
+    :param lines: iterable of strings, including their line endings
+    """
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            for line in lines:
+                f.write(line)
+        os.rename(tmp_path, path)
+    except (IOError, OSError):
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def read_json(path, default=None):
+    """
+    Load JSON file.
+
+    :param path: path of the file
+    :param default: returned when the file is missing or invalid
+    :return: loaded object
+    """
+    content = read_file(path)
+    if content is None:
+        return default
+    try:
+        return json.loads(content)
+    except ValueError:
+        return default
+
+
+def write_json(path, data):
+    """
+    Atomically store data as JSON. The cache is an optimisation only, so a
+    failure to write it is ignored.
+
+    :param path: path of the file
+    :param data: JSON serializable object
+    :return: True if the file was written
+    """
+    try:
+        write_file_atomic(path, json.dumps(data))
+    except (IOError, OSError):
+        return False
+    return True
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Hold an exclusive lock shared by the processes of the host, e.g. around
+    a read-modify-write of a file. The lock file is created when missing.
+    Where it can't be (or on Windows) only the threads of this process are
+    synchronized.
+
+    :param path: path of the lock file
+    """
+    fd = None
+    if fcntl is not None:
+        try:
+            directory = os.path.dirname(path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        except (IOError, OSError):
+            fd = None
+    if fd is None:
+        with _process_lock:
+            yield
+        return
+    try:
+        # flock locks belong to the open file, so threads of the process
+        # holding separate descriptors exclude each other too
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def is_process_running(pid):
+    """
+    Check if the process of this host is still running, e.g. the owner of
+    a file it left for others.
+
+    :param pid: process ID
+    :return: False only when the process is known to be gone
+    """
+    if fcntl is None:
+        # os.kill doesn't just check the process on Windows
+        return True
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
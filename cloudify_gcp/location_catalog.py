@@ -0,0 +1,130 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Process wide catalog of the zones, regions and machine types of a project,
+persisted on the host so it is listed from the API once per TTL.
+"""
+
+import os
+import time
+from os.path import basename
+from threading import Lock
+
+from . import constants
+from .local_cache import read_json, write_json
+from .pagination import iter_items
+
+# Region fields kept in the catalog, quotas etc. are not needed
+REGION_FIELDS = ('name', 'status', 'zones', 'selfLink')
+
+_catalogs = {}
+_catalogs_lock = Lock()
+
+
+def list_all(collection, **kwargs):
+    """
+    Get items of all pages of a compute list method.
+
+    :param collection: discovery collection, e.g. discovery.zones()
+    :param kwargs: list method arguments
+    :return: list of items
+    """
+    return list(iter_items(collection, **kwargs))
+
+
+class LocationCatalog(object):
+    """
+    Zones, regions and machine types of a project. Each part is listed
+    lazily, when first needed, and kept for `ttl` seconds.
+    """
+
+    def __init__(self, project, path=None, ttl=None):
+        self.project = project
+        self.path = path or os.path.join(
+            constants.LOCATION_CATALOG_PATH, '{0}.json'.format(project))
+        self.ttl = ttl or constants.LOCATION_CATALOG_TTL
+        self.lock = Lock()
+        self.data = read_json(self.path, {})
+
+    def _section(self, name, discovery, fetch):
+        with self.lock:
+            section = self.data.get(name)
+            if section and time.time() - section['timestamp'] < self.ttl:
+                return section['items']
+            section = {'timestamp': time.time(), 'items': fetch(discovery)}
+            self.data[name] = section
+            write_json(self.path, self.data)
+            return section['items']
+
+    def zones(self, discovery):
+        """
+        :param discovery: compute discovery object used on a cache miss
+        :return: dictionary of zone name: zone, with region_name added
+        """
+        def fetch(discovery):
+            zones = {}
+            for zone in list_all(discovery.zones(), project=self.project):
+                zone['region_name'] = basename(zone['region'])
+                zones[zone['name']] = zone
+            return zones
+        return self._section('zones', discovery, fetch)
+
+    def regions(self, discovery):
+        """
+        :param discovery: compute discovery object used on a cache miss
+        :return: dictionary of region name: region
+        """
+        def fetch(discovery):
+            return dict(
+                (region['name'],
+                 dict((k, region[k]) for k in REGION_FIELDS if k in region))
+                for region in list_all(discovery.regions(),
+                                       project=self.project))
+        return self._section('regions', discovery, fetch)
+
+    def machine_types(self, discovery, zone):
+        """
+        :param discovery: compute discovery object used on a cache miss
+        :param zone: zone name
+        :return: list of names of the machine types available in the zone
+        """
+        def fetch(discovery):
+            return [machine_type['name'] for machine_type in list_all(
+                discovery.machineTypes(), project=self.project, zone=zone)]
+        return self._section(
+            'machine_types/{0}'.format(zone), discovery, fetch)
+
+    def get_region(self, discovery, zone):
+        """
+        :return: name of the region the zone is in, None for unknown zones
+        """
+        zone = self.zones(discovery).get(basename(zone))
+        return zone['region_name'] if zone else None
+
+
+def get_catalog(project):
+    """Get the catalog of the project shared by the whole process."""
+    with _catalogs_lock:
+        catalog = _catalogs.get(project)
+        if catalog is None:
+            catalog = _catalogs[project] = LocationCatalog(project)
+        return catalog
+
+
+def clear():
+    """Forget all catalogs held in process memory."""
+    with _catalogs_lock:
+        _catalogs.clear()
@@ -0,0 +1,153 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Completion time statistics of GCP operations, used to choose when an
+operation waiting for a GCP operation should be retried.
+"""
+
+import re
+import time
+import calendar
+from os.path import basename, dirname
+from threading import Lock
+
+from . import constants
+from .local_cache import file_lock, read_json, write_json
+
+# Weight of the newest duration in the moving average
+SMOOTHING = 0.3
+
+TIMESTAMP_RE = re.compile(
+    r'^(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(?:\.\d+)?'
+    r'(Z|([+-])(\d{2}):(\d{2}))$')
+
+_stats = None
+_stats_lock = Lock()
+
+
+def parse_timestamp(value):
+    """
+    Convert RFC3339 timestamp used by GCP to seconds since the epoch.
+
+    :param value: e.g. 2021-02-03T04:05:06.789-08:00
+    :return: float timestamp, None if value can't be parsed
+    """
+    match = TIMESTAMP_RE.match(value or '')
+    if not match:
+        return None
+    groups = match.groups()
+    timestamp = calendar.timegm(tuple(int(g) for g in groups[:6]))
+    if groups[6] != 'Z':
+        offset = int(groups[8]) * 3600 + int(groups[9]) * 60
+        timestamp -= offset if groups[7] == '+' else -offset
+    return float(timestamp)
+
+
+def operation_key(response):
+    """
+    Get the statistics key of the operation: kind of the target resource
+    and the operation type, e.g. "firewalls.insert".
+    """
+    kind = basename(dirname(response.get('targetLink', '')))
+    return '{0}.{1}'.format(kind, response.get('operationType', ''))
+
+
+def _load():
+    global _stats
+    if _stats is None:
+        _stats = read_json(constants.OPERATION_STATS_PATH, {})
+    return _stats
+
+
+def get_expected_duration(response):
+    """
+    :return: average number of seconds operations of this kind took, None
+    if there is no history
+    """
+    with _stats_lock:
+        entry = _load().get(operation_key(response))
+    return entry['duration'] if entry else None
+
+
+def record(response):
+    """
+    Store the duration of a finished operation in the statistics file.
+
+    :param response: REST response of the finished operation
+    """
+    if not isinstance(response, dict):
+        return
+    start = parse_timestamp(response.get('insertTime'))
+    end = parse_timestamp(response.get('endTime'))
+    if start is None or end is None or end < start:
+        return
+
+    key = operation_key(response)
+    duration = end - start
+    with _stats_lock, file_lock(constants.OPERATION_STATS_PATH + '.lock'):
+        stats = _load()
+        # Other processes on the host may have recorded something too
+        stats.update(read_json(constants.OPERATION_STATS_PATH, {}))
+        entry = stats.get(key)
+        if entry:
+            previous = entry['duration']
+            entry = {
+                'duration': previous + SMOOTHING * (duration - previous),
+                'count': entry['count'] + 1,
+            }
+        else:
+            entry = {'duration': duration, 'count': 1}
+        stats[key] = entry
+        write_json(constants.OPERATION_STATS_PATH, stats)
+
+
+def get_retry_delay(response, default=constants.RETRY_DEFAULT_DELAY):
+    """
+    Estimate in how many seconds the operation will be finished.
+
+    The reported progress is used when the operation has made some, then
+    the historical completion time of this kind of operation.
+
+    :param response: REST response of the operation
+    :param default: returned when there is nothing to base the estimate on
+    :return: delay in seconds, bounded by RETRY_MIN_DELAY and RETRY_MAX_DELAY
+    """
+    if not isinstance(response, dict):
+        return default
+    start = parse_timestamp(response.get('insertTime'))
+    elapsed = max(time.time() - start, 0) if start is not None else None
+    progress = response.get('progress') or 0
+
+    if elapsed is not None and 0 < progress < 100:
+        remaining = elapsed * (100 - progress) / progress
+    else:
+        expected = get_expected_duration(response)
+        if expected is None:
+            return default
+        remaining = expected - (elapsed or 0)
+        if remaining <= 0:
+            # Slower than usual, don't keep retrying at the minimal delay
+            remaining = (elapsed or 0) / 2
+
+    return int(min(max(remaining, constants.RETRY_MIN_DELAY),
+                   constants.RETRY_MAX_DELAY))
+
+
+def clear():
+    """Forget statistics loaded into process memory."""
+    global _stats
+    with _stats_lock:
+        _stats = None
@@ -0,0 +1,56 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Paging through googleapiclient list methods"""
+
+
+def iter_items(collection, method='list', items_key='items', fields=None,
+               check=None, before_request=None, **kwargs):
+    """
+    Yield items of every page of a list method. A page is only requested
+    once the items of the previous one were consumed.
+
+    :param collection: discovery collection, e.g. discovery.instances()
+    :param method: name of the list method, e.g. listInstances
+    :param items_key: key of the items in the response
+    :param fields: partial response mask of a single item, e.g.
+        "name,selfLink", the page token is always requested with it
+    :param check: function called with each response before its items are
+        yielded
+    :param before_request: function called before each page is requested,
+        e.g. to rate limit the calls
+    :param kwargs: list method arguments, e.g. project, filter, maxResults
+    :return: generator of items
+
+    APIs whose list method isn't paged (e.g. GKE node pools) have no _next
+    method, their single response is used.
+    """
+    if fields:
+        kwargs['fields'] = 'nextPageToken,{0}({1})'.format(items_key, fields)
+    list_method = getattr(collection, method)
+    next_method = getattr(collection, '{0}_next'.format(method), None)
+    request = list_method(**kwargs)
+    while request is not None:
+        if before_request:
+            before_request()
+        response = request.execute()
+        if check:
+            check(response)
+        for item in response.get(items_key, []):
+            yield item
+        if next_method is None:
+            break
+        request = next_method(previous_request=request,
+                              previous_response=response)
@@ -93,8 +93,7 @@ class Bucket(GoogleCloudPlatform):
     def delete(self):
         return self.discovery.buckets().delete(bucket=self.name).execute()
 
-    @check_response
-    def list(self):
-        response = self.discovery.buckets().list(
-            project=self.project).execute()
-        return response['items']
+    def list(self, **kwargs):
+        return self.paginate(self.discovery.buckets(),
+                             project=self.project,
+                             **kwargs)
@@ -16,6 +16,7 @@
 import unittest
 
 from mock import Mock
+from googleapiclient.errors import HttpError
 
 from cloudify.state import current_ctx
 from cloudify.manager import DirtyTrackingDict
@@ -54,3 +55,26 @@ class TestGCP(unittest.TestCase):
 
     def tearDown(self):
         current_ctx.clear()
+
+
+class FakeBatchHttpRequest(object):
+    """
+    Stand-in for googleapiclient BatchHttpRequest which executes the added
+    requests one by one.
+    """
+
+    def __init__(self, callback=None, **_):
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        self.requests.append((request_id, request))
+
+    def execute(self, http=None):
+        for request_id, request in self.requests:
+            try:
+                response = request.execute()
+            except HttpError as e:
+                self.callback(request_id, None, e)
+            else:
+                self.callback(request_id, response, None)
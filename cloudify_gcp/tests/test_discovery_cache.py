@@ -0,0 +1,110 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import MagicMock, patch
+from httplib2 import ServerNotFoundError
+
+from cloudify_gcp import gcp
+from cloudify_gcp import discovery_cache
+
+
+class TestDiscoveryDocumentCache(unittest.TestCase):
+
+    def setUp(self):
+        super(TestDiscoveryDocumentCache, self).setUp()
+        self.path = tempfile.mkdtemp()
+        self.snapshots_path = tempfile.mkdtemp()
+        discovery_cache.clear()
+
+    def tearDown(self):
+        discovery_cache.clear()
+        shutil.rmtree(self.path)
+        shutil.rmtree(self.snapshots_path)
+        super(TestDiscoveryDocumentCache, self).tearDown()
+
+    def get_cache(self, **kwargs):
+        return discovery_cache.DiscoveryDocumentCache(
+            'compute', 'v1',
+            path=self.path,
+            snapshots_path=self.snapshots_path,
+            **kwargs)
+
+    def test_set_and_get(self):
+        cache = self.get_cache()
+        self.assertIsNone(cache.get('url'))
+
+        cache.set('url', '{"doc": 1}')
+
+        self.assertEqual('{"doc": 1}', cache.get('other url'))
+        with open(os.path.join(self.path, 'compute.v1.json')) as f:
+            self.assertEqual('{"doc": 1}', f.read())
+        self.assertEqual(['compute.v1.json'], os.listdir(self.path))
+
+    def test_get_from_host_cache(self):
+        self.get_cache().set('url', '{"doc": 2}')
+        discovery_cache.clear()
+
+        self.assertEqual('{"doc": 2}', self.get_cache().get('url'))
+
+    def test_expired(self):
+        self.get_cache().set('url', '{"doc": 3}')
+
+        cache = self.get_cache(ttl=-1)
+        self.assertIsNone(cache.get('url'))
+
+        cache.offline = True
+        self.assertEqual('{"doc": 3}', cache.get('url'))
+
+    def test_offline_snapshot(self):
+        with open(os.path.join(self.snapshots_path, 'compute.v1.json'),
+                  'w') as f:
+            f.write('{"doc": 4}')
+
+        self.assertIsNone(self.get_cache().get('url'))
+        self.assertEqual('{"doc": 4}', self.get_cache(offline=True).get('url'))
+
+    @patch('cloudify_gcp.gcp.ServiceAccountCredentials.from_json_keyfile_dict')
+    @patch('cloudify_gcp.gcp.DiscoveryDocumentCache')
+    @patch('cloudify_gcp.gcp.build')
+    def test_create_discovery_offline(self, mock_build, mock_cache, *_):
+        mock_build.side_effect = [ServerNotFoundError('no'), 'service']
+        instance = gcp.GoogleCloudPlatform(
+            config={'auth': {}, 'project': 'proj', 'zone': 'zn'},
+            logger=MagicMock(),
+            name='fred')
+
+        self.assertEqual('service', instance.discovery)
+        self.assertTrue(mock_cache.return_value.offline)
+        self.assertEqual(2, mock_build.call_count)
+
+    @patch('cloudify_gcp.gcp.ServiceAccountCredentials.from_json_keyfile_dict')
+    @patch('cloudify_gcp.gcp.DiscoveryDocumentCache')
+    @patch('cloudify_gcp.gcp.build')
+    def test_create_discovery_offline_no_document(
+            self, mock_build, mock_cache, *_):
+        mock_build.side_effect = ServerNotFoundError('no')
+        mock_cache.return_value.get.return_value = None
+        instance = gcp.GoogleCloudPlatform(
+            config={'auth': {}, 'project': 'proj', 'zone': 'zn'},
+            logger=MagicMock(),
+            name='fred')
+
+        with self.assertRaises(ServerNotFoundError):
+            instance.discovery
@@ -15,11 +15,15 @@
 
 from __future__ import print_function
 
+import os
 import unittest
+from datetime import datetime, timedelta
 from mock import MagicMock, patch
 
 from googleapiclient.errors import HttpError
+from oauth2client.client import OAuth2Credentials
 
+from cloudify_gcp.tests import FakeBatchHttpRequest
 from cloudify_gcp.tests.test_utils import NS
 from cloudify_gcp import gcp
 
@@ -133,3 +137,175 @@ class TestGCPWithPatches(unittest.TestCase):
                     'region_name': 'Sarah',
                     },
                 }
+
+        # Listed once, not on every access
+        self.assertEqual(zones, instance.ZONES)
+        self.assertEqual('bob', instance.get_region('Bob'))
+        self.assertEqual(1, mock_discovery().zones().list_next.call_count)
+        with self.assertRaises(gcp.GCPError):
+            instance.get_region('nowhere')
+
+    def test_get_runtime_properties(self, mock_build, mock_discovery):
+        class Resource(gcp.GoogleCloudPlatform):
+            get = MagicMock()
+
+        instance = Resource(
+                config={'auth': {}, 'project': 'proj', 'zone': 'zn'},
+                logger=MagicMock(),
+                name='fred')
+
+        instance.get_runtime_properties()
+        instance.get.assert_called_once_with()
+
+        instance.RUNTIME_FIELDS = 'name,selfLink'
+        self.assertEqual(instance.get.return_value,
+                         instance.get_runtime_properties())
+        instance.get.assert_called_with(fields='name,selfLink')
+
+    def test_paginate(self, mock_build, mock_discovery):
+        instance = gcp.GoogleCloudPlatform(
+                config={'auth': {}, 'project': 'proj', 'zone': 'zn'},
+                logger=MagicMock(),
+                name='fred')
+        collection = MagicMock()
+        first, second = MagicMock(), MagicMock()
+        first.execute.return_value = {'items': [1, 2], 'nextPageToken': 't'}
+        second.execute.return_value = {'items': [3]}
+        collection.list.return_value = first
+        collection.list_next.side_effect = [second, None]
+
+        items = instance.paginate(collection, fields='name',
+                                  filter='name = "a"', maxResults=2)
+        # Nothing is requested before the items are consumed
+        collection.list.assert_not_called()
+
+        self.assertEqual(1, next(items))
+        second.execute.assert_not_called()
+        self.assertEqual([2, 3], list(items))
+        collection.list.assert_called_once_with(
+                fields='nextPageToken,items(name)',
+                filter='name = "a"',
+                maxResults=2)
+
+    def test_paginate_error(self, mock_build, mock_discovery):
+        instance = gcp.GoogleCloudPlatform(
+                config={'auth': {}, 'project': 'proj', 'zone': 'zn'},
+                logger=MagicMock(),
+                name='fred')
+        collection = MagicMock()
+        collection.list.return_value.execute.return_value = {'error': 'no'}
+
+        with self.assertRaises(gcp.GCPError):
+            list(instance.paginate(collection))
+
+
+@patch('cloudify_gcp.gcp.httplib2.Http')
+@patch('cloudify_gcp.gcp.ServiceAccountCredentials.from_json_keyfile_dict')
+class TestGCPSessions(unittest.TestCase):
+
+    def tearDown(self):
+        gcp.clear_sessions()
+        super(TestGCPSessions, self).tearDown()
+
+    def get_instance(self, auth):
+        return gcp.GoogleCloudPlatform(
+                config={'auth': auth, 'project': 'proj', 'zone': 'zn'},
+                logger=MagicMock(),
+                name='fred')
+
+    def test_get_http_shared(self, mock_credentials, mock_http):
+        first = self.get_instance({'client_email': 'a'})
+        second = self.get_instance({'client_email': 'a'})
+
+        http = first.get_http(gcp.constants.COMPUTE_SCOPE)
+
+        self.assertIs(http, second.get_http(gcp.constants.COMPUTE_SCOPE))
+        mock_credentials.assert_called_once_with(
+                {'client_email': 'a'},
+                scopes=gcp.constants.COMPUTE_SCOPE)
+        mock_credentials.return_value.authorize.assert_called_once_with(
+                mock_http.return_value)
+
+    def test_get_http_different_keys(self, mock_credentials, mock_http):
+        instance = self.get_instance({'client_email': 'a'})
+        instance.get_http(gcp.constants.COMPUTE_SCOPE)
+        instance.get_http(gcp.constants.STORAGE_SCOPE_RW)
+        self.get_instance({'client_email': 'b'}).get_http(
+                gcp.constants.COMPUTE_SCOPE)
+
+        self.assertEqual(3, mock_credentials.call_count)
+
+    def test_get_http_token_storage(self, mock_credentials, mock_http):
+        self.get_instance({'client_email': 'a'}).get_http(
+                gcp.constants.COMPUTE_SCOPE)
+
+        storage = mock_credentials.return_value.set_store.call_args[0][0]
+        self.assertIsInstance(storage, gcp.TokenStorage)
+        self.assertIs(mock_credentials.return_value, storage.credentials)
+
+    def test_token_storage(self, *_):
+        key = gcp.get_session_key({'client_email': 'a'}, 'x')
+        first = OAuth2Credentials(
+                'token', 'id', 'secret', 'refresh',
+                datetime.utcnow() + timedelta(hours=1), 'uri', None)
+        gcp.TokenStorage(first, key).put(first)
+
+        # The credentials of another operation use the stored token
+        second = OAuth2Credentials(
+                None, 'id', 'secret', 'refresh', None, 'uri', None)
+        storage = gcp.TokenStorage(second, key)
+        second.set_store(storage)
+        http = MagicMock()
+        second._refresh(http)
+
+        http.assert_not_called()
+        self.assertEqual('token', second.access_token)
+        self.assertFalse(second.access_token_expired)
+        self.assertEqual(0o600, os.stat(storage.path).st_mode & 0o777)
+        self.assertIsNone(gcp.TokenStorage(
+                second, gcp.get_session_key({'client_email': 'b'}, 'x')
+                ).get())
+
+    def test_get_session_key(self, *_):
+        self.assertEqual(
+                gcp.get_session_key({'a': 1, 'b': 2}, ['y', 'x']),
+                gcp.get_session_key({'b': 2, 'a': 1}, ['x', 'y']))
+        self.assertNotEqual(
+                gcp.get_session_key({'a': 1}, 'x'),
+                gcp.get_session_key({'a': 2}, 'x'))
+
+
+class TestBatchRequest(unittest.TestCase):
+
+    def test_execute(self):
+        discovery = MagicMock()
+        discovery.new_batch_http_request.side_effect = FakeBatchHttpRequest
+        requests = [MagicMock() for _ in range(5)]
+        for i, request in enumerate(requests):
+            request.execute.return_value = {'name': 'op{}'.format(i)}
+        requests[1].execute.return_value = {'error': 'nope'}
+
+        batch = gcp.BatchRequest(discovery, MagicMock(), max_size=2)
+        for i, request in enumerate(requests):
+            batch.add('key{}'.format(i), request)
+
+        responses = batch.execute()
+
+        self.assertEqual(3, discovery.new_batch_http_request.call_count)
+        self.assertEqual(
+                {'key0': {'name': 'op0'},
+                 'key2': {'name': 'op2'},
+                 'key3': {'name': 'op3'},
+                 'key4': {'name': 'op4'}},
+                responses)
+        self.assertEqual(['key1'], list(batch.errors))
+        with self.assertRaises(gcp.GCPError):
+            batch.raise_first_error()
+
+    def test_execute_no_response(self):
+        discovery = MagicMock()
+        batch = gcp.BatchRequest(discovery, MagicMock())
+        batch.add('key', MagicMock())
+
+        self.assertEqual({}, batch.execute())
+        self.assertIsInstance(batch.errors['key'], gcp.GCPError)
@@ -0,0 +1,83 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+from cloudify_gcp import key_pool
+
+# conftest keeps tests from starting processes filling the pool
+refill_in_background = key_pool.KeyPool.refill_in_background
+
+
+class TestKeyPool(unittest.TestCase):
+
+    def setUp(self):
+        super(TestKeyPool, self).setUp()
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.pool = key_pool.KeyPool(key_pool.ECDSA_KEY, self.path, size=2)
+
+    def test_fill_and_take(self):
+        self.pool.fill()
+        names = self.pool.keys()
+        self.assertEqual(2, len(names))
+
+        # Readable only by the owner
+        key_path = os.path.join(self.pool.path, names[0])
+        self.assertEqual(0o600, os.stat(key_path).st_mode & 0o777)
+        self.assertEqual(0o700, os.stat(self.pool.path).st_mode & 0o777)
+
+        with patch('cloudify_gcp.key_pool.generate_key') as generate:
+            first = self.pool.take()
+            second = self.pool.take()
+        generate.assert_not_called()
+        self.assertTrue(first.has_private())
+        self.assertNotEqual(first, second)
+        self.assertEqual([], self.pool.keys())
+
+    def test_take_empty(self):
+        key = self.pool.take()
+        private_key, public_key = key_pool.export_keys(
+            key_pool.ECDSA_KEY, key)
+        self.assertIn('BEGIN EC PRIVATE KEY', private_key)
+        self.assertTrue(public_key.startswith('ecdsa-sha2-nistp256 '))
+
+    def test_fill_locked(self):
+        os.makedirs(self.pool.path)
+        lock = os.path.join(self.pool.path, key_pool.FILL_LOCK)
+        open(lock, 'w').close()
+
+        self.pool.fill()
+        self.assertEqual([], self.pool.keys())
+
+        # Lock of a process which died
+        stale = time.time() - 2 * key_pool.constants.KEY_POOL_FILL_TIMEOUT
+        os.utime(lock, (stale, stale))
+        self.pool.fill()
+        self.assertEqual(2, len(self.pool.keys()))
+        self.assertFalse(os.path.exists(lock))
+
+    @patch('cloudify_gcp.key_pool.subprocess.Popen')
+    def test_refill_in_background(self, popen):
+        refill_in_background(self.pool)
+        self.assertEqual(
+            ['-m', 'cloudify_gcp.key_pool', 'ecdsa', self.path],
+            popen.call_args[0][0][1:])
@@ -0,0 +1,68 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+from threading import Thread
+
+from cloudify_gcp import local_cache
+
+
+class TestLocalCache(unittest.TestCase):
+
+    def setUp(self):
+        super(TestLocalCache, self).setUp()
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+        super(TestLocalCache, self).tearDown()
+
+    def test_json(self):
+        path = os.path.join(self.path, 'sub', 'file.json')
+        self.assertEqual({}, local_cache.read_json(path, {}))
+
+        self.assertTrue(local_cache.write_json(path, {'a': [1]}))
+
+        self.assertEqual({'a': [1]}, local_cache.read_json(path))
+        self.assertEqual(['file.json'],
+                         os.listdir(os.path.join(self.path, 'sub')))
+
+    def test_read_json_invalid(self):
+        path = os.path.join(self.path, 'file.json')
+        local_cache.write_file_atomic(path, '{not json')
+
+        self.assertIsNone(local_cache.read_json(path))
+        self.assertEqual('{not json', local_cache.read_file(path))
+
+    def test_file_lock(self):
+        path = os.path.join(self.path, 'sub', 'file.lock')
+        entered = []
+
+        def other():
+            with local_cache.file_lock(path):
+                entered.append('other')
+
+        with local_cache.file_lock(path):
+            thread = Thread(target=other)
+            thread.start()
+            thread.join(0.2)
+            # Waits for the lock held here
+            entered.append('first')
+        thread.join()
+
+        self.assertEqual(['first', 'other'], entered)
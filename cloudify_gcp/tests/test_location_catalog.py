@@ -0,0 +1,105 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import MagicMock, patch
+
+from cloudify_gcp import location_catalog
+
+
+class TestLocationCatalog(unittest.TestCase):
+
+    def setUp(self):
+        super(TestLocationCatalog, self).setUp()
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'proj.json')
+        self.discovery = MagicMock()
+        zones = self.discovery.zones.return_value
+        first, second = MagicMock(), MagicMock()
+        first.execute.return_value = {'items': [
+            {'name': 'zone-a', 'region': 'regions/region-1'}]}
+        second.execute.return_value = {'items': [
+            {'name': 'zone-b', 'region': 'regions/region-2'}]}
+        zones.list.return_value = first
+        zones.list_next.side_effect = [second, None]
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        super(TestLocationCatalog, self).tearDown()
+
+    def test_zones_paginated(self):
+        catalog = location_catalog.LocationCatalog('proj', path=self.path)
+
+        zones = catalog.zones(self.discovery)
+
+        self.assertEqual(['zone-a', 'zone-b'], sorted(zones))
+        self.assertEqual('region-2', catalog.get_region(
+            self.discovery, 'projects/proj/zones/zone-b'))
+        self.assertIsNone(catalog.get_region(self.discovery, 'zone-c'))
+        self.assertEqual(1, self.discovery.zones().list.call_count)
+
+    def test_persisted(self):
+        location_catalog.LocationCatalog(
+            'proj', path=self.path).zones(self.discovery)
+
+        discovery = MagicMock()
+        catalog = location_catalog.LocationCatalog('proj', path=self.path)
+
+        self.assertEqual(
+            'region-1', catalog.get_region(discovery, 'zone-a'))
+        discovery.zones.assert_not_called()
+
+    def test_expired(self):
+        catalog = location_catalog.LocationCatalog(
+            'proj', path=self.path, ttl=10)
+        with patch('cloudify_gcp.location_catalog.time.time',
+                   return_value=1000):
+            catalog.zones(self.discovery)
+
+        self.discovery.zones.return_value.list_next.side_effect = [None]
+        with patch('cloudify_gcp.location_catalog.time.time',
+                   return_value=1011):
+            zones = catalog.zones(self.discovery)
+
+        self.assertEqual(['zone-a'], list(zones))
+        self.assertEqual(2, self.discovery.zones().list.call_count)
+
+    def test_regions_and_machine_types(self):
+        self.discovery.regions().list().execute.return_value = {'items': [
+            {'name': 'region-1', 'status': 'UP', 'quotas': [{}] * 50}]}
+        self.discovery.regions().list_next.return_value = None
+        self.discovery.machineTypes().list().execute.return_value = {
+            'items': [{'name': 'n1-standard-1', 'guestCpus': 1}]}
+        self.discovery.machineTypes().list_next.return_value = None
+        catalog = location_catalog.LocationCatalog('proj', path=self.path)
+
+        self.assertEqual(
+            {'region-1': {'name': 'region-1', 'status': 'UP'}},
+            catalog.regions(self.discovery))
+        self.assertEqual(
+            ['n1-standard-1'],
+            catalog.machine_types(self.discovery, 'zone-a'))
+        self.discovery.machineTypes().list.assert_called_with(
+            project='proj', zone='zone-a')
+
+    def test_get_catalog_shared(self):
+        self.assertIs(location_catalog.get_catalog('proj'),
+                      location_catalog.get_catalog('proj'))
+        self.assertIsNot(location_catalog.get_catalog('proj'),
+                         location_catalog.get_catalog('other'))
@@ -0,0 +1,108 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+from cloudify_gcp import operation_stats
+from cloudify_gcp.local_cache import read_json
+
+
+class TestOperationStats(unittest.TestCase):
+
+    def setUp(self):
+        super(TestOperationStats, self).setUp()
+        self.path = tempfile.mkdtemp()
+        self.stats_path = os.path.join(self.path, 'stats.json')
+        patcher = patch('cloudify_gcp.operation_stats.constants.'
+                        'OPERATION_STATS_PATH', self.stats_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        operation_stats.clear()
+
+    def tearDown(self):
+        operation_stats.clear()
+        shutil.rmtree(self.path)
+        super(TestOperationStats, self).tearDown()
+
+    def operation(self, **kwargs):
+        response = {
+            'targetLink': 'https://www.googleapis.com/compute/v1/projects/p/'
+                          'global/firewalls/fw',
+            'operationType': 'insert',
+            'insertTime': '2021-02-03T04:05:06.789-08:00',
+            'status': 'RUNNING',
+            'progress': 0,
+        }
+        response.update(kwargs)
+        return response
+
+    def test_parse_timestamp(self):
+        self.assertEqual(
+            operation_stats.parse_timestamp('2021-02-03T12:05:06Z'),
+            operation_stats.parse_timestamp('2021-02-03T04:05:06.789-08:00'))
+        self.assertEqual(
+            operation_stats.parse_timestamp('2021-02-03T12:05:06Z') - 3600,
+            operation_stats.parse_timestamp('2021-02-03T12:05:06+01:00'))
+        self.assertIsNone(operation_stats.parse_timestamp('yesterday'))
+        self.assertIsNone(operation_stats.parse_timestamp(None))
+
+    def test_record(self):
+        operation_stats.record(
+            self.operation(endTime='2021-02-03T04:05:16.000-08:00'))
+        operation_stats.record(
+            self.operation(endTime='2021-02-03T04:05:26.000-08:00'))
+
+        self.assertEqual(
+            {'firewalls.insert': {'duration': 13.0, 'count': 2}},
+            read_json(self.stats_path))
+        self.assertEqual(
+            13.0, operation_stats.get_expected_duration(self.operation()))
+
+    @patch('cloudify_gcp.operation_stats.time.time')
+    def test_get_retry_delay(self, mock_time):
+        insert_time = operation_stats.parse_timestamp(
+            self.operation()['insertTime'])
+        mock_time.return_value = insert_time + 2
+
+        # no history
+        self.assertEqual(30, operation_stats.get_retry_delay(self.operation()))
+        self.assertIsNone(operation_stats.get_retry_delay(
+            self.operation(), default=None))
+
+        # history
+        operation_stats.record(
+            self.operation(endTime='2021-02-03T04:05:16.000-08:00'))
+        self.assertEqual(8, operation_stats.get_retry_delay(self.operation()))
+
+        # progress
+        self.assertEqual(
+            6, operation_stats.get_retry_delay(self.operation(progress=25)))
+
+        # slower than usual
+        mock_time.return_value = insert_time + 100
+        self.assertEqual(50, operation_stats.get_retry_delay(self.operation()))
+
+        # bounds
+        mock_time.return_value = insert_time + 1000
+        self.assertEqual(
+            120, operation_stats.get_retry_delay(self.operation(progress=1)))
+        mock_time.return_value = insert_time + 100
+        self.assertEqual(
+            3, operation_stats.get_retry_delay(self.operation(progress=99)))
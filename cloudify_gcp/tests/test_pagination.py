@@ -0,0 +1,72 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from mock import MagicMock
+
+from cloudify_gcp.pagination import iter_items
+
+
+class TestPagination(unittest.TestCase):
+
+    def test_iter_items_other_method(self):
+        collection = MagicMock()
+        first, second = MagicMock(), MagicMock()
+        first.execute.return_value = {'items': [{'instance': 'a'}]}
+        second.execute.return_value = {}
+        collection.listInstances.return_value = first
+        collection.listInstances_next.side_effect = [second, None]
+
+        self.assertEqual(
+            [{'instance': 'a'}],
+            list(iter_items(collection, 'listInstances', instanceGroup='g')))
+        collection.listInstances.assert_called_once_with(instanceGroup='g')
+        collection.listInstances_next.assert_called_with(
+            previous_request=second,
+            previous_response={})
+
+    def test_iter_items_not_paged(self):
+        collection = MagicMock(spec=['list'])
+        collection.list.return_value.execute.return_value = {
+            'nodePools': [{'name': 'pool'}]}
+
+        self.assertEqual(
+            [{'name': 'pool'}],
+            list(iter_items(collection, items_key='nodePools')))
+
+    def test_iter_items_check(self):
+        collection = MagicMock()
+        collection.list.return_value.execute.return_value = {'items': [1]}
+        collection.list_next.return_value = None
+        check = MagicMock()
+
+        list(iter_items(collection, check=check))
+
+        check.assert_called_once_with({'items': [1]})
+
+    def test_iter_items_before_request(self):
+        collection = MagicMock()
+        first, second = MagicMock(), MagicMock()
+        first.execute.return_value = {'items': [1]}
+        second.execute.return_value = {'items': [2]}
+        collection.list.return_value = first
+        collection.list_next.side_effect = [second, None]
+        before_request = MagicMock()
+
+        items = list(iter_items(collection, before_request=before_request))
+
+        self.assertEqual([1, 2], items)
+        self.assertEqual(2, before_request.call_count)
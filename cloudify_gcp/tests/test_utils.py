@@ -14,11 +14,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import unittest
+import os
 import json
+import time
+import shutil
+import tempfile
+import unittest
 from functools import partial
 
 from mock import Mock, patch, PropertyMock, MagicMock
+from Crypto.PublicKey import RSA
 
 from cloudify.state import current_ctx
 from cloudify.mocks import MockCloudifyContext
@@ -26,7 +31,8 @@ from cloudify.manager import DirtyTrackingDict
 from cloudify.exceptions import NonRecoverableError
 
 from cloudify_gcp import utils
-from . import TestGCP
+from cloudify_gcp.local_cache import write_json
+from . import TestGCP, FakeBatchHttpRequest
 
 
 class NS(object):
@@ -255,19 +261,48 @@ class TestUtilsWithCTX(TestGCP):
         with self.assertRaises(utils.HttpError):
             raise_http(404)
 
+    def write_key_file(self, content):
+        key_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, key_dir)
+        self.addCleanup(utils._public_keys.clear)
+        path = os.path.join(key_dir, 'agent_key')
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
     @patch('cloudify_gcp.utils.check_output')
     def test_get_agent_ssh_key_string(self, mock_check_output, *args):
-        mock_check_output.return_value = 'public 🗝'
+        key = RSA.generate(2048)
+        path = self.write_key_file(key.export_key())
         self.ctxmock.provider_context = {
             'cloudify': {
                 'cloudify_agent': {
-                    'agent_key_path': '🗝',
+                    'agent_key_path': path,
                     'user': '🙎',
                     }}}
+        public_key = key.publickey().export_key(
+            format='OpenSSH').decode('utf-8')
 
-        self.assertEqual(
-                '🙎:public 🗝 🙎@cloudify',
-                utils.get_agent_ssh_key_string())
+        with patch('cloudify_gcp.utils.derive_public_key',
+                   wraps=utils.derive_public_key) as derive:
+            for _ in range(2):
+                self.assertEqual(
+                        '🙎:{0} 🙎@cloudify'.format(public_key),
+                        utils.get_agent_ssh_key_string())
+
+        # Derived in process, once
+        derive.assert_called_once_with(path)
+        mock_check_output.assert_not_called()
+
+    @patch('cloudify_gcp.utils.check_output')
+    def test_derive_public_key_other_format(self, mock_check_output, *args):
+        mock_check_output.return_value = b'ssh-ed25519 public\n'
+        path = self.write_key_file(b'not a key Crypto can read')
+
+        self.assertEqual('ssh-ed25519 public',
+                         utils.derive_public_key(path))
+        mock_check_output.assert_called_once_with(
+            ['ssh-keygen', '-y', '-P', '', '-f', path])
 
     def test_get_agent_ssh_key_string_raises(self, *args):
         self.ctxmock.provider_context = {
@@ -383,3 +418,143 @@ class TestUtilsWithCTX(TestGCP):
         self.assertNotIn(
                 '_operation',
                 self.ctxmock.instance.runtime_properties)
+
+
+@patch('cloudify_gcp.gcp.ServiceAccountCredentials.from_json_keyfile_dict')
+@patch('cloudify_gcp.gcp.build')
+class TestOperation(unittest.TestCase):
+
+    def get_operation(self):
+        return utils.response_to_operation(
+            {'name': 'op', 'zone': 'zones/z'},
+            {'auth': {}, 'project': 'proj', 'zone': 'z'},
+            MagicMock())
+
+    def test_wait_server_side(self, mock_build, *_):
+        zone_operations = mock_build.return_value.zoneOperations.return_value
+        zone_operations.wait.return_value.execute.side_effect = [
+            {'status': 'RUNNING'}, {'status': 'DONE'}]
+
+        operation = self.get_operation()
+
+        self.assertTrue(operation.wait())
+        zone_operations.get.assert_not_called()
+        self.assertEqual(2, zone_operations.wait.call_count)
+        zone_operations.wait.assert_called_with(
+            project='proj', zone='z', operation='op')
+
+    @patch('cloudify_gcp.utils.time.sleep')
+    def test_wait_fallback_polling(self, mock_sleep, mock_build, *_):
+        zone_operations = mock_build.return_value.zoneOperations.return_value
+        zone_operations.get.return_value.execute.side_effect = [
+            {'status': 'RUNNING'},
+            {'status': 'RUNNING'},
+            {'status': 'RUNNING'},
+            {'status': 'DONE'},
+        ]
+        zone_operations.wait.return_value.execute.side_effect = partial(
+            raiser, 403)
+
+        self.assertTrue(self.get_operation().wait())
+        self.assertEqual(1, zone_operations.wait.call_count)
+        self.assertEqual(
+            [((1,),), ((2,),), ((4,),)], mock_sleep.call_args_list)
+
+    @patch('cloudify_gcp.utils.time.sleep')
+    def test_wait_deadline(self, mock_sleep, mock_build, *_):
+        zone_operations = mock_build.return_value.zoneOperations.return_value
+        zone_operations.get.return_value.execute.return_value = {
+            'status': 'RUNNING'}
+        zone_operations.wait.return_value.execute.return_value = {
+            'status': 'RUNNING'}
+
+        self.assertFalse(self.get_operation().wait(deadline=0))
+        zone_operations.wait.assert_not_called()
+        zone_operations.get.assert_not_called()
+
+    def test_sync_operation_deadline(self, *_):
+        class FakeNodeType(object):
+            config = {}
+            logger = MagicMock()
+
+            @utils.sync_operation
+            def stop(self):
+                return {'name': 'op'}
+
+        with patch('cloudify_gcp.utils.response_to_operation') as mock_r2o:
+            mock_r2o.return_value.wait.return_value = False
+            with self.assertRaises(utils.GCPError):
+                FakeNodeType().stop()
+
+
+@patch('cloudify_gcp.gcp.ServiceAccountCredentials.from_json_keyfile_dict')
+@patch('cloudify_gcp.gcp.build')
+class TestOperationPoller(unittest.TestCase):
+
+    config = {'auth': {}, 'project': 'proj', 'zone': 'z'}
+
+    def get_operation(self, name):
+        return utils.response_to_operation(
+            {'name': name, 'zone': 'zones/z'}, self.config, MagicMock())
+
+    def test_shared_status(self, mock_build, *_):
+        zone_operations = mock_build.return_value.zoneOperations.return_value
+        zone_operations.get.return_value.execute.return_value = {
+            'name': 'op', 'zone': 'zones/z', 'status': 'RUNNING'}
+
+        self.assertFalse(self.get_operation('op').has_finished())
+        # another process retrying the same operation shortly after
+        self.assertFalse(self.get_operation('op').has_finished())
+
+        zone_operations.get.return_value.execute.assert_called_once_with()
+
+    def test_batch_pending(self, mock_build, *_):
+        mock_build.return_value.new_batch_http_request.side_effect = \
+            FakeBatchHttpRequest
+        zone_operations = mock_build.return_value.zoneOperations.return_value
+
+        def get(project, zone, operation):
+            request = MagicMock()
+            request.execute.return_value = {
+                'name': operation, 'zone': 'zones/z', 'status': 'RUNNING'}
+            return request
+        zone_operations.get.side_effect = get
+
+        poller = utils.OperationPoller(max_age=0)
+        with patch('cloudify_gcp.utils.operation_poller', poller):
+            self.get_operation('op1').get()
+            # op1 is still pending, so it's refreshed together with op2
+            self.get_operation('op2').get()
+            self.assertEqual(3, zone_operations.get.call_count)
+            mock_build.return_value.new_batch_http_request.assert_called_once()
+
+            zone_operations.get.reset_mock()
+            self.get_operation('op3').get()
+
+        self.assertEqual(
+            ['op3', 'op1', 'op2'],
+            [c[1]['operation'] for c in zone_operations.get.call_args_list])
+        entries = json.load(open(poller.path))
+        self.assertEqual(
+            ['zones/z/operations/op1',
+             'zones/z/operations/op2',
+             'zones/z/operations/op3'],
+            sorted(list(entries.values())[0]))
+
+    def test_keeps_concurrent_entries(self, mock_build, *_):
+        poller = utils.OperationPoller(max_age=0)
+        zone_operations = mock_build.return_value.zoneOperations.return_value
+
+        def execute():
+            # Written by another process while this one polls
+            write_json(poller.path, {'other/proj': {'zones/z/operations/x': {
+                'response': {'status': 'RUNNING'}, 'checked': time.time()}}})
+            return {'name': 'op', 'zone': 'zones/z', 'status': 'RUNNING'}
+        zone_operations.get.return_value.execute.side_effect = execute
+
+        with patch('cloudify_gcp.utils.operation_poller', poller):
+            self.get_operation('op').get()
+
+        entries = json.load(open(poller.path))
+        self.assertIn('other/proj', entries)
+        self.assertEqual(2, len(entries))
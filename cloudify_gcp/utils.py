@@ -13,11 +13,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
 import re
 import sys
 import time
 import json
 from functools import wraps
+from threading import Lock
 from abc import abstractmethod
 from jsonschema import validate
 from subprocess import check_output
@@ -27,6 +29,7 @@ from six.moves import http_client
 
 import yaml
 from proxy_tools import Proxy
+from Crypto.PublicKey import ECC, RSA
 from googleapiclient.errors import HttpError
 
 from cloudify import ctx
@@ -36,10 +39,14 @@ from cloudify.utils import exception_to_error_cause
 
 from ._compat import text_type, ABC
 from . import constants
+from . import operation_stats
+from .local_cache import file_lock, read_json, write_json
 from .gcp import (
     GCPError,
+    BatchRequest,
     GoogleCloudPlatform,
     check_response,
+    get_session_key,
     is_missing_resource_error,
     is_resource_used_error,
 )
@@ -73,10 +80,13 @@ def get_item_from_gcp_response(key_field, key_name, items):
     items = [{ 'key_field': 'key_name', 'key_field_value': 'value'}]
     :param key_field: item dictionary key
     :param key_value: item dictionary value
-    :param items: list of items(dictionaries)
+    :param items: REST response with list of items(dictionaries) or an
+    iterable of items, e.g. a GoogleCloudPlatform.paginate generator
     :return: item if found in collection, None otherwise
     """
-    for item in items.get('items', []):
+    if hasattr(items, 'get'):
+        items = items.get('items', [])
+    for item in items:
         if item.get(key_field) == key_name:
             return item
     return None
@@ -279,8 +289,10 @@ def sync_operation(func):
         response = func(resource, *args, **kwargs)
         operation = response_to_operation(
             response, resource.config, resource.logger)
-        while not operation.has_finished():
-            time.sleep(1)
+        if not operation.wait(constants.OPERATION_WAIT_DEADLINE):
+            raise GCPError(
+                'Operation {0} not finished in {1} seconds'.format(
+                    operation.name, constants.OPERATION_WAIT_DEADLINE))
         return operation.last_response
 
     return wraps(func)(_decorator)
@@ -292,50 +304,128 @@ def async_operation(get=False):
     Handles the operation if it exists
 
     :param get: if True, update runtime_properties with the result of
-                self.get() when the Operation is complete
+                self.get_runtime_properties() when the Operation is
+                complete
     """
     def decorator(func):
         def wrapper(self, *args, **kwargs):
             props = ctx.instance.runtime_properties
-            response = props.get('_operation')
-
-            if response:
-                operation = response_to_operation(
-                        response,
-                        get_gcp_config(),
-                        ctx.logger)
-
-                try:
-                    has_finished = operation.has_finished()
-                except GCPError:
-                    # If the operation has an error, clear it from
-                    # runtime_properties so the next try will start from
-                    # scratch.
-                    props.pop('_operation')
-                    raise
-
-                if has_finished:
-                    for key in '_operation', 'selfLink':
-                        props.pop(key, None)
-                    if get:
-                        props.update(self.get())
-                else:
-                    ctx.operation.retry(
-                        'Operation not completed yet: {}'.format(
-                            operation.last_response['status']),
-                        constants.RETRY_DEFAULT_DELAY)
+
+            if props.get('_operation'):
+                handle_operation(self, get)
 
             else:
                 # Actually run the method
                 response = func(self, *args, **kwargs)
                 props['_operation'] = response
 
-                ctx.operation.retry('Operation started')
+                ctx.operation.retry(
+                    'Operation started',
+                    operation_stats.get_retry_delay(response, default=None))
 
         return wraps(func)(wrapper)
     return decorator
 
 
+def handle_operation(resource, get=False):
+    """
+    Check the Operation stored in runtime_properties by an async_operation
+    method of `resource`, retry while it's running and clear it when done.
+
+    :param resource: GCP object which started the Operation
+    :param get: if True, update runtime_properties with the result of
+                resource.get_runtime_properties() when the Operation is
+                complete
+    :return: True if the Operation is complete, False when retried
+    """
+    props = ctx.instance.runtime_properties
+    operation = response_to_operation(
+            props['_operation'],
+            get_gcp_config(),
+            ctx.logger)
+
+    try:
+        has_finished = operation.has_finished()
+    except GCPError:
+        # If the operation has an error, clear it from
+        # runtime_properties so the next try will start from
+        # scratch.
+        props.pop('_operation')
+        raise
+
+    if has_finished:
+        operation_stats.record(operation.last_response)
+        for key in '_operation', 'selfLink':
+            props.pop(key, None)
+        if get:
+            props.update(resource.get_runtime_properties())
+        return True
+    ctx.operation.retry(
+        'Operation not completed yet: {}'.format(
+            operation.last_response['status']),
+        operation_stats.get_retry_delay(
+            operation.last_response))
+    return False
+
+
+def run_phases(key, phases):
+    """
+    Run calls starting GCP operations one after another without blocking.
+    The phase in progress and its operation are kept in
+    runtime_properties[key], the operation is retried while the operation
+    runs and resumes from there.
+
+    :param key: runtime property holding the progress, other keys of the
+                dict stored there are kept
+    :param phases: list of (name, function building the request)
+    :return: True once the operation of the last phase is done, False
+             when the operation is retried
+    """
+    props = ctx.instance.runtime_properties
+    state = props.get(key) or {}
+    phase = state.get('phase', 0)
+
+    while phase < len(phases):
+        name, build_request = phases[phase]
+        response = state.get('_operation')
+
+        if not response:
+            ctx.logger.info('Starting {0}'.format(name))
+            response = build_request().execute()
+            if 'error' in response:
+                raise GCPError(response['error'])
+            state.update({'phase': phase, '_operation': response})
+            props[key] = state
+            ctx.operation.retry(
+                '{0} started'.format(name),
+                operation_stats.get_retry_delay(response, default=None))
+            return False
+
+        operation = response_to_operation(
+            response, get_gcp_config(), ctx.logger)
+        try:
+            has_finished = operation.has_finished()
+        except GCPError:
+            # Start the phase again on the next try
+            state.pop('_operation')
+            props[key] = state
+            raise
+        if not has_finished:
+            ctx.operation.retry(
+                '{0} not completed yet: {1}'.format(
+                    name, operation.last_response['status']),
+                operation_stats.get_retry_delay(operation.last_response))
+            return False
+
+        operation_stats.record(operation.last_response)
+        phase += 1
+        state.update({'phase': phase, '_operation': None})
+        props[key] = state
+
+    props.pop(key, None)
+    return True
+
+
 def retry_on_failure(msg, delay=constants.RETRY_DEFAULT_DELAY):
     def _retry_on_failure(func):
         def _decorator(*args, **kwargs):
@@ -520,6 +610,61 @@ def get_key_user_string(user, public_key):
     return '{0} {1} {2}'.format(protocol, key_blob, cleaned_user)
 
 
+# Public keys of agent private keys by (path, mtime, inode) of the key file,
+# shared by the operations run by this process
+_public_keys = {}
+_public_keys_lock = Lock()
+
+
+def derive_public_key(path):
+    """
+    Derive the OpenSSH public key of a private key file. RSA and ECDSA keys
+    are read in process, ssh-keygen is only run for other formats.
+
+    :param path: path of the private key file
+    :return: public key string, e.g. "ssh-rsa AAAA..."
+    """
+    with open(path, 'rb') as f:
+        private_key = f.read()
+    for key_class in RSA, ECC:
+        try:
+            key = key_class.import_key(private_key)
+        except (ValueError, IndexError, TypeError):
+            continue
+        # RSA keys only have publickey in this version of pycryptodome
+        public = getattr(key, 'publickey', None) or key.public_key
+        return _to_text(public().export_key(format='OpenSSH'))
+
+    public_key = check_output([
+        'ssh-keygen', '-y',  # generate public key from private key
+        '-P', '',  # don't prompt for passphrase (would hang forever)
+        '-f', path])
+    return _to_text(public_key).strip()
+
+
+def _to_text(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+def get_public_key(path):
+    """
+    Get the public key of a private key file, derived once per process for
+    each version of the file.
+
+    :param path: path of the private key file
+    :return: public key string
+    """
+    stat = os.stat(path)
+    cache_key = (path, stat.st_mtime, stat.st_ino)
+    with _public_keys_lock:
+        if cache_key in _public_keys:
+            return _public_keys[cache_key]
+    public_key = derive_public_key(path)
+    with _public_keys_lock:
+        _public_keys[cache_key] = public_key
+    return public_key
+
+
 def get_agent_ssh_key_string():
     cloudify_agent = {}
 
@@ -539,17 +684,15 @@ def get_agent_ssh_key_string():
         return ''
 
     try:
-        public_key = check_output([
-            'ssh-keygen', '-y',  # generate public key from private key
-            '-P', '',  # don't prompt for passphrase (would hang forever)
-            '-f', expanduser(cloudify_agent['agent_key_path'])])
+        public_key = get_public_key(
+            expanduser(cloudify_agent['agent_key_path']))
     except Exception as e:
         # any failure here is fatal
         raise NonRecoverableError('key generation failure', e)
     # add the agent user to the key. GCP uses this to create user accounts on
     # the instance.
     full_key = '{user}:{key} {user}@cloudify'.format(
-            key=public_key.strip(),
+            key=public_key,
             user=cloudify_agent['user'])
 
     return full_key
@@ -564,6 +707,42 @@ def response_to_operation(response, config, logger):
         return GlobalOperation(config, logger, response)
 
 
+def get_operations(operations, config, logger):
+    """
+    Get the current responses of several operations of the same project and
+    credentials, in one batch request if they need to be polled, see
+    OperationPoller.get_many.
+
+    :param operations: dictionary of key: operation REST response
+    :param config: gcp config
+    :param logger: logger object
+    :return: tuple of dictionaries key: current REST response and key:
+        error of the operations which failed or couldn't be polled
+    """
+    objects = {}
+    discovery = None
+    for key, response in operations.items():
+        operation = response_to_operation(response, config, logger)
+        if discovery is None:
+            discovery = operation.discovery
+        else:
+            operation.discovery = discovery
+        objects[key] = operation
+    if not objects:
+        return {}, {}
+
+    polled, errors = operation_poller.get_many(list(objects.values()))
+    responses, failed = {}, {}
+    for key, operation in objects.items():
+        if operation.path in errors:
+            failed[key] = errors[operation.path]
+        elif 'error' in polled[operation.path]:
+            failed[key] = GCPError(polled[operation.path]['error'])
+        else:
+            responses[key] = polled[operation.path]
+    return responses, failed
+
+
 class Operation(GoogleCloudPlatform, ABC):
 
     def __init__(self, config, logger, response):
@@ -573,6 +752,7 @@ class Operation(GoogleCloudPlatform, ABC):
                 setattr(self, item, response[item])
         self.last_response = None
         self.last_status = None
+        self.last_checked = None
 
     def has_finished(self):
         if self.last_status != constants.GCP_OP_DONE:
@@ -580,40 +760,261 @@ class Operation(GoogleCloudPlatform, ABC):
 
         return self.last_status == constants.GCP_OP_DONE
 
+    def wait(self, deadline=constants.OPERATION_WAIT_DEADLINE):
+        """
+        Block until the operation is done.
+
+        The operations.wait method is used, which returns as soon as the
+        operation is done (or after about 2 minutes). If it isn't available,
+        fall back to polling with exponentially growing delay.
+
+        :param deadline: maximum number of seconds to wait
+        :return: True if the operation is done, False on deadline
+        """
+        end = time.time() + deadline
+        while self.last_status != constants.GCP_OP_DONE:
+            if end - time.time() <= 0:
+                return False
+            try:
+                self.get(wait=True)
+            except (AttributeError, HttpError) as e:
+                self.logger.debug(
+                    'Unable to wait for operation {0}, polling '
+                    'instead: {1}'.format(self.name, e))
+                return self._poll(end)
+        return True
+
+    def _poll(self, end):
+        """
+        Poll the operation with exponentially growing delay.
+
+        :param end: time after which to give up
+        :return: True if the operation is done, False on deadline
+        """
+        delay = constants.OPERATION_POLL_MIN_DELAY
+        while not self.has_finished():
+            remaining = end - time.time()
+            if remaining <= 0:
+                return False
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, constants.OPERATION_POLL_MAX_DELAY)
+        return True
+
     @check_response
-    def get(self):
-        self.last_response = self._get()
+    def get(self, wait=False):
+        if wait:
+            self.last_response = self._wait()
+        else:
+            self.last_response = operation_poller.get(self)
         self.last_status = self.last_response['status']
+        self.last_checked = time.time()
         return self.last_response
 
-    @abstractmethod
     def _get(self):
+        return self._get_request().execute()
+
+    @property
+    @abstractmethod
+    def path(self):
+        """Unique path of the operation within the project"""
+
+    @abstractmethod
+    def _get_request(self):
+        pass
+
+    @abstractmethod
+    def _wait(self):
         pass
 
 
 class GlobalOperation(Operation):
-    def _get(self):
+    @property
+    def path(self):
+        return 'global/operations/{0}'.format(self.name)
+
+    def _get_request(self):
         return self.discovery.globalOperations().get(
+            project=self.project,
+            operation=self.name)
+
+    def _wait(self):
+        return self.discovery.globalOperations().wait(
             project=self.project,
             operation=self.name).execute()
 
 
 class RegionOperation(Operation):
-    def _get(self):
+    @property
+    def path(self):
+        return 'regions/{0}/operations/{1}'.format(
+            basename(self.region), self.name)
+
+    def _get_request(self):
         return self.discovery.regionOperations().get(
+            project=self.project,
+            region=basename(self.region),
+            operation=self.name)
+
+    def _wait(self):
+        return self.discovery.regionOperations().wait(
             project=self.project,
             region=basename(self.region),
             operation=self.name).execute()
 
 
 class ZoneOperation(Operation):
-    def _get(self):
+    @property
+    def path(self):
+        return 'zones/{0}/operations/{1}'.format(
+            basename(self.zone), self.name)
+
+    def _get_request(self):
         return self.discovery.zoneOperations().get(
+            project=self.project,
+            zone=basename(self.zone),
+            operation=self.name)
+
+    def _wait(self):
+        return self.discovery.zoneOperations().wait(
             project=self.project,
             zone=basename(self.zone),
             operation=self.name).execute()
 
 
+class OperationPoller(object):
+    """
+    Poll GCP operations on behalf of all operations running on this host.
+
+    Statuses are kept in a file shared by the agent processes. A status
+    polled less than `max_age` seconds ago is returned without calling the
+    API. Otherwise every pending operation of the same project and
+    credentials which is due for a check is refreshed in one batch request,
+    so operations retried at about the same time cost a single round trip.
+    """
+
+    def __init__(self, path=None, max_age=None, expiry=None):
+        self._path = path
+        self._max_age = max_age
+        self._expiry = expiry
+
+    @property
+    def path(self):
+        return self._path or constants.OPERATION_POLLER_PATH
+
+    @property
+    def max_age(self):
+        if self._max_age is None:
+            return constants.OPERATION_POLLER_MAX_AGE
+        return self._max_age
+
+    @property
+    def expiry(self):
+        return self._expiry or constants.OPERATION_POLLER_EXPIRY
+
+    @property
+    def lock_path(self):
+        return self.path + '.lock'
+
+    def get(self, operation):
+        """
+        Get the current REST response of the operation.
+
+        :param operation: Operation object
+        :return: operation REST response
+        """
+        responses, errors = self.get_many([operation])
+        if operation.path in errors:
+            raise errors[operation.path]
+        return responses[operation.path]
+
+    def get_many(self, operations):
+        """
+        Get the current REST responses of operations of the same project and
+        credentials.
+
+        The file is only locked while it is read and while the polled
+        statuses are merged into it, not during the API calls.
+
+        :param operations: list of Operation objects
+        :return: tuple of dictionaries path: REST response and path: error
+            of the operations which couldn't be polled
+        """
+        first = operations[0]
+        group = '{0}/{1}'.format(
+            get_session_key(first.auth, first.scope)[0], first.project)
+        with file_lock(self.lock_path):
+            group_entries = read_json(self.path, {}).get(group, {})
+        now = time.time()
+
+        responses = {}
+        pending = {}
+        for operation in operations:
+            entry = group_entries.get(operation.path)
+            # Never return anything older than what the operation already has
+            known = operation.last_checked or 0
+            if entry and now - entry['checked'] < self.max_age \
+                    and entry['checked'] > known:
+                responses[operation.path] = entry['response']
+            else:
+                pending[operation.path] = operation
+        if not pending:
+            return responses, {}
+
+        for path, other in group_entries.items():
+            if len(pending) >= constants.MAX_BATCH_SIZE:
+                break
+            done = other['response'].get('status') == constants.GCP_OP_DONE
+            if path in pending or done \
+                    or now - other['checked'] < self.max_age:
+                continue
+            other_operation = response_to_operation(
+                other['response'], first.config, first.logger)
+            # The same project and credentials, reuse the API client
+            other_operation.discovery = first.discovery
+            pending[path] = other_operation
+
+        if len(pending) == 1:
+            (path, operation), = pending.items()
+            polled = {path: operation._get()}
+            errors = {}
+        else:
+            batch = BatchRequest(first.discovery, first.logger,
+                                 check_responses=False)
+            for path, pending_operation in pending.items():
+                batch.add(path, pending_operation._get_request())
+            polled = batch.execute()
+            errors = batch.errors
+            first.logger.debug(
+                'Polled {0} operations in a batch'.format(len(pending)))
+
+        checked = time.time()
+        with file_lock(self.lock_path):
+            # Merged into what other processes wrote meanwhile
+            entries = read_json(self.path, {})
+            group_entries = entries.setdefault(group, {})
+            for path, response in polled.items():
+                if isinstance(response, dict):
+                    group_entries[path] = {
+                        'response': response, 'checked': checked}
+            for group_entries in entries.values():
+                for path in [path for path, entry in group_entries.items()
+                             if checked - entry['checked'] > self.expiry]:
+                    del group_entries[path]
+            write_json(self.path, dict(
+                (group, group_entries)
+                for group, group_entries in entries.items() if group_entries))
+
+        for operation in operations:
+            if operation.path in polled:
+                responses[operation.path] = polled[operation.path]
+        return responses, dict(
+            (operation.path, errors[operation.path])
+            for operation in operations if operation.path in errors)
+
+
+operation_poller = OperationPoller()
+
+
 def get_relationships(
         relationships,
         filter_relationships=None,
@@ -13,20 +13,38 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import re
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 from cloudify.decorators import workflow
 from cloudify.workflows import ctx as wtx
 from cloudify.exceptions import NonRecoverableError
 
+from .. import constants
+from . import registry
 from .resources import (
     get_zones,
     get_resources
 )
+from .results import store_resources
 from cloudify_common_sdk.utils import (
+    with_rest_client,
     create_deployments,
     install_deployments
 )
 
 GCP_TYPE = 'cloudify.nodes.gcp.Gcp'
+RESOURCES_INDEX = 'resources_index'
+CREATED_DEPLOYMENTS = 'created_deployments'
+# Resource fields which change whenever the resource does
+FINGERPRINT_FIELDS = ('etag', 'updateTime')
+# Fields of resources without FINGERPRINT_FIELDS, e.g. instances and
+# disks, which change although the resource itself doesn't
+VOLATILE_FIELDS = ('lastStartTimestamp', 'lastStopTimestamp',
+                   'lastSuspendedTimestamp', 'lastAttachTimestamp',
+                   'lastDetachTimestamp')
 
 
 def discover_resources(node_id=None,
@@ -41,11 +59,14 @@ def discover_resources(node_id=None,
     node = ctx.get_node(node_id)
     for node_instance in node.instances:
         if not isinstance(zones, list) and not zones:
-            zones = get_zones(node, ctx.deployment.id)
+            zones = get_zones(node, ctx.logger)
         resources = get_resources(node, zones, resource_types, ctx.logger)
         discovered_resources.update(resources)
-        node_instance._node_instance.runtime_properties['resources'] = \
-            resources
+        store_resources(node_instance._node_instance.runtime_properties,
+                        resources,
+                        ctx.deployment.id,
+                        node_instance.id,
+                        ctx.logger)
         return discovered_resources
     raise NonRecoverableError(
         'No node instances of the provided node ID {n} exist. '
@@ -58,24 +79,141 @@ def deploy_resources(group_id,
                      inputs,
                      labels,
                      ctx,
+                     batch_size=None,
+                     max_workers=None,
+                     checkpoint=None,
                      **_):
-    """Create new deployments and execute install.
+    """Create new deployments in chunks, several chunks at a time.
 
     :param group_id: The new Group ID.
     :param blueprint_id: The child blueprint ID.
     :param deployment_ids: A list of deployment IDs.
     :param inputs: A list of inputs in order of the deployment IDs.
     :param ctx:
+    :param batch_size: Number of deployments created by one request.
+    :param max_workers: Number of requests sent concurrently.
+    :param checkpoint: DeploymentsCheckpoint, deployments it contains are
+        skipped and the created ones are added to it.
     :param _:
     :return:
     """
-    if not deployment_ids:
+    batch_size = batch_size or constants.DEPLOYMENTS_BATCH_SIZE
+    max_workers = max_workers or constants.DEPLOYMENTS_MAX_WORKERS
+    new_deployments = [
+        (deployment_id, inp) for deployment_id, inp in zip(
+            deployment_ids, inputs)
+        if not checkpoint or deployment_id not in checkpoint]
+    if len(new_deployments) < len(deployment_ids):
+        ctx.logger.info(
+            'Skipping {n} deployments created by a previous run.'.format(
+                n=len(deployment_ids) - len(new_deployments)))
+    if not new_deployments:
         return
     ctx.logger.info(
         'Creating deployments {dep} with blueprint {blu} '
         'with these inputs: {inp} and with these labels: {lab}'.format(
-            dep=deployment_ids, blu=blueprint_id, inp=inputs, lab=labels))
-    create_deployments(group_id, blueprint_id, deployment_ids, inputs, labels)
+            dep=[d for d, _ in new_deployments], blu=blueprint_id,
+            inp=[i for _, i in new_deployments], lab=labels))
+
+    chunks = [new_deployments[i:i + batch_size]
+              for i in range(0, len(new_deployments), batch_size)]
+    error = None
+    created = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = dict(
+            (pool.submit(create_deployments,
+                         group_id,
+                         blueprint_id,
+                         [d for d, _ in chunk],
+                         [i for _, i in chunk],
+                         list(labels)), chunk)
+            for chunk in chunks)
+        for future in as_completed(futures):
+            chunk_ids = [d for d, _ in futures[future]]
+            try:
+                future.result()
+            except Exception as e:
+                ctx.logger.error(
+                    'Failed to create deployments: {e}'.format(e=e))
+                error = error or e
+                if checkpoint:
+                    # The request may have failed after the deployments
+                    # were created, they can't be created again by a rerun
+                    checkpoint_existing(group_id, chunk_ids, checkpoint, ctx)
+                continue
+            if checkpoint:
+                checkpoint.add(chunk_ids)
+            created += len(chunk_ids)
+            ctx.logger.info('Created {c} of {n} deployments.'.format(
+                c=created, n=len(new_deployments)))
+    if error:
+        raise error
+
+
+def checkpoint_existing(group_id, deployment_ids, checkpoint, ctx):
+    """Add the deployments of a failed request which exist anyway to the
+    checkpoint.
+
+    :param group_id: The deployment group ID.
+    :param deployment_ids: IDs of the deployments of the failed request.
+    :param checkpoint: DeploymentsCheckpoint.
+    :param ctx:
+    """
+    try:
+        existing = get_existing_deployments(group_id, deployment_ids)
+    except Exception as e:
+        ctx.logger.error(
+            'Failed to check which deployments exist: {e}'.format(e=e))
+        return
+    if existing:
+        ctx.logger.info(
+            'Deployments {dep} were created by the failed request.'.format(
+                dep=existing))
+        checkpoint.add(existing)
+
+
+@with_rest_client
+def get_existing_deployments(group_id, deployment_ids, rest_client):
+    """Get which of the deployments exist in the deployment group.
+
+    :param group_id: The deployment group ID.
+    :param deployment_ids: A list of deployment IDs.
+    :param rest_client: A Cloudify REST client.
+    :return: sorted list of the existing deployment IDs.
+    """
+    deployments = rest_client.deployments.list(
+        _group_id=group_id,
+        id=list(deployment_ids),
+        _include=['id'],
+        _size=len(deployment_ids))
+    return sorted(set(d.id for d in deployments) & set(deployment_ids))
+
+
+class DeploymentsCheckpoint(object):
+    """IDs of the child deployments created by an unfinished
+    discover_and_deploy run, stored on the account node instance so a rerun
+    doesn't create them again.
+    """
+
+    def __init__(self, node_instance):
+        self.node_instance_id = node_instance.id
+        self.deployment_ids = set(
+            node_instance.runtime_properties.get(CREATED_DEPLOYMENTS) or [])
+
+    def __contains__(self, deployment_id):
+        return deployment_id in self.deployment_ids
+
+    def add(self, deployment_ids):
+        self.deployment_ids.update(deployment_ids)
+        store_runtime_properties(
+            self.node_instance_id,
+            {CREATED_DEPLOYMENTS: sorted(self.deployment_ids)})
+
+    def clear(self):
+        if self.deployment_ids:
+            self.deployment_ids = set()
+            store_runtime_properties(
+                self.node_instance_id, {CREATED_DEPLOYMENTS: []})
 
 
 @workflow
@@ -83,6 +221,9 @@ def discover_and_deploy(node_id=None,
                         resource_types=None,
                         regions=None,
                         blueprint_id=None,
+                        incremental=False,
+                        batch_size=None,
+                        max_workers=None,
                         ctx=None,
                         **_):
     """This workflow will check against the parent "Account" node for
@@ -93,6 +234,11 @@ def discover_and_deploy(node_id=None,
     :param resource_types: List of crawlable types. (AWS::EKS::CLUSTER)
     :param regions: List of regions.
     :param blueprint_id: The blueprint ID to create child deployments with.
+    :param incremental: Only deploy resources which were not found by the
+        previous incremental run.
+    :param batch_size: Number of deployments created by one request.
+    :param max_workers: Number of deployment creation requests sent
+        concurrently.
     :param ctx:
     :param _:
     :return:
@@ -103,28 +249,35 @@ def discover_and_deploy(node_id=None,
     label_list = [{'csys-env-type': 'environment'},
                   {'csys-obj-parent': ctx.deployment.id}]
     # Refresh the GCP_TYPE nodes list..
+    node_id = node_id or get_gcp_account_node_id(ctx.nodes)
     resources = discover_resources(node_id=node_id,
                                    resource_types=resource_types,
                                    regions=regions,
                                    ctx=ctx)
+    node_instance = get_account_node_instance(ctx, node_id)
+    checkpoint = DeploymentsCheckpoint(node_instance)
+    if incremental:
+        resources, index = get_new_resources(
+            node_instance.runtime_properties.get(RESOURCES_INDEX) or {},
+            resources,
+            ctx.logger)
     # Loop over the resources to create new deployments from them.
     resource_type = None
     for zone, resource_types in resources.items():
         deployment_ids_list = []
         inputs_list = []
         for resource_type, resources in resource_types.items():
+            discovery_type = registry.TYPES.get(
+                resource_type, registry.TYPES['projects.zones.clusters'])
             for resource_id, _ in resources.items():
                 # We are now at the resource level.
                 # Create the inputs and deployment ID for the new deployment.
                 inputs_list.append(
-                    {
-                        'zone': zone,
-                        'kubernetes_cluster_name': resource_id
-                    }
-                )
+                    discovery_type.get_deployment_inputs(zone, resource_id))
                 deployment_ids_list.append(
                     generate_deployment_ids(
-                        ctx.deployment.id, resource_id)
+                        ctx.deployment.id,
+                        discovery_type.get_short_name(resource_id))
                 )
 
             if deployment_ids_list:
@@ -134,12 +287,119 @@ def discover_and_deploy(node_id=None,
                                  deployment_ids_list,
                                  inputs_list,
                                  label_list,
-                                 ctx)
+                                 ctx,
+                                 batch_size=batch_size,
+                                 max_workers=max_workers,
+                                 checkpoint=checkpoint)
                 del label_list[-1]
             deployment_ids_list = []
             inputs_list = []
     if resources:
         install_deployments(ctx.deployment.id)
+    # Every deployment exists now, the next run starts from scratch
+    checkpoint.clear()
+    if incremental:
+        # Stored once the deployments exist, so a failed run is retried
+        store_runtime_properties(node_instance.id, {RESOURCES_INDEX: index})
+
+
+def get_fingerprint(resource):
+    """Get a digest of the resource which changes when the resource does.
+
+    Resources without an etag or update time are digested whole, except
+    for the VOLATILE_FIELDS.
+
+    :param resource: resource dict from the API.
+    :return: hex digest.
+    """
+    fields = [resource.get(f) for f in FINGERPRINT_FIELDS]
+    if not any(fields):
+        fields = dict((k, v) for k, v in resource.items()
+                      if k not in VOLATILE_FIELDS)
+    return hashlib.sha1(
+        json.dumps(fields, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def get_resources_index(resources):
+    """Map each discovered resource to its fingerprint.
+
+    :param resources: resources dict, as returned by discover_resources.
+    :return: dict of zone/resource_type/resource_id: fingerprint.
+    """
+    index = {}
+    for zone, resource_types in resources.items():
+        for resource_type, found in resource_types.items():
+            for resource_id, resource in found.items():
+                key = '/'.join((zone, resource_type, resource_id))
+                index[key] = get_fingerprint(resource)
+    return index
+
+
+def compare_indexes(previous, current):
+    """Get sorted lists of added, removed and changed index keys."""
+    added = sorted(set(current) - set(previous))
+    removed = sorted(set(previous) - set(current))
+    changed = sorted(key for key in set(current) & set(previous)
+                     if current[key] != previous[key])
+    return added, removed, changed
+
+
+def get_new_resources(previous_index, resources, logger):
+    """Keep only the resources which are not in the previous index.
+
+    :param previous_index: index stored by the previous incremental run.
+    :param resources: resources dict, as returned by discover_resources.
+    :param logger: ctx logger
+    :return: tuple of the new resources dict and the index of resources.
+    """
+    index = get_resources_index(resources)
+    added, removed, changed = compare_indexes(previous_index, index)
+    logger.info(
+        'Discovered {a} new, {r} removed and {c} changed resources.'.format(
+            a=len(added), r=len(removed), c=len(changed)))
+    if removed:
+        logger.info('Resources not found anymore: {r}'.format(r=removed))
+    if changed:
+        logger.info('Resources changed: {c}'.format(c=changed))
+
+    new_resources = {}
+    for key in added:
+        zone, resource_type, resource_id = key.split('/', 2)
+        new_resources.setdefault(zone, {}).setdefault(
+            resource_type, {})[resource_id] = \
+            resources[zone][resource_type][resource_id]
+    return new_resources, index
+
+
+@with_rest_client
+def store_runtime_properties(node_instance_id, properties, rest_client):
+    """Update runtime properties of a node instance from a workflow.
+
+    :param node_instance_id: The node instance ID.
+    :param properties: dict of runtime properties to set.
+    :param rest_client: A Cloudify REST client.
+    """
+    node_instance = rest_client.node_instances.get(node_instance_id)
+    runtime_properties = node_instance.runtime_properties
+    runtime_properties.update(properties)
+    rest_client.node_instances.update(
+        node_instance_id,
+        runtime_properties=runtime_properties,
+        version=node_instance.version)
+
+
+def get_account_node_instance(ctx, node_id):
+    """Get the node instance of the account node.
+
+    :param ctx: workflow CTX.
+    :param node_id: The account node ID.
+    :return: CloudifyWorkflowNodeInstance
+    """
+    for node_instance in ctx.get_node(node_id).instances:
+        return node_instance
+    raise NonRecoverableError(
+        'No node instances of the provided node ID {n} exist. '
+        'Please install the account blueprint.'.format(n=node_id))
 
 
 def get_gcp_account_node_id(nodes):
@@ -161,8 +421,8 @@ def generate_deployment_ids(deployment_id, resource_name):
 
     :param deployment_id:
     :param resource_name:
-    :return:
+    :return: ID containing only letters, digits, "-", "_" and "."
     """
-    return '{parent}-{child}'.format(
+    return re.sub(r'[^\w.-]', '-', '{parent}-{child}'.format(
         parent=deployment_id,
-        child=resource_name)
+        child=resource_name))
@@ -0,0 +1,189 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Resource types the discovery workflows can find"""
+
+from os.path import basename
+
+from ..storage import Bucket
+from ..compute.disk import Disk
+from ..compute.instance import Instance
+from ..compute.network import Network
+from ..compute.subnetwork import SubNetwork
+from ..container_engine.cluster import Cluster
+from ..pubsub.subscription import Subscription
+
+# Scope of the type, which locations it is listed in
+ZONE = 'zone'
+REGION = 'region'
+GLOBAL = 'global'
+
+TYPES = {}
+
+
+class DiscoveryType(object):
+    """
+    A discoverable resource type.
+
+    :param name: key of the type, e.g. projects.zones.clusters
+    :param class_decl: resource class, an instance of it is given to the
+        list functions
+    :param service: short name of the API
+    :param scope: ZONE, REGION or GLOBAL
+    :param list_items: function(resource object, location) returning the
+        resources of the location, location is "global" for GLOBAL types
+    :param resource_key: key of the resource ID in the resource dict
+    :param aggregated: optional function(resource object) returning
+        (location, resource) tuples of all locations of the project
+    :param class_kwargs: additional arguments of the class
+    :param deployment_inputs: function(location, short name) returning the
+        inputs of the child deployment of a resource, see named_inputs
+    """
+
+    def __init__(self, name, class_decl, service, scope, list_items,
+                 resource_key='name', aggregated=None, class_kwargs=None,
+                 deployment_inputs=None):
+        self.name = name
+        self.class_decl = class_decl
+        self.service = service
+        self.scope = scope
+        self.list_items = list_items
+        self.resource_key = resource_key
+        self.aggregated = aggregated
+        self.class_kwargs = class_kwargs or {}
+        self.deployment_inputs = deployment_inputs or named_inputs(
+            'resource_name', 'location')
+
+    def interface(self, config, logger):
+        return self.class_decl(config, logger, 'foo', **self.class_kwargs)
+
+    def get_short_name(self, resource_id):
+        """Name of the resource without its path, e.g. the subscription
+        name of projects/<project>/subscriptions/<name>"""
+        return basename(resource_id)
+
+    def get_deployment_inputs(self, location, resource_id):
+        """
+        :return: inputs of the child deployment of the resource
+        """
+        return self.deployment_inputs(
+            location, self.get_short_name(resource_id))
+
+
+def named_inputs(name_input, location_input=None):
+    """
+    :param name_input: input receiving the short name of the resource
+    :param location_input: input receiving the location of the resource,
+        None for global types
+    :return: deployment inputs function of a DiscoveryType
+    """
+    def deployment_inputs(location, name):
+        inputs = {name_input: name}
+        if location_input:
+            inputs[location_input] = location
+        return inputs
+    return deployment_inputs
+
+
+def register(discovery_type):
+    """Make the type discoverable, replacing a type of the same name."""
+    TYPES[discovery_type.name] = discovery_type
+    return discovery_type
+
+
+def compute_list(collection, location_key=None):
+    """
+    :return: list function of a compute collection, e.g. instances
+    """
+    def list_items(iface, location):
+        kwargs = {location_key: location} if location_key else {}
+        return iface.paginate(getattr(iface.discovery, collection)(),
+                              project=iface.project, **kwargs)
+    return list_items
+
+
+def compute_aggregated(collection):
+    """
+    :return: aggregated function of a compute collection, using the
+        aggregatedList method
+    """
+    def aggregated(iface):
+        found = []
+        collection_api = getattr(iface.discovery, collection)()
+        request = collection_api.aggregatedList(project=iface.project)
+        while request is not None:
+            iface.throttle()
+            response = request.execute()
+            # Keys are scopes like zones/us-east1-b or regions/us-east1
+            for scope, scoped in sorted(response.get('items', {}).items()):
+                for item in scoped.get(collection, []):
+                    found.append((basename(scope), item))
+            request = collection_api.aggregatedList_next(
+                previous_request=request,
+                previous_response=response)
+        return found
+    return aggregated
+
+
+def _list_clusters(iface, zone):
+    iface.zone = zone
+    return iface.list()
+
+
+def _aggregated_clusters(iface):
+    return iface.aggregated_list()
+
+
+def _list_buckets(iface, _):
+    return iface.list()
+
+
+def _list_subscriptions(iface, _):
+    return iface.paginate(iface.discovery_pubsub.subscriptions(),
+                          items_key='subscriptions',
+                          project='projects/{0}'.format(iface.project))
+
+
+register(DiscoveryType(
+    'projects.zones.clusters', Cluster, 'gke', ZONE,
+    _list_clusters, aggregated=_aggregated_clusters,
+    deployment_inputs=named_inputs('kubernetes_cluster_name', 'zone')))
+register(DiscoveryType(
+    'projects.zones.instances', Instance, 'compute', ZONE,
+    compute_list('instances', 'zone'),
+    aggregated=compute_aggregated('instances'),
+    deployment_inputs=named_inputs('instance_name', 'zone')))
+register(DiscoveryType(
+    'projects.zones.disks', Disk, 'compute', ZONE,
+    compute_list('disks', 'zone'),
+    aggregated=compute_aggregated('disks'),
+    deployment_inputs=named_inputs('disk_name', 'zone')))
+register(DiscoveryType(
+    'projects.global.networks', Network, 'compute', GLOBAL,
+    compute_list('networks'),
+    deployment_inputs=named_inputs('network_name')))
+register(DiscoveryType(
+    'projects.regions.subnetworks', SubNetwork, 'compute', REGION,
+    compute_list('subnetworks', 'region'),
+    aggregated=compute_aggregated('subnetworks'),
+    class_kwargs={'region': None},
+    deployment_inputs=named_inputs('subnetwork_name', 'region')))
+register(DiscoveryType(
+    'storage.buckets', Bucket, 'storage', GLOBAL, _list_buckets,
+    deployment_inputs=named_inputs('bucket_name')))
+register(DiscoveryType(
+    'projects.subscriptions', Subscription, 'pubsub', GLOBAL,
+    _list_subscriptions, class_kwargs={'topic': None},
+    deployment_inputs=named_inputs('subscription_name')))
@@ -1,3 +1,5 @@
+from fnmatch import fnmatch
+
 from cloudify import ctx as _ctx
 from cloudify.context import NodeContext
 from cloudify.decorators import operation
@@ -5,13 +7,13 @@ from cloudify.exceptions import NonRecoverableError
 from cloudify_common_sdk.utils import desecretize_client_config
 
 from .. import utils
-from ..container_engine.cluster import Cluster
+from ..gcp import GoogleCloudPlatform
+from .registry import TYPES
+from .results import store_resources, remove_resources
+from .scanner import ResourceScanner
 
-TYPES_MATRIX = {
-    'projects.zones.clusters': (
-        Cluster, 'gke', 'name'
-    )
-}
+# Discoverable types by name, see registry.register
+TYPES_MATRIX = TYPES
 
 
 @operation
@@ -20,7 +22,9 @@ def initialize(resource_config=None, zones=None, ctx=None, **_):
     This checks for resource_types in resource config and
         zones in zones.
     :param resource_config: A dict with key resource_types,
-      a list of gcp types like projects.zones.clusters.
+      a list of gcp types like projects.zones.clusters, and optional
+      max_workers and requests_per_second limits of the scan, and
+      zones_include and zones_exclude patterns used when zones is empty.
     :param zones: A list of zones, like [europe-west1-b].
     :param ctx: Cloudify CTX
     :param _:
@@ -33,19 +37,27 @@ def initialize(resource_config=None, zones=None, ctx=None, **_):
     resource_types = resource_config.get('resource_types', [])
     ctx.logger.info('Checking for these resource types: {t}.'.format(
         t=resource_types))
-    zones = zones or get_zones()
-    ctx.instance.runtime_properties['resources'] = get_resources(
-        ctx.node, zones, resource_types, ctx.logger)
+    zones = zones or get_zones(ctx.node, ctx.logger)
+    resources = get_resources(
+        ctx.node, zones, resource_types, ctx.logger,
+        max_workers=resource_config.get('max_workers'),
+        rate=resource_config.get('requests_per_second'))
+    store_resources(ctx.instance.runtime_properties,
+                    resources,
+                    ctx.deployment.id,
+                    ctx.instance.id,
+                    ctx.logger)
 
 
 @operation
 def deinitialize(ctx, **_):
-    """Delete the resources runtime property. """
+    """Delete the resources runtime property and stored resources. """
     ctx = ctx or _ctx
-    del ctx.instance.runtime_properties['resources']
+    remove_resources(ctx.instance.runtime_properties)
 
 
-def get_resources(node, zones, resource_types, logger):
+def get_resources(node, zones, resource_types, logger,
+                  max_workers=None, rate=None):
     """Get a dict of resources in the following structure:
 
     :param node: ctx.node
@@ -53,10 +65,14 @@ def get_resources(node, zones, resource_types, logger):
     :param resource_types: List of resource types,
         i.e. projects.zones.clusters.
     :param logger: ctx logger
-    :return: a dictionary of resources in the structure:
+    :param max_workers: number of zones and types listed concurrently
+    :param rate: maximum number of list requests per second
+    :return: a dictionary of resources in the structure below. Regional
+        types are keyed by the region of the zones, i.e. asia-east1, and
+        global types by 'global'.
         {
-            'projects.zones.clusters': {
-                'asia-east1-a': {
+            'asia-east1-a': {
+                'projects.zones.clusters': {
                     'resource_id': resource
                 }
             }
@@ -65,135 +81,53 @@ def get_resources(node, zones, resource_types, logger):
 
     logger.info('Checking for these resource types: {t}.'.format(
         t=resource_types))
-    resources = {}
-    # The structure goes resources.location.resource_type.resource, so we start
-    # with location.
-    # then resource type.
-    for zone in zones:
-        logger.info('Checking in this zone: {z}'.format(z=zone))
-        for resource_type in resource_types:
-            logger.info(
-                'Checking for this resource type: {t}.'.format(
-                    t=resource_type))
-            # Get the class callable, the service name, and resource_id key.
-            class_decl, service_name, resource_key = TYPES_MATRIX.get(
-                resource_type)
-            # Note that the service_name needs to be updated in the Cloudify
-            # GCP plugin resource module class for supporting new types.
-            if not class_decl:
-                # It means that we don't support whatever they provided.
-                raise NonRecoverableError(
-                    'Unsupported resource type: {t}.'.format(t=resource_type))
-            iface = get_resource_interface(node, zone, class_decl, logger)
-            # Get the resource response from the API.
-            # Clean it up for context serialization.
-            # Add this stuff to the resources dict.
-            for resource in iface.list():
-                resource_id = resource[resource_key]
-                resource_entry = {resource_id: resource}
-                if zone not in resources:
-                    resources[zone] = {
-                        resource_type: resource_entry
-                    }
-                elif resource_type not in resources[resource['location']]:
-                    resources[zone][resource_type] = resource_entry
-                else:
-                    resources[zone][resource_type][resource_id] = resource
-    return resources
-
-
-def get_resource_interface(node, zone, class_decl, logger):
+    for resource_type in resource_types:
+        # New types are added with registry.register.
+        if resource_type not in TYPES_MATRIX:
+            # It means that we don't support whatever they provided.
+            raise NonRecoverableError(
+                'Unsupported resource type: {t}.'.format(t=resource_type))
+    logger.info('Checking in these zones: {z}'.format(z=zones))
+    if not zones or not resource_types:
+        return {}
+    scanner = ResourceScanner(
+        get_account_config(node, zones[0]), logger, TYPES_MATRIX,
+        max_workers=max_workers, rate=rate)
+    return scanner.scan(zones, resource_types)
+
+
+def get_account_config(node, zone=None):
     if not isinstance(node, NodeContext):
         node.properties['client_config'] = desecretize_client_config(
             node.properties['client_config'])
-    gcp_config = utils.get_gcp_config(node, requested_zone=zone)
-    return class_decl(gcp_config, logger, 'foo')
-
-
-def get_zones(*_, **__):
-    return ['asia-east1-a',
-            'asia-east1-b',
-            'asia-east1-c',
-            'asia-east2-a',
-            'asia-east2-b',
-            'asia-east2-c',
-            'asia-northeast1-a',
-            'asia-northeast1-b',
-            'asia-northeast1-c',
-            'asia-northeast2-a',
-            'asia-northeast2-b',
-            'asia-northeast2-c',
-            'asia-northeast3-a',
-            'asia-northeast3-b',
-            'asia-northeast3-c',
-            'asia-south1-a',
-            'asia-south1-b',
-            'asia-south1-c',
-            'asia-south2-a',
-            'asia-south2-b',
-            'asia-south2-c',
-            'asia-southeast1-a',
-            'asia-southeast1-b',
-            'asia-southeast1-c',
-            'asia-southeast2-a',
-            'asia-southeast2-b',
-            'asia-southeast2-c',
-            'australia-southeast1-a',
-            'australia-southeast1-b',
-            'australia-southeast1-c',
-            'australia-southeast2-a',
-            'australia-southeast2-b',
-            'australia-southeast2-c',
-            'europe-central2-a',
-            'europe-central2-b',
-            'europe-central2-c',
-            'europe-north1-a',
-            'europe-north1-b',
-            'europe-north1-c',
-            'europe-west1-b',
-            'europe-west1-c',
-            'europe-west1-d',
-            'europe-west2-a',
-            'europe-west2-b',
-            'europe-west2-c',
-            'europe-west3-a',
-            'europe-west3-b',
-            'europe-west3-c',
-            'europe-west4-a',
-            'europe-west4-b',
-            'europe-west4-c',
-            'europe-west6-a',
-            'europe-west6-b',
-            'europe-west6-c',
-            'northamerica-northeast1-a',
-            'northamerica-northeast1-b',
-            'northamerica-northeast1-c',
-            'northamerica-northeast2-a',
-            'northamerica-northeast2-b',
-            'northamerica-northeast2-c',
-            'southamerica-east1-a',
-            'southamerica-east1-b',
-            'southamerica-east1-c',
-            'us-central1-a',
-            'us-central1-b',
-            'us-central1-c',
-            'us-central1-f',
-            'us-east1-b',
-            'us-east1-c',
-            'us-east1-d',
-            'us-east4-a',
-            'us-east4-b',
-            'us-east4-c',
-            'us-west1-a',
-            'us-west1-b',
-            'us-west1-c',
-            'us-west2-a',
-            'us-west2-b',
-            'us-west2-c',
-            'us-west3-a',
-            'us-west3-b',
-            'us-west3-c',
-            'us-west4-a',
-            'us-west4-b',
-            'us-west4-c'
-            ]
+    zone = zone or node.properties['client_config'].get('zone')
+    return utils.get_gcp_config(node, requested_zone=zone)
+
+
+def get_zones(node, logger, include=None, exclude=None):
+    """Get the zones of the account's project which are up.
+
+    The zones are listed from the compute API and cached per project, see
+    location_catalog.
+
+    :param node: ctx.node of the account
+    :param logger: ctx logger
+    :param include: list of zone name patterns, like [europe-*], default is
+        resource_config zones_include, or all zones.
+    :param exclude: list of zone name patterns, default is resource_config
+        zones_exclude.
+    :return: sorted list of zone names
+    """
+    resource_config = node.properties.get('resource_config') or {}
+    include = include or resource_config.get('zones_include') or ['*']
+    exclude = exclude or resource_config.get('zones_exclude') or []
+    platform = GoogleCloudPlatform(get_account_config(node), logger, 'zones')
+    zones = []
+    for name, zone in platform.ZONES.items():
+        if zone.get('status') != 'UP' or 'deprecated' in zone:
+            continue
+        if any(fnmatch(name, pattern) for pattern in include) \
+                and not any(fnmatch(name, pattern) for pattern in exclude):
+            zones.append(name)
+    logger.info('Found these zones: {z}.'.format(z=zones))
+    return sorted(zones)
@@ -0,0 +1,147 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Storage of discovery results. Runtime properties get a compact index of the
+discovered resources, their full bodies are written to a JSON lines file on
+the manager which is read only when needed.
+"""
+
+import os
+import json
+import hashlib
+
+from .. import constants
+from ..local_cache import write_lines_atomic
+
+RESOURCES = 'resources'
+RESOURCES_ARTIFACT = 'resources_artifact'
+
+
+def get_artifact_path(deployment_id, node_instance_id):
+    return os.path.join(constants.DISCOVERY_RESULTS_PATH,
+                        deployment_id,
+                        '{0}.jsonl'.format(node_instance_id))
+
+
+def iter_resources(resources):
+    """
+    :param resources: location: resource type: resource id: resource dict
+    :return: generator of (location, resource type, resource id, resource)
+    """
+    for location, resource_types in resources.items():
+        for resource_type, found in resource_types.items():
+            for resource_id, resource in found.items():
+                yield location, resource_type, resource_id, resource
+
+
+def get_compact_index(resources):
+    """
+    Get the resources dict with each resource replaced by its id, zone,
+    type, selfLink and a hash of its body.
+    """
+    index = {}
+    for location, resource_type, resource_id, resource in iter_resources(
+            resources):
+        body = json.dumps(resource, sort_keys=True)
+        index.setdefault(location, {}).setdefault(
+            resource_type, {})[resource_id] = {
+                'id': resource_id,
+                'zone': location,
+                'type': resource_type,
+                'selfLink': resource.get('selfLink'),
+                'hash': hashlib.sha1(body.encode('utf-8')).hexdigest(),
+            }
+    return index
+
+
+def write_artifact(path, resources):
+    """Write one JSON line per resource, replacing the file atomically."""
+    write_lines_atomic(path, (
+        json.dumps({
+            'zone': location,
+            'type': resource_type,
+            'id': resource_id,
+            'resource': resource,
+        }) + '\n'
+        for location, resource_type, resource_id, resource in iter_resources(
+            resources)))
+
+
+def read_artifact(path, zone=None, resource_type=None, resource_id=None):
+    """
+    Read the artifact line by line.
+
+    :param path: path of the artifact
+    :param zone: only return resources of this location
+    :param resource_type: only return resources of this type
+    :param resource_id: only return the resource with this id
+    :return: generator of dicts with zone, type, id and resource keys
+    """
+    with open(path, 'r') as f:
+        for line in f:
+            entry = json.loads(line)
+            if zone and entry['zone'] != zone:
+                continue
+            if resource_type and entry['type'] != resource_type:
+                continue
+            if resource_id and entry['id'] != resource_id:
+                continue
+            yield entry
+
+
+def load_resources(runtime_properties, **filters):
+    """
+    Load full bodies of the resources discovered by a node instance.
+
+    :param runtime_properties: runtime properties of the account node
+        instance
+    :param filters: zone, resource_type and resource_id, see read_artifact
+    :return: location: resource type: resource id: resource dict
+    """
+    resources = {}
+    path = runtime_properties.get(RESOURCES_ARTIFACT)
+    if not path:
+        return resources
+    for entry in read_artifact(path, **filters):
+        resources.setdefault(entry['zone'], {}).setdefault(
+            entry['type'], {})[entry['id']] = entry['resource']
+    return resources
+
+
+def store_resources(runtime_properties, resources, deployment_id,
+                    node_instance_id, logger):
+    """
+    Store index of the resources in the runtime properties and the bodies
+    in the artifact of the node instance.
+    """
+    path = get_artifact_path(deployment_id, node_instance_id)
+    try:
+        write_artifact(path, resources)
+    except (IOError, OSError) as e:
+        logger.warn(
+            'Discovered resources could not be written to {p}: {e}'.format(
+                p=path, e=e))
+        path = None
+    runtime_properties[RESOURCES_ARTIFACT] = path
+    runtime_properties[RESOURCES] = get_compact_index(resources)
+
+
+def remove_resources(runtime_properties):
+    """Remove the stored index and artifact."""
+    path = runtime_properties.pop(RESOURCES_ARTIFACT, None)
+    if path and os.path.exists(path):
+        os.unlink(path)
+    runtime_properties.pop(RESOURCES, None)
@@ -0,0 +1,190 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Concurrent listing of discoverable resources"""
+
+import time
+from copy import deepcopy
+from threading import Lock, local
+from concurrent.futures import ThreadPoolExecutor
+
+from googleapiclient.errors import HttpError
+
+from .. import constants
+from . import registry
+
+# Zone of list calls which cover all locations of the project
+AGGREGATED = '-'
+
+
+class RateLimiter(object):
+    """Spaces the calls of `wait` to at most `rate` per second."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_call = 0
+        self.lock = Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.time()
+            delay = self.next_call - now
+            self.next_call = max(now, self.next_call) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class ResourceScanner(object):
+    """
+    List resources of several types in several locations with a bounded pool
+    of threads. Types with an aggregated function are listed for every
+    location with a single call instead of one call per location.
+
+    Resource objects are created once per thread and type, and reused for
+    every location the thread lists. They all share the credentials and the
+    discovery document of the process, see gcp.GoogleCloudApi.
+    """
+
+    def __init__(self, gcp_config, logger, types,
+                 max_workers=None, rate=None):
+        """
+        :param gcp_config: client configuration of the account node
+        :param logger: logger
+        :param types: resource type name: registry.DiscoveryType
+        :param max_workers: number of concurrent list calls
+        :param rate: maximum number of list requests per second, each page
+            of a list call is a request
+        """
+        self.gcp_config = gcp_config
+        self.logger = logger
+        self.types = types
+        self.max_workers = max_workers or constants.DISCOVERY_MAX_WORKERS
+        self.rate_limiter = RateLimiter(
+            rate or constants.DISCOVERY_REQUESTS_PER_SECOND)
+        self._local = local()
+
+    def get_interface(self, resource_type):
+        interfaces = getattr(self._local, 'interfaces', None)
+        if interfaces is None:
+            interfaces = self._local.interfaces = {}
+        if resource_type not in interfaces:
+            iface = self.types[resource_type].interface(
+                deepcopy(self.gcp_config), self.logger)
+            # Every page of a list call takes a token, not only the first
+            iface.before_request = self.rate_limiter.wait
+            interfaces[resource_type] = iface
+        return interfaces[resource_type]
+
+    def is_aggregated(self, resource_type):
+        discovery_type = self.types[resource_type]
+        # Global types are listed with a single call anyway
+        if discovery_type.scope == registry.GLOBAL:
+            return False
+        return discovery_type.aggregated is not None
+
+    def list(self, location, resource_type):
+        """
+        :return: list of the resources of the type in the location, or of
+        (location, resource) tuples of all locations for AGGREGATED location
+        """
+        discovery_type = self.types[resource_type]
+        iface = self.get_interface(resource_type)
+        if location == AGGREGATED:
+            self.logger.debug('Checking for {t} in all locations.'.format(
+                t=resource_type))
+            return list(discovery_type.aggregated(iface))
+        self.logger.debug('Checking for {t} in {l}.'.format(
+            t=resource_type, l=location))
+        return list(discovery_type.list_items(iface, location))
+
+    def _run(self, pool, tasks):
+        futures = [pool.submit(self.list, *task) for task in tasks]
+        results = []
+        for task, future in zip(tasks, futures):
+            try:
+                results.append((task, future.result(), None))
+            except HttpError as e:
+                results.append((task, None, e))
+        return results
+
+    def scan(self, zones, resource_types):
+        """
+        List every type in every location. Zonal types are listed in the
+        zones, regional types in the regions of the zones and global types
+        once. Types supporting it are listed for all locations at once.
+
+        :param zones: list of zone names
+        :param resource_types: list of names of registered types
+        :return: dictionary of location: resource type: resource id:
+        resource, in the order of zones, regions, global and resource_types
+        whatever order the calls finished in
+        """
+        regions = []
+        for zone in zones:
+            region = get_region_name(zone)
+            if region not in regions:
+                regions.append(region)
+        scope_locations = {
+            registry.ZONE: zones,
+            registry.REGION: regions,
+            registry.GLOBAL: [registry.GLOBAL],
+        }
+
+        found = {}
+        per_location = [t for t in resource_types
+                        if not self.is_aggregated(t)]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            aggregated = [(AGGREGATED, t) for t in resource_types
+                          if t not in per_location]
+            for (_, resource_type), result, error in self._run(
+                    pool, aggregated):
+                if error is not None:
+                    self.logger.warn(
+                        'Listing {t} in all locations failed, listing '
+                        'location by location instead: {e}'.format(
+                            t=resource_type, e=error))
+                    per_location.append(resource_type)
+                    continue
+                wanted = set(
+                    scope_locations[self.types[resource_type].scope])
+                for location, resource in result:
+                    if location in wanted:
+                        found.setdefault(
+                            (location, resource_type), []).append(resource)
+
+            tasks = [(location, resource_type)
+                     for resource_type in per_location
+                     for location in scope_locations[
+                         self.types[resource_type].scope]]
+            for task, result, error in self._run(pool, tasks):
+                if error is not None:
+                    raise error
+                found[task] = result
+
+        resources = {}
+        for location in zones + regions + [registry.GLOBAL]:
+            for resource_type in resource_types:
+                resource_key = self.types[resource_type].resource_key
+                for resource in found.get((location, resource_type), []):
+                    resources.setdefault(location, {}).setdefault(
+                        resource_type, {})[resource[resource_key]] = resource
+        return resources
+
+
+def get_region_name(zone):
+    """Get name of the region of the zone, e.g. us-east1 of us-east1-b"""
+    return zone.rsplit('-', 1)[0]
@@ -1,8 +1,8 @@
 from unittest import TestCase
-from mock import patch, call, MagicMock
+from mock import patch, call, MagicMock, ANY
 
 from ..._compat import PY2
-from .. import resources, discover
+from .. import resources, discover, results
 
 
 @patch('cloudify_gcp.gcp.ServiceAccountCredentials.from_json_keyfile_dict')
@@ -45,10 +45,11 @@ class GCPeWorkflowTests(TestCase):
     def test_discover_resources(self, mock_get_resources, *_):
         mock_ctx = MagicMock()
         node = MagicMock()
-        node_instance = MagicMock()
+        mock_ctx.deployment.id = 'dep'
+        node_instance = MagicMock(id='foo_1')
         node_instance._node_instance = MagicMock(
             runtime_properties={'resources': {}})
-        result = {'foo': 'bar'}
+        result = {'taco': {'bar': {'id': {'selfLink': 'link'}}}}
         mock_get_resources.return_value = result
         node_instances = [node_instance]
         node.instances = node_instances
@@ -61,6 +62,12 @@ class GCPeWorkflowTests(TestCase):
         }
         self.assertEqual(discover.discover_resources(**params), result)
 
+        runtime_properties = node_instance._node_instance.runtime_properties
+        self.assertEqual(
+            'link',
+            runtime_properties['resources']['taco']['bar']['id']['selfLink'])
+        self.assertEqual(result, results.load_resources(runtime_properties))
+
     @patch('cloudify_common_sdk.utils.get_rest_client')
     def test_deploy_resources(self, get_rest_client, *_):
         mock_rest_client = self.get_mock_rest_client()
@@ -87,6 +94,8 @@ class GCPeWorkflowTests(TestCase):
         mock_ctx = MagicMock()
         mock_ctx.deployment = MagicMock(id='foo')
         mock_ctx.blueprint = MagicMock(id='bar')
+        mock_ctx.get_node.return_value.instances = [
+            MagicMock(runtime_properties={})]
         params = {
             'node_id': 'foo',
             'resource_types': ['bar', 'baz'],
@@ -120,22 +129,58 @@ class GCPeWorkflowTests(TestCase):
                    'zone': 'region1'}],
                  [{'csys-env-type': 'environment'},
                   {'csys-obj-parent': 'foo'}],
-                 mock_ctx),
+                 mock_ctx, batch_size=None, max_workers=None,
+                 checkpoint=ANY),
             call('foo', 'foo', ['foo-resource3'], [
                 {'kubernetes_cluster_name': 'resource3', 'zone': 'region1'}],
                  [{'csys-env-type': 'environment'},
                   {'csys-obj-parent': 'foo'}],
-                 mock_ctx),
+                 mock_ctx, batch_size=None, max_workers=None,
+                 checkpoint=ANY),
             call('foo', 'foo', ['foo-resource4'],
                  [{'kubernetes_cluster_name': 'resource4',
                    'zone': 'region2'}],
                  [{'csys-env-type': 'environment'},
                   {'csys-obj-parent': 'foo'}],
-                 mock_ctx)]
+                 mock_ctx, batch_size=None, max_workers=None,
+                 checkpoint=ANY)]
         if PY2:
             return
         mock_deploy.assert_has_calls(expected_calls)
 
+    @patch('cloudify_common_sdk.utils.get_rest_client')
+    @patch('cloudify_gcp.workflows.discover.deploy_resources')
+    @patch('cloudify_gcp.workflows.discover.discover_resources')
+    def test_discover_and_deploy_subscriptions(
+            self, mock_discover, mock_deploy, *_):
+        mock_ctx = MagicMock()
+        mock_ctx.deployment = MagicMock(id='foo')
+        mock_ctx.get_node.return_value.instances = [
+            MagicMock(runtime_properties={})]
+        mock_discover.return_value = {
+            'global': {
+                'projects.subscriptions': {
+                    'projects/proj/subscriptions/sub.one': {},
+                },
+            },
+        }
+
+        discover.discover_and_deploy(
+            node_id='foo', blueprint_id='bar', ctx=mock_ctx)
+
+        mock_deploy.assert_called_once_with(
+            'foo', 'bar', ['foo-sub.one'],
+            [{'subscription_name': 'sub.one'}],
+            [{'csys-env-type': 'environment'},
+             {'csys-obj-parent': 'foo'}],
+            mock_ctx, batch_size=None, max_workers=None, checkpoint=ANY)
+
+    def test_generate_deployment_ids(self, *_):
+        self.assertEqual(
+            'dep-projects-p-subscriptions-s',
+            discover.generate_deployment_ids(
+                'dep', 'projects/p/subscriptions/s'))
+
     @patch('cloudify_gcp.container_engine.cluster')
     def test_get_resources(self, *_):
         mock_ctx = MagicMock()
@@ -175,7 +220,9 @@ class GCPeWorkflowTests(TestCase):
                 }
             }
         )
-        mock_ctx.instance = MagicMock(runtime_properties={'resources': {}})
+        mock_ctx.deployment.id = 'dep'
+        mock_ctx.instance = MagicMock(id='foo_1',
+                                      runtime_properties={'resources': {}})
         params = {
             'resource_config': {'resource_types': [
                 'projects.zones.clusters']},
@@ -186,3 +233,164 @@ class GCPeWorkflowTests(TestCase):
         resources.initialize(**params)
         self.assertIn('resources',
                       mock_ctx.instance.runtime_properties)
+
+    def test_get_zones(self, mock_build, *_):
+        zones = mock_build.return_value.zones.return_value
+        zones.list.return_value.execute.return_value = {'items': [
+            {'name': 'us-east1-b', 'region': 'r/us-east1', 'status': 'UP'},
+            {'name': 'us-east1-c', 'region': 'r/us-east1', 'status': 'UP'},
+            {'name': 'us-west1-a', 'region': 'r/us-west1', 'status': 'UP'},
+            {'name': 'us-west1-b', 'region': 'r/us-west1', 'status': 'DOWN'},
+            {'name': 'eu-west1-a', 'region': 'r/eu-west1', 'status': 'UP'},
+        ]}
+        zones.list_next.return_value = None
+        node = MagicMock(
+            properties={
+                'client_config': {
+                    'auth': {'foo': 'bar'},
+                    'project': 'foo',
+                    'zone': 'bar'
+                },
+                'resource_config': {
+                    'zones_include': ['us-*'],
+                    'zones_exclude': ['*-c'],
+                },
+            }
+        )
+
+        self.assertEqual(
+            ['us-east1-b', 'us-west1-a'],
+            resources.get_zones(node, MagicMock()))
+        self.assertEqual(
+            ['eu-west1-a', 'us-west1-a'],
+            resources.get_zones(node, MagicMock(),
+                                include=['eu-*', 'us-west1-*']))
+        zones.list.assert_called_once_with(project='foo')
+
+    def test_get_new_resources(self, *_):
+        resources = {
+            'zone1': {
+                'type1': {
+                    'old': {'selfLink': 'old', 'etag': '1'},
+                    'changed': {'selfLink': 'changed', 'etag': '3'},
+                    'new': {'selfLink': 'new', 'etag': '1'},
+                },
+            },
+        }
+        previous_index = {
+            'zone1/type1/old': discover.get_fingerprint(
+                {'selfLink': 'old', 'etag': '1'}),
+            'zone1/type1/changed': discover.get_fingerprint(
+                {'selfLink': 'changed', 'etag': '2'}),
+            'zone2/type1/removed': 'abc',
+        }
+
+        new_resources, index = discover.get_new_resources(
+            previous_index, resources, MagicMock())
+
+        self.assertEqual(
+            {'zone1': {'type1': {'new': {'selfLink': 'new', 'etag': '1'}}}},
+            new_resources)
+        self.assertEqual(
+            (['zone1/type1/new'], ['zone2/type1/removed'],
+             ['zone1/type1/changed']),
+            discover.compare_indexes(previous_index, index))
+
+    def test_get_fingerprint_instance(self, *_):
+        # Instances have no etag nor update time
+        vm = {'selfLink': 'vm', 'status': 'RUNNING',
+              'labelFingerprint': '1', 'lastStartTimestamp': '1'}
+        fingerprint = discover.get_fingerprint(vm)
+
+        self.assertEqual(fingerprint, discover.get_fingerprint(
+            dict(vm, lastStartTimestamp='2')))
+        self.assertNotEqual(fingerprint, discover.get_fingerprint(
+            dict(vm, status='TERMINATED')))
+        self.assertNotEqual(fingerprint, discover.get_fingerprint(
+            dict(vm, labelFingerprint='2')))
+
+    @patch('cloudify_gcp.workflows.discover.install_deployments')
+    @patch('cloudify_gcp.workflows.discover.store_runtime_properties')
+    @patch('cloudify_gcp.workflows.discover.deploy_resources')
+    @patch('cloudify_gcp.workflows.discover.discover_resources')
+    def test_discover_and_deploy_incremental(
+            self, mock_discover, mock_deploy, mock_store, *_):
+        mock_ctx = MagicMock()
+        mock_ctx.deployment = MagicMock(id='foo')
+        node_instance = MagicMock(id='account')
+        node_instance.runtime_properties = {
+            discover.RESOURCES_INDEX: {
+                'region1/type1/resource1': discover.get_fingerprint(
+                    {'selfLink': 'resource1'}),
+            },
+        }
+        mock_ctx.get_node.return_value.instances = [node_instance]
+        mock_discover.return_value = {
+            'region1': {
+                'type1': {
+                    'resource1': {'selfLink': 'resource1'},
+                    'resource2': {'selfLink': 'resource2'},
+                },
+            },
+        }
+
+        discover.discover_and_deploy(
+            node_id='foo', blueprint_id='bar', incremental=True,
+            ctx=mock_ctx)
+
+        mock_deploy.assert_called_once_with(
+            'foo', 'bar', ['foo-resource2'],
+            [{'kubernetes_cluster_name': 'resource2', 'zone': 'region1'}],
+            [{'csys-env-type': 'environment'},
+             {'csys-obj-parent': 'foo'}],
+            mock_ctx, batch_size=None, max_workers=None, checkpoint=ANY)
+        mock_store.assert_called_once_with('account', {
+            discover.RESOURCES_INDEX: discover.get_resources_index(
+                mock_discover.return_value)})
+
+    @patch('cloudify_common_sdk.utils.get_rest_client')
+    @patch('cloudify_gcp.workflows.discover.store_runtime_properties')
+    @patch('cloudify_gcp.workflows.discover.create_deployments')
+    def test_deploy_resources_chunks(self, mock_create, mock_store,
+                                     get_rest_client, *_):
+        mock_ctx = MagicMock()
+        # dep5 was created although its request failed
+        get_rest_client.return_value.deployments.list.return_value = [
+            MagicMock(id='dep5')]
+        checkpoint = discover.DeploymentsCheckpoint(MagicMock(
+            id='account',
+            runtime_properties={
+                discover.CREATED_DEPLOYMENTS: ['dep0', 'dep1']}))
+
+        def create(group_id, blueprint_id, deployment_ids, inputs, labels):
+            if 'dep4' in deployment_ids:
+                raise RuntimeError('no more deployments')
+        mock_create.side_effect = create
+
+        with self.assertRaises(RuntimeError):
+            discover.deploy_resources(
+                'group', 'blueprint',
+                ['dep{0}'.format(i) for i in range(6)],
+                [{'i': i} for i in range(6)],
+                [{'label': 'value'}],
+                mock_ctx,
+                batch_size=2,
+                max_workers=2,
+                checkpoint=checkpoint)
+
+        self.assertEqual(
+            [call('group', 'blueprint', ['dep2', 'dep3'],
+                  [{'i': 2}, {'i': 3}], [{'label': 'value'}]),
+             call('group', 'blueprint', ['dep4', 'dep5'],
+                  [{'i': 4}, {'i': 5}], [{'label': 'value'}])],
+            sorted(mock_create.call_args_list, key=str))
+        # The created deployments are recorded, the others will be retried
+        self.assertIn('dep3', checkpoint)
+        self.assertNotIn('dep4', checkpoint)
+        self.assertIn('dep5', checkpoint)
+        get_rest_client().deployments.list.assert_called_once_with(
+            _group_id='group', id=['dep4', 'dep5'], _include=['id'], _size=2)
+        mock_store.assert_called_with(
+            'account',
+            {discover.CREATED_DEPLOYMENTS: [
+                'dep0', 'dep1', 'dep2', 'dep3', 'dep5']})
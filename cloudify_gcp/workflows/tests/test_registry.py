@@ -0,0 +1,91 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from mock import MagicMock
+
+from cloudify_gcp.pagination import iter_items
+from cloudify_gcp.workflows import registry
+
+
+class TestRegistry(unittest.TestCase):
+
+    def setUp(self):
+        super(TestRegistry, self).setUp()
+        self.iface = MagicMock(project='proj')
+        self.iface.paginate.side_effect = iter_items
+
+    def test_registered_types(self):
+        for name in ('projects.zones.clusters',
+                     'projects.zones.instances',
+                     'projects.zones.disks',
+                     'projects.global.networks',
+                     'projects.regions.subnetworks',
+                     'storage.buckets',
+                     'projects.subscriptions'):
+            self.assertEqual(name, registry.TYPES[name].name)
+
+    def test_compute_list(self):
+        instances = self.iface.discovery.instances.return_value
+        instances.list.return_value.execute.return_value = {
+            'items': [{'name': 'vm'}]}
+        instances.list_next.return_value = None
+
+        self.assertEqual(
+            [{'name': 'vm'}],
+            list(registry.TYPES['projects.zones.instances'].list_items(
+                self.iface, 'us-east1-b')))
+        instances.list.assert_called_once_with(
+            project='proj', zone='us-east1-b')
+
+    def test_compute_aggregated(self):
+        disks = self.iface.discovery.disks.return_value
+        first, second = MagicMock(), MagicMock()
+        first.execute.return_value = {'items': {
+            'zones/us-east1-b': {'disks': [{'name': 'one'}]},
+            'zones/us-east1-c': {'warning': {'code': 'NO_RESULTS_ON_PAGE'}},
+        }}
+        second.execute.return_value = {'items': {
+            'zones/us-west1-a': {'disks': [{'name': 'two'}]},
+        }}
+        disks.aggregatedList.return_value = first
+        disks.aggregatedList_next.side_effect = [second, None]
+
+        self.assertEqual(
+            [('us-east1-b', {'name': 'one'}), ('us-west1-a', {'name': 'two'})],
+            registry.TYPES['projects.zones.disks'].aggregated(self.iface))
+        disks.aggregatedList.assert_called_once_with(project='proj')
+
+    def test_list_subscriptions(self):
+        subscriptions = self.iface.discovery_pubsub.subscriptions()
+        subscriptions.list.return_value.execute.return_value = {
+            'subscriptions': [{'name': 'projects/proj/subscriptions/s'}]}
+        subscriptions.list_next.return_value = None
+
+        self.assertEqual(
+            [{'name': 'projects/proj/subscriptions/s'}],
+            list(registry.TYPES['projects.subscriptions'].list_items(
+                self.iface, registry.GLOBAL)))
+        subscriptions.list.assert_called_once_with(project='projects/proj')
+
+    def test_register(self):
+        discovery_type = registry.register(registry.DiscoveryType(
+            'test.things', MagicMock(), 'test', registry.GLOBAL,
+            MagicMock()))
+        try:
+            self.assertIs(discovery_type, registry.TYPES['test.things'])
+        finally:
+            del registry.TYPES['test.things']
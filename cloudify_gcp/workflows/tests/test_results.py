@@ -0,0 +1,79 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import unittest
+
+from mock import MagicMock, patch
+
+from cloudify_gcp.workflows import results
+
+RESOURCES = {
+    'us-east1-b': {
+        'projects.zones.clusters': {
+            'one': {'name': 'one', 'selfLink': 'link/one', 'big': 'x' * 100},
+            'two': {'name': 'two', 'selfLink': 'link/two'},
+        },
+    },
+    'global': {
+        'projects.global.networks': {
+            'default': {'name': 'default', 'selfLink': 'link/default'},
+        },
+    },
+}
+
+
+class TestResults(unittest.TestCase):
+
+    def test_store_and_load(self):
+        runtime_properties = {}
+
+        results.store_resources(
+            runtime_properties, RESOURCES, 'dep', 'gcp_1', MagicMock())
+
+        path = runtime_properties[results.RESOURCES_ARTIFACT]
+        self.assertTrue(path.endswith(os.path.join('dep', 'gcp_1.jsonl')))
+        entry = runtime_properties[results.RESOURCES][
+            'us-east1-b']['projects.zones.clusters']['one']
+        self.assertEqual(
+            ['hash', 'id', 'selfLink', 'type', 'zone'], sorted(entry))
+        self.assertEqual('link/one', entry['selfLink'])
+        self.assertNotIn('big', str(runtime_properties[results.RESOURCES]))
+
+        self.assertEqual(RESOURCES,
+                         results.load_resources(runtime_properties))
+        self.assertEqual(
+            {'us-east1-b': {'projects.zones.clusters': {
+                'two': RESOURCES['us-east1-b'][
+                    'projects.zones.clusters']['two']}}},
+            results.load_resources(runtime_properties, resource_id='two'))
+
+        results.remove_resources(runtime_properties)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual({}, runtime_properties)
+
+    def test_store_not_writable(self):
+        runtime_properties = {}
+        logger = MagicMock()
+
+        with patch('cloudify_gcp.workflows.results.write_lines_atomic',
+                   side_effect=OSError('read only')):
+            results.store_resources(
+                runtime_properties, RESOURCES, 'dep', 'gcp_1', logger)
+
+        self.assertIsNone(runtime_properties[results.RESOURCES_ARTIFACT])
+        self.assertIn('us-east1-b', runtime_properties[results.RESOURCES])
+        logger.warn.assert_called_once()
+        self.assertEqual({}, results.load_resources(runtime_properties))
@@ -0,0 +1,168 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import threading
+import unittest
+
+from mock import MagicMock, patch
+from googleapiclient.errors import HttpError
+
+from cloudify_gcp.workflows import registry, scanner
+
+
+def list_fake(iface, location):
+    iface.zone = location
+    return iface.list()
+
+
+class FakeResource(object):
+    instances = []
+    lock = threading.Lock()
+
+    def __init__(self, config, logger, name):
+        self.zone = config['zone']
+        with self.lock:
+            self.instances.append(self)
+
+    def list(self):
+        # Let the zones finish out of order
+        time.sleep(0.01 * (len(self.zone) % 3))
+        if self.zone == 'broken':
+            raise ValueError('broken zone')
+        return [{'name': '{0}-{1}'.format(self.zone, i)} for i in range(2)]
+
+
+class FakeAggregatedResource(FakeResource):
+    aggregated_calls = 0
+    aggregated_error = False
+
+    def aggregated_list(self):
+        FakeAggregatedResource.aggregated_calls += 1
+        if self.aggregated_error:
+            raise HttpError(MagicMock(status=403), b'')
+        return [('zone-b', {'name': 'b'}),
+                ('zone-a', {'name': 'a'}),
+                ('zone-x', {'name': 'x'})]
+
+
+class FakePagedResource(FakeResource):
+
+    def list(self):
+        # One request per page
+        for _ in range(3):
+            self.before_request()
+        return [{'name': self.zone}]
+
+
+class TestResourceScanner(unittest.TestCase):
+
+    def setUp(self):
+        super(TestResourceScanner, self).setUp()
+        FakeResource.instances = []
+        FakeAggregatedResource.aggregated_calls = 0
+        FakeAggregatedResource.aggregated_error = False
+        self.scanner = scanner.ResourceScanner(
+            {'zone': 'default'}, MagicMock(),
+            {
+                'fake': registry.DiscoveryType(
+                    'fake', FakeResource, 'fake', registry.ZONE, list_fake),
+                'aggregated': registry.DiscoveryType(
+                    'aggregated', FakeAggregatedResource, 'fake',
+                    registry.ZONE, list_fake,
+                    aggregated=FakeAggregatedResource.aggregated_list),
+                'regional': registry.DiscoveryType(
+                    'regional', FakeResource, 'fake', registry.REGION,
+                    list_fake),
+                'global': registry.DiscoveryType(
+                    'global', FakeAggregatedResource, 'fake',
+                    registry.GLOBAL, list_fake,
+                    aggregated=FakeAggregatedResource.aggregated_list),
+                'paged': registry.DiscoveryType(
+                    'paged', FakePagedResource, 'fake', registry.ZONE,
+                    list_fake),
+            },
+            max_workers=3, rate=1000)
+
+    def test_scan(self):
+        zones = ['z', 'zone-b', 'zo', 'zone-d', 'zon', 'zone-f']
+
+        resources = self.scanner.scan(zones, ['fake'])
+
+        self.assertEqual(zones, list(resources))
+        self.assertEqual(
+            {'zone-b': {
+                'zone-b-0': {'name': 'zone-b-0'},
+                'zone-b-1': {'name': 'zone-b-1'},
+            }},
+            {'zone-b': resources['zone-b']['fake']})
+        # One resource object per worker thread, not per zone
+        self.assertLessEqual(len(FakeResource.instances), 3)
+
+    def test_scan_error(self):
+        with self.assertRaises(ValueError):
+            self.scanner.scan(['zone-a', 'broken'], ['fake'])
+
+    def test_scan_aggregated(self):
+        resources = self.scanner.scan(['zone-a', 'zone-b'], ['aggregated'])
+
+        self.assertEqual(1, FakeAggregatedResource.aggregated_calls)
+        self.assertEqual({
+            'zone-a': {'aggregated': {'a': {'name': 'a'}}},
+            'zone-b': {'aggregated': {'b': {'name': 'b'}}},
+        }, resources)
+        self.assertEqual(['zone-a', 'zone-b'], list(resources))
+
+    def test_scan_aggregated_fallback(self):
+        FakeAggregatedResource.aggregated_error = True
+
+        resources = self.scanner.scan(['zone-a', 'zone-b'], ['aggregated'])
+
+        self.assertEqual(
+            ['zone-a-0', 'zone-a-1'],
+            sorted(resources['zone-a']['aggregated']))
+        self.assertIn('zone-b', resources)
+
+    def test_scan_scopes(self):
+        resources = self.scanner.scan(
+            ['us-east1-b', 'us-east1-c', 'us-west1-a'],
+            ['regional', 'global', 'fake'])
+
+        self.assertEqual(
+            ['us-east1-b', 'us-east1-c', 'us-west1-a',
+             'us-east1', 'us-west1', 'global'],
+            list(resources))
+        self.assertEqual(['us-east1-0', 'us-east1-1'],
+                         sorted(resources['us-east1']['regional']))
+        self.assertEqual(['global-0', 'global-1'],
+                         sorted(resources['global']['global']))
+        # Global types are listed once even with an aggregated function
+        self.assertEqual(0, FakeAggregatedResource.aggregated_calls)
+
+    def test_scan_rate_limit_pages(self):
+        with patch.object(self.scanner.rate_limiter, 'wait') as mock_wait:
+            self.scanner.scan(['zone-a', 'zone-b'], ['paged'])
+
+        self.assertEqual(6, mock_wait.call_count)
+
+    def test_rate_limiter(self):
+        limiter = scanner.RateLimiter(10)
+        with patch('cloudify_gcp.workflows.scanner.time') as mock_time:
+            mock_time.time.return_value = 100
+            for _ in range(3):
+                limiter.wait()
+        self.assertEqual(
+            [0.1, 0.2],
+            [round(c[0][0], 3) for c in mock_time.sleep.call_args_list])